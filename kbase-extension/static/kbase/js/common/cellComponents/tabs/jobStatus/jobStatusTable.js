@@ -661,7 +661,9 @@ define([
                         : { jobIdList: paramsRequired };
                 this.jobManager.bus.emit('request-job-info', jobInfoRequestParams);
             }
-            this.jobManager.bus.emit('request-job-status', { batchId });
+            // a batch summary, with the states of the batch and (as there's no `since`) all
+            // of its children
+            this.jobManager.bus.emit('request-job-status-summary', { batchId });
         }
 
         // HANDLERS
@@ -64,18 +64,24 @@ define([
             CANCEL: 'cancel_job',
             INFO: 'job_info',
             LOGS: 'job_logs',
+            LOGS_FOLLOW: 'job_logs_follow',
+            LOGS_FOLLOW_STOP: 'stop_job_logs_follow',
             RETRY: 'retry_job',
             STATUS: 'job_status',
+            STATUS_SUMMARY: 'job_status_batch_summary',
             START_UPDATE: 'start_job_update',
             STOP_UPDATE: 'stop_job_update',
         },
         BACKEND_RESPONSES = {
+            BATCH: 'job_comm_batch',
+            COMPRESSED: 'job_comm_compressed',
             INFO: JOB_REQUESTS.INFO,
             LOGS: JOB_REQUESTS.LOGS,
             RESULT: RESULT,
             RETRY: 'jobs_retried',
             RUN_STATUS: 'run_status',
             STATUS: JOB_REQUESTS.STATUS,
+            STATUS_SUMMARY: JOB_REQUESTS.STATUS_SUMMARY,
         },
         RESPONSES = {
             CELL_JOB_STATUS: 'cell-job-status',
@@ -86,6 +92,7 @@ define([
             RETRY: 'job-retry-response',
             RUN_STATUS: 'run-status',
             STATUS: 'job-status',
+            STATUS_SUMMARY: 'job-status-summary',
         },
         // these job request types also have a 'batch' version
         batchRequests = ['INFO', 'STATUS', 'START_UPDATE', 'STOP_UPDATE'],
@@ -109,12 +116,23 @@ define([
         // Fetches job logs from kernel.
         'request-job-log': JOB_REQUESTS.LOGS,
 
+        // Has the kernel send new job log lines as they come in, until the job is done.
+        // They arrive as job logs responses with 'following' set to true.
+        'request-job-log-follow-start': JOB_REQUESTS.LOGS_FOLLOW,
+        // Tells the kernel to stop sending new job log lines.
+        'request-job-log-follow-stop': JOB_REQUESTS.LOGS_FOLLOW_STOP,
+
         // retries the job
         'request-job-retry': JOB_REQUESTS.RETRY,
 
         // Fetches job status from kernel.
         'request-job-status': JOB_REQUESTS.STATUS,
 
+        // Fetches a summary of a batch job's children (status counts, times), plus the
+        // states of the batch parent and of its children. With `since` set to the `seq` of an
+        // earlier summary, only the children that changed after that one are sent.
+        'request-job-status-summary': JOB_REQUESTS.STATUS_SUMMARY,
+
         // Requests job status updates for this job via the job channel, and also
         // ensures that job polling is running.
         'request-job-updates-start': JOB_REQUESTS.START_UPDATE,
@@ -150,6 +168,10 @@ define([
                   };
 
             this.messageQueue = [];
+            // compressed messages are decoded asynchronously; the messages that arrive while
+            // that happens are queued up behind them so they're handled in order
+            this.decodeQueue = null;
+            this.drainingDecodeQueue = false;
             this.ERROR_COMM_CHANNEL_NOT_INIT = 'Comm channel not initialized, not sending message.';
         }
 
@@ -310,7 +332,8 @@ define([
          *   }
          * }
          * Where msg_type is one of:
-         * start, new_job, job_status, job_status_all, job_comm_err, job_init_err, job_init_lookup_err,
+         * start, new_job, job_status, job_status_all, job_status_delta, job_comm_err, job_init_err,
+         * job_init_lookup_err,
          * or any of the values of BACKEND_RESPONSES
          *
          * @param {object} msg
@@ -319,11 +342,25 @@ define([
             const msgType = msg.content.data.msg_type;
             const msgData = msg.content.data.content;
             let msgTypeToSend = null;
+            if (
+                !this.drainingDecodeQueue &&
+                (msgType === BACKEND_RESPONSES.COMPRESSED || this.decodeQueue)
+            ) {
+                this.queueCommMessage(msg);
+                return;
+            }
             this.debug(`received ${msgType} from backend`);
             switch (msgType) {
                 case 'start':
                     break;
 
+                // several messages sent together
+                case BACKEND_RESPONSES.BATCH:
+                    msgData.messages.forEach((data) => {
+                        this.handleCommMessages({ content: { data } });
+                    });
+                    break;
+
                 case 'new_job':
                     Jupyter.notebook.save_checkpoint();
                     break;
@@ -419,12 +456,15 @@ define([
                 /*
                  * The job status for one or more jobs.
                  * The job_status_all message covers all active jobs.
+                 * The job_status_delta message covers the jobs being listened to
+                 * whose status changed since the last update.
                  *
                  * data structure: object with key jobId and value
                  * { jobState: job.state, outputWidgetInfo: job.widget_info }
                  */
                 case BACKEND_RESPONSES.STATUS:
                 case 'job_status_all':
+                case 'job_status_delta':
                     Object.keys(msgData).forEach((_jobId) => {
                         // check whether or not this is an ee2 error
                         if (msgData[_jobId].state.status === 'ee2_error') {
@@ -448,6 +488,28 @@ define([
                     });
                     break;
 
+                /*
+                 * A batch job summary, with the states of the batch parent and of the
+                 * children that changed since the summary requested (all of them if none was).
+                 *
+                 * data structure: { batch_id, summary, job_states }, where job_states
+                 * is as for job_status
+                 */
+                case BACKEND_RESPONSES.STATUS_SUMMARY:
+                    Object.keys(msgData.job_states).forEach((_jobId) => {
+                        this.sendBusMessage(
+                            JOB,
+                            _jobId,
+                            RESPONSES.STATUS,
+                            this.convertJobState(msgData.job_states[_jobId])
+                        );
+                    });
+                    this.sendBusMessage(JOB, msgData.batch_id, RESPONSES.STATUS_SUMMARY, {
+                        jobId: msgData.batch_id,
+                        summary: msgData.summary,
+                    });
+                    break;
+
                 default:
                     console.warn(
                         `Unhandled KBaseJobs message from kernel (type='${msgType}'):`,
@@ -456,6 +518,83 @@ define([
             }
         }
 
+        /**
+         * Adds a message to the queue of messages waiting on compressed messages to be decoded.
+         * Once decoded, each message is handled as usual.
+         * @param {object} msg
+         */
+        queueCommMessage(msg) {
+            const queued = (this.decodeQueue || Promise.resolve())
+                .then(() => {
+                    const data = msg.content.data;
+                    if (data.msg_type === BACKEND_RESPONSES.COMPRESSED) {
+                        return this.decodeCommMessage(data.content);
+                    }
+                    return data;
+                })
+                .then((data) => {
+                    if (this.decodeQueue === queued) {
+                        this.decodeQueue = null;
+                    }
+                    this.drainingDecodeQueue = true;
+                    try {
+                        this.handleCommMessages({ content: { data } });
+                    } finally {
+                        this.drainingDecodeQueue = false;
+                    }
+                })
+                .catch((err) => {
+                    console.error('Unable to handle KBaseJobs message', err, msg);
+                });
+            this.decodeQueue = queued;
+            return queued;
+        }
+
+        /**
+         * Decodes the content of a compressed message, which has the zlib-compressed,
+         * base64-encoded JSON of the original message.
+         * @param {object} content - with keys encoding and data
+         * @returns {Promise} resolves to the original message, with keys msg_type and content
+         */
+        decodeCommMessage(content) {
+            if (content.encoding !== 'zlib+base64') {
+                throw new Error(`Unknown message encoding '${content.encoding}'`);
+            }
+            const bytes = Uint8Array.from(atob(content.data), (c) => c.charCodeAt(0));
+            const stream = new Blob([bytes])
+                .stream()
+                .pipeThrough(new DecompressionStream('deflate'));
+            return new Response(stream).json();
+        }
+
+        /**
+         * The ways of sending messages that the kernel can use, beyond plain messages.
+         * Messages can always be sent together; they can only be compressed if the browser
+         * can decompress them.
+         * @returns {Array} list of capability names
+         */
+        getCommCapabilities() {
+            const capabilities = ['coalesce'];
+            if (typeof DecompressionStream !== 'undefined') {
+                capabilities.push('zlib');
+            }
+            return capabilities;
+        }
+
+        /**
+         * How the kernel should handle job requests and status updates for this front end.
+         * Requests are handled off the kernel's shell thread ('async'), and the status
+         * loop only sends the jobs that cells are listening to, when they change ('delta').
+         * Cells fetch the states of other jobs with job_status requests as needed.
+         * @returns {Object} with keys requestMode and statusLoopMode
+         */
+        getJobCommModes() {
+            return {
+                requestMode: 'async',
+                statusLoopMode: 'delta',
+            };
+        }
+
         displayJobError(msgData) {
             // code, error, job_id (opt), message, name, source
             const $modalBody = $(Handlebars.compile(JobInitErrorTemplate)(msgData));
@@ -604,11 +743,14 @@ define([
                 })
                 .filter((cellId) => !!cellId);
 
+            const modes = this.getJobCommModes();
             return [
                 'from biokbase.narrative.jobs.jobcomm import JobComm',
                 'cell_list = ' + JSON.stringify(currentCells),
+                `JobComm().set_comm_capabilities(${JSON.stringify(this.getCommCapabilities())})`,
+                `JobComm().set_request_mode("${modes.requestMode}")`,
                 // DATAUP-575: temporarily removing cell_list
-                'JobComm().start_job_status_loop(init_jobs=True)',
+                `JobComm().start_job_status_loop(init_jobs=True, mode="${modes.statusLoopMode}")`,
             ].join('\n');
         }
     }
@@ -21,7 +21,9 @@ try:
     from urllib.parse import urlparse as _urlparse  # py3
 except ImportError:
     from urlparse import urlparse as _urlparse  # py2
-import time
+# the HTTP plumbing shared by the KBase clients: sessions, JSON codecs, compression
+# and job polling
+from biokbase.narrative.common import service_http as _service_http
 
 _CT = "content-type"
 _AJ = "application/json"
@@ -158,6 +160,13 @@ class BaseClient(object):
         self.timeout = int(timeout)
         self._headers = dict()
         self.trust_all_ssl_certificates = trust_all_ssl_certificates
+        # if set, calls go through this requests.Session, to reuse connections
+        self.session = None
+        self.json_codec = _service_http.DEFAULT_JSON_CODEC
+        # request bodies at least this many bytes long are gzipped, for services that
+        # take them. None turns compression off.
+        self.compress_min_bytes = None
+        self.wire_stats = _service_http.WireStats()
         self.lookup_url = lookup_url
         self.async_job_check_time = async_job_check_time_ms / 1000.0
         self.async_job_check_time_scale_percent = async_job_check_time_scale_percent
@@ -196,18 +205,16 @@ class BaseClient(object):
                 raise ValueError("context is not type dict as required.")
             arg_hash["context"] = context
 
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(
-            url,
-            data=body,
-            headers=self._headers,
-            timeout=self.timeout,
-            verify=not self.trust_all_ssl_certificates,
-        )
+        body = self.json_codec.dumps(arg_hash)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        ret = self._post(url, body)
         ret.encoding = "utf-8"
+        # decode from the response bytes, rather than from ret.text or with
+        # ret.json(), which both build a str of the whole body first
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
-                err = ret.json()
+                err = self.json_codec.loads(ret.content)
                 if "error" in err:
                     raise ServerError(**err["error"])
                 else:
@@ -216,7 +223,7 @@ class BaseClient(object):
                 raise ServerError("Unknown", 0, ret.text)
         if not ret.ok:
             ret.raise_for_status()
-        resp = ret.json()
+        resp = self.json_codec.loads(ret.content)
         if "result" not in resp:
             raise ServerError("Unknown", 0, "An unknown server error occurred")
         if not resp["result"]:
@@ -225,6 +232,9 @@ class BaseClient(object):
             return resp["result"][0]
         return resp["result"]
 
+    def _post(self, url, body):
+        return _service_http.post(self, url, body)
+
     def _get_service_url(self, service_method, service_version):
         if not self.lookup_url:
             return self.url
@@ -246,6 +256,13 @@ class BaseClient(object):
     def _check_job(self, service, job_id):
         return self._call(self.url, service + "._check_job", [job_id])
 
+    def _next_job_check_time(self, check_time):
+        """
+        Returns how long to wait before the next check of a job, after waiting check_time.
+        """
+        check_time = check_time * self.async_job_check_time_scale_percent / 100.0
+        return min(check_time, self.async_job_check_max_time)
+
     def _submit_job(self, service_method, args, service_ver=None, context=None):
         context = self._set_up_context(service_ver, context)
         mod, meth = service_method.split(".")
@@ -262,23 +279,28 @@ class BaseClient(object):
             or dev/beta/release.
         context - the rpc context dict.
         """
+        return self.submit_job(service_method, args, service_ver, context).result()
+
+    def submit_job(self, service_method, args, service_ver=None, context=None):
+        """
+        Run a SDK method asynchronously, without waiting for it to finish.
+        Takes the same arguments as run_job.
+        Returns a concurrent.futures.Future that resolves to the method's
+        result, or its error, when the job finishes. All the jobs submitted
+        this way are checked on one shared thread.
+        """
         mod, _ = service_method.split(".")
         job_id = self._submit_job(service_method, args, service_ver, context)
-        async_job_check_time = self.async_job_check_time
-        while True:
-            time.sleep(async_job_check_time)
-            async_job_check_time = (
-                async_job_check_time * self.async_job_check_time_scale_percent / 100.0
-            )
-            if async_job_check_time > self.async_job_check_max_time:
-                async_job_check_time = self.async_job_check_max_time
-            job_state = self._check_job(mod, job_id)
-            if job_state["finished"]:
-                if not job_state["result"]:
-                    return
-                if len(job_state["result"]) == 1:
-                    return job_state["result"][0]
-                return job_state["result"]
+        return _service_http.job_poller.add(self, mod, job_id)
+
+    async def run_job_async(self, service_method, args, service_ver=None, context=None):
+        """
+        Run a SDK method asynchronously, and await its result from asyncio code.
+        Takes the same arguments as run_job.
+        """
+        return await _service_http.wait_for_job(
+            self.submit_job, service_method, args, service_ver, context
+        )
 
     def call_method(self, service_method, args, service_ver=None, context=None):
         """
@@ -294,3 +316,25 @@ class BaseClient(object):
         url = self._get_service_url(service_method, service_ver)
         context = self._set_up_context(service_ver, context)
         return self._call(url, service_method, args, context)
+
+    def call_many(self, calls, service_ver=None, context=None, max_workers=None):
+        """
+        Call several methods of a standard or dynamic service concurrently.
+        Required arguments:
+        calls - a list of (service_method, args) pairs, e.g.
+            [("myserv.mymeth", [params1]), ("myserv.mymeth", [params2])].
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        max_workers - the most calls to make at once. Default 8.
+        Returns a list of the results, in the same order as the calls. If a
+        call fails, its place in the list holds the exception it raised.
+        """
+
+        def call(service_method, args):
+            return self.call_method(
+                service_method, args, service_ver, dict(context or {}) or None
+            )
+
+        return _service_http.call_many(call, calls, max_workers)
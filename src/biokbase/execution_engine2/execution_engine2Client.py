@@ -1682,3 +1682,16 @@ class execution_engine2(object):
         return self._client.call_method(
             "execution_engine2.get_client_groups", [], self._service_ver, context
         )
+
+    def call_many(self, calls, context=None, max_workers=None):
+        """
+        Calls several methods concurrently.
+        :param calls: list of (method, args) pairs, e.g.
+           [("execution_engine2.status", [])]
+        :param max_workers: the most calls to make at once
+        :returns: list of the results, in the same order as the calls. If
+           a call fails, its place holds the exception it raised.
+        """
+        return self._client.call_many(
+            calls, self._service_ver, context, max_workers=max_workers
+        )
@@ -1,43 +1,169 @@
-from biokbase.workspace.client import Workspace
-from biokbase.narrative_method_store.client import NarrativeMethodStore
-from biokbase.userandjobstate.client import UserAndJobState
-from biokbase.catalog.Client import Catalog
-from biokbase.service.Client import Client as ServiceClient
-from biokbase.execution_engine2.execution_engine2Client import execution_engine2
+import os
+import threading
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
 from biokbase.narrative.common.url_config import URLS
 
+if TYPE_CHECKING:
+    import requests
+
+# The client modules, and requests, are slow to import, and not every kernel uses every
+# client, so they're imported when a client is first made.
+
+# Connection pool settings for the shared sessions, see configure_sessions.
+# pool_connections is the number of hosts to keep pools for, pool_maxsize the number of
+# connections kept open to each one.
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+KEEP_ALIVE = True
+# Request bodies at least this many bytes long, e.g. Narrative saves, are gzipped for the
+# services that take them. None turns compression off.
+COMPRESS_MIN_BYTES = 1024 * 1024
+
+# keys = (client name, token), values = client instances
+_clients = dict()
+# keys = base url (scheme://host:port), values = requests.Session
+_sessions = dict()
+_lock = threading.Lock()
+
 
 def get(client_name, token=None):
-    return __init_client(client_name, token=token)
+    """
+    Returns a client for the given service, made with the given token, or the one in the
+    environment. Clients are made once per service and token, and kept until reset is
+    called. Their requests go through a pooled, keep-alive session for the service's host.
+    """
+    key = (client_name, token or os.environ.get("KB_AUTH_TOKEN"))
+    with _lock:
+        client = _clients.get(key)
+    if client is None:
+        client = __init_client(client_name, token=token)
+        with _lock:
+            client = _clients.setdefault(key, client)
+    return client
 
 
 def reset():
-    pass
+    """
+    Drops all the cached clients, and closes their sessions.
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+        _clients.clear()
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def configure_sessions(
+    pool_connections: int = None,
+    pool_maxsize: int = None,
+    keep_alive: bool = None,
+    compress_min_bytes: int = None,
+) -> None:
+    """
+    Changes the connection pool and request compression settings for the shared sessions.
+    Any current clients and sessions are dropped, so new ones get made with the new
+    settings. A compress_min_bytes of 0 or less turns compression off.
+    """
+    global POOL_CONNECTIONS, POOL_MAXSIZE, KEEP_ALIVE, COMPRESS_MIN_BYTES
+    if pool_connections is not None:
+        POOL_CONNECTIONS = pool_connections
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+    if keep_alive is not None:
+        KEEP_ALIVE = keep_alive
+    if compress_min_bytes is not None:
+        COMPRESS_MIN_BYTES = compress_min_bytes if compress_min_bytes > 0 else None
+    reset()
+
+
+def wire_stats() -> dict:
+    """
+    Returns the number of requests the current clients have sent, and their body bytes
+    before and after compression, for each service and in total.
+    """
+    with _lock:
+        cached = list(_clients.items())
+    stats = {"total": dict()}
+    for (client_name, _), client in cached:
+        client_stats = getattr(getattr(client, "_client", client), "wire_stats", None)
+        if client_stats is None:
+            continue
+        for totals in (stats.setdefault(client_name, dict()), stats["total"]):
+            for name, value in client_stats.as_dict().items():
+                totals[name] = totals.get(name, 0) + value
+    return stats
+
+
+def get_session(url: str) -> "requests.Session":
+    """
+    Returns the shared session for the host of the given url, making it if needed.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    parsed = urlparse(url)
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    with _lock:
+        if base_url not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not KEEP_ALIVE:
+                session.headers["Connection"] = "close"
+            _sessions[base_url] = session
+        return _sessions[base_url]
 
 
 def __init_client(client_name, token=None):
     if client_name == "workspace":
-        c = Workspace(URLS.workspace, token=token)
+        from biokbase.workspace.client import Workspace
+        from biokbase.narrative.ws_cache import CachingWorkspace
+
+        # reads of immutable objects go through the shared cache, see ws_cache
+        c = CachingWorkspace(
+            Workspace(URLS.workspace, token=token),
+            token=token or os.environ.get("KB_AUTH_TOKEN"),
+        )
     elif client_name == "narrative_method_store":
+        from biokbase.narrative_method_store.client import NarrativeMethodStore
+
         c = NarrativeMethodStore(URLS.narrative_method_store, token=token)
     elif client_name == "user_and_job_state":
+        from biokbase.userandjobstate.client import UserAndJobState
+
         c = UserAndJobState(URLS.user_and_job_state, token=token)
     elif client_name == "catalog":
+        from biokbase.catalog.Client import Catalog
+
         c = Catalog(URLS.catalog, token=token)
     elif client_name == "service" or client_name == "service_wizard":
+        from biokbase.service.Client import Client as ServiceClient
+
         c = ServiceClient(URLS.service_wizard, use_url_lookup=True, token=token)
     elif (
         client_name == "execution_engine2"
         or client_name == "execution_engine"
         or client_name == "job_service"
     ):
+        from biokbase.execution_engine2.execution_engine2Client import execution_engine2
+
         c = execution_engine2(URLS.execution_engine2, token=token)
     elif client_name == "job_service_mock":
-        c = JobServiceMock()
+        return JobServiceMock()
     else:
         raise ValueError('Unknown client name "%s"' % client_name)
 
+    # the generated clients either make their calls themselves, or through a BaseClient
+    base_client = getattr(c, "_client", c)
+    base_client.session = get_session(base_client.url)
+    if hasattr(base_client, "compress_min_bytes"):
+        base_client.compress_min_bytes = COMPRESS_MIN_BYTES
     return c
 
 
@@ -0,0 +1,353 @@
+"""
+HTTP plumbing shared by the generated KBase service clients.
+
+The BaseClients in biokbase.workspace, biokbase.catalog, biokbase.execution_engine2 and
+biokbase.userandjobstate are generated by the KBase type compiler, so they only hold a
+small hook that hands off to the helpers here. That way there's one copy of each of
+these per process:
+    * the JSON codec, which uses orjson if it's installed
+    * the cache of dynamic service urls from the Service Wizard
+    * the record of which services take gzipped requests
+    * the thread that polls submitted SDK jobs
+"""
+import asyncio
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable, Hashable, List, Tuple
+import requests
+
+try:
+    import orjson  # optional, faster JSON
+except ImportError:
+    orjson = None
+
+# the default number of calls that call_many makes at once
+CALL_MANY_WORKERS = 8
+# how long a dynamic service's url from the Service Wizard is used for, in seconds
+SERVICE_URL_TTL = 300
+# the gzip level for compressed requests. JSON shrinks nearly as much at 1 as at 6, in
+# a fraction of the time
+COMPRESS_LEVEL = 1
+
+_CT = "content-type"
+_AJ = "application/json"
+
+
+class _JSONObjectEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+class StdlibJSONCodec:
+    """
+    Encodes and decodes JSON with the standard library json module.
+    """
+
+    name = "json"
+
+    def dumps(self, obj) -> str:
+        return json.dumps(obj, cls=_JSONObjectEncoder)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError
+
+
+class OrjsonCodec:
+    """
+    Encodes and decodes JSON with orjson, which works on bytes directly, without
+    building an intermediate str. Anything orjson can't handle, e.g. ints over 64
+    bits, or NaN in a response, falls back to the standard library.
+    """
+
+    name = "orjson"
+
+    def dumps(self, obj) -> bytes:
+        try:
+            return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return StdlibJSONCodec().dumps(obj)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return StdlibJSONCodec().loads(data)
+
+
+# The codec new clients use. Set a client's json_codec to any object with
+# dumps(obj) -> str or bytes and loads(bytes) -> obj to use another one.
+DEFAULT_JSON_CODEC = OrjsonCodec() if orjson is not None else StdlibJSONCodec()
+
+
+class ServiceURLCache:
+    """
+    Caches the urls of dynamic services looked up from the Service Wizard, keyed by
+    (service wizard url, module, version), for ttl seconds. If a lookup for a key is
+    already running, other lookups for it wait for that one instead of making their own.
+    """
+
+    def __init__(self, ttl: float = SERVICE_URL_TTL):
+        self.ttl = ttl
+        self._urls = dict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, lookup: Callable[[], str]) -> str:
+        """
+        Returns the url for key, calling lookup() to get it if it's not cached.
+        """
+        while True:
+            with self._lock:
+                entry = self._urls.get(key)
+                if entry is not None and entry[1] > time.time():
+                    return entry[0]
+                event = self._pending.get(key)
+                is_owner = event is None
+                if is_owner:
+                    event = self._pending[key] = threading.Event()
+            if not is_owner:
+                # if that lookup failed, the next time round makes a new one
+                event.wait()
+                continue
+            try:
+                url = lookup()
+                with self._lock:
+                    self._urls[key] = (url, time.time() + self.ttl)
+                return url
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                event.set()
+
+    def evict(self, key: Hashable) -> None:
+        with self._lock:
+            self._urls.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._urls.clear()
+
+
+# shared by all the clients in this process
+service_urls = ServiceURLCache()
+
+
+class WireStats:
+    """
+    Counts the requests a client sends, and their body bytes before and after compression.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, body_bytes: int, sent_bytes: int, compressed: bool) -> None:
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["compressed_requests"] += int(compressed)
+            self._counts["body_bytes"] += body_bytes
+            self._counts["sent_bytes"] += sent_bytes
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = {
+                "requests": 0,
+                "compressed_requests": 0,
+                "body_bytes": 0,
+                "sent_bytes": 0,
+            }
+
+
+# keys = service url, values = whether it takes gzipped requests. Services that aren't
+# here yet get sent one, and are added depending on how they answer.
+compression_support = dict()
+
+
+def compression_rejected(ret: requests.Response) -> bool:
+    """
+    Returns True if a service couldn't read a gzipped request. That's a 415, a 400 that
+    says the encoding wasn't understood, or a JSON-RPC parse error, from a service that
+    tried to parse the gzipped bytes as JSON. The service never ran the call in any of
+    these cases. Any other error is about the call itself.
+    """
+    if ret.status_code == 415:
+        return True
+    if ret.status_code == 400:
+        return b"encoding" in (ret.content or b"").lower()
+    if ret.status_code != 500 or ret.headers.get(_CT) != _AJ:
+        return False
+    try:
+        err = json.loads(ret.content)
+    except ValueError:
+        return False
+    return isinstance(err.get("error"), dict) and err["error"].get("code") == -32700
+
+
+def post(client, url: str, body: bytes) -> requests.Response:
+    """
+    Posts a request body for a BaseClient, through its session if it has one. The body
+    is gzipped if it's at least client.compress_min_bytes long and the service hasn't
+    turned down gzipped requests before. If it turns this one down, which means it never
+    read the call, the body gets sent again as it is, and so do later ones to it. Other
+    errors aren't retried, as the call may not be safe to repeat.
+    """
+    compress = (
+        client.compress_min_bytes is not None
+        and len(body) >= client.compress_min_bytes
+        and compression_support.get(url, True)
+    )
+    data = body
+    headers = client._headers
+    if compress:
+        data = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+        headers = dict(client._headers, **{"Content-Encoding": "gzip"})
+    ret = (client.session or requests).post(
+        url,
+        data=data,
+        headers=headers,
+        timeout=client.timeout,
+        verify=not client.trust_all_ssl_certificates,
+    )
+    client.wire_stats.record(len(body), len(data), compress)
+    if compress:
+        if compression_rejected(ret):
+            compression_support[url] = False
+            return post(client, url, body)
+        compression_support[url] = True
+    return ret
+
+
+def call_many(
+    call: Callable, calls: List[Tuple[str, list]], max_workers: int = None
+) -> list:
+    """
+    Makes several calls concurrently, with call(method, params) for each of the
+    (method, params) pairs in calls, on up to max_workers threads (default 8).
+    Returns a list of the results, in the same order as the calls. If a call fails,
+    its place in the list holds the exception it raised.
+    """
+    if not calls:
+        return []
+
+    def call_one(method, params):
+        try:
+            return call(method, params)
+        except Exception as e:
+            return e
+
+    max_workers = min(max_workers or CALL_MANY_WORKERS, len(calls))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(call_one, method, params) for method, params in calls]
+    return [f.result() for f in futures]
+
+
+def _job_result(job_state):
+    if not job_state["result"]:
+        return None
+    if len(job_state["result"]) == 1:
+        return job_state["result"][0]
+    return job_state["result"]
+
+
+class JobPoller:
+    """
+    Waits on submitted SDK jobs on one shared thread, and resolves each job's future when
+    it finishes. Each round, all the jobs that are due are checked at once, on a thread
+    pool, and each job keeps the backoff of the client that submitted it.
+    """
+
+    def __init__(self, max_workers: int = CALL_MANY_WORKERS):
+        self.max_workers = max_workers
+        # dicts with keys client, service, job_id, future, check_time, next_check
+        self._jobs = list()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, client, service: str, job_id: str) -> Future:
+        """
+        Starts polling a job with client._check_job, and returns a
+        concurrent.futures.Future for its result.
+        """
+        job = {
+            "client": client,
+            "service": service,
+            "job_id": job_id,
+            "future": Future(),
+            "check_time": client.async_job_check_time,
+            "next_check": time.time() + client.async_job_check_time,
+        }
+        with self._cond:
+            self._jobs.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="kbase-job-poller", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        return job["future"]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # drops the finished jobs, and any whose futures were cancelled
+                self._jobs = [job for job in self._jobs if not job["future"].done()]
+                if not self._jobs:
+                    self._thread = None
+                    return
+                now = time.time()
+                next_check = min(job["next_check"] for job in self._jobs)
+                if next_check > now:
+                    self._cond.wait(next_check - now)
+                    continue
+                due = [job for job in self._jobs if job["next_check"] <= now]
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(due))) as pool:
+                checks = [
+                    pool.submit(job["client"]._check_job, job["service"], job["job_id"])
+                    for job in due
+                ]
+            for job, check in zip(due, checks):
+                self._update(job, check)
+
+    def _update(self, job, check):
+        future = job["future"]
+        try:
+            if check.exception() is not None:
+                future.set_exception(check.exception())
+            elif check.result()["finished"]:
+                future.set_result(_job_result(check.result()))
+            else:
+                job["check_time"] = job["client"]._next_job_check_time(job["check_time"])
+                job["next_check"] = time.time() + job["check_time"]
+        except InvalidStateError:
+            # it was cancelled in the meantime
+            pass
+
+
+# shared by all the clients in this process
+job_poller = JobPoller()
+
+
+async def wait_for_job(submit: Callable[..., Future], *args):
+    """
+    Calls submit(*args), e.g. a BaseClient's submit_job, on the event loop's default
+    executor, so the submission doesn't block the loop, then awaits the job's result.
+    """
+    loop = asyncio.get_running_loop()
+    future = await loop.run_in_executor(None, submit, *args)
+    return await asyncio.wrap_future(future)
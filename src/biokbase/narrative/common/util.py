@@ -6,11 +6,8 @@ __date__ = "1/6/14"
 
 import os
 import re
-import requests
-from setuptools import Command
+from functools import lru_cache
 from .kvp import KVP_EXPR, parse_kvp
-from biokbase.workspace.client import Workspace as WS2
-from biokbase.workspace.baseclient import ServerError
 
 
 def kbase_debug_mode():
@@ -95,22 +92,35 @@ class _KBaseEnv(object):
 kbase_env = _KBaseEnv()
 
 
-class BuildDocumentation(Command):
-    """Setuptools command hook to build Sphinx docs"""
+@lru_cache(maxsize=None)
+def _build_documentation_command():
+    # setuptools is slow to import, and only setup.py needs this, so it's made on first use
+    from setuptools import Command
 
-    description = "build Sphinx documentation"
-    user_options = []
+    class BuildDocumentation(Command):
+        """Setuptools command hook to build Sphinx docs"""
 
-    def initialize_options(self):
-        self.doc_dir = "biokbase-doc"
+        description = "build Sphinx documentation"
+        user_options = []
 
-    def finalize_options(self):
-        pass
+        def initialize_options(self):
+            self.doc_dir = "biokbase-doc"
 
-    def run(self):
-        filedir = os.path.dirname(os.path.realpath(__file__))
-        p = filedir.find("/biokbase/")
-        top = filedir[: p + 1]
-        doc = top + self.doc_dir
-        os.chdir(doc)
-        os.system("make html")
+        def finalize_options(self):
+            pass
+
+        def run(self):
+            filedir = os.path.dirname(os.path.realpath(__file__))
+            p = filedir.find("/biokbase/")
+            top = filedir[: p + 1]
+            doc = top + self.doc_dir
+            os.chdir(doc)
+            os.system("make html")
+
+    return BuildDocumentation
+
+
+def __getattr__(name):
+    if name == "BuildDocumentation":
+        return _build_documentation_command()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,6 @@
 import biokbase.narrative.clients as clients
+from .joblog import JobLog
+from .jobmetrics import count_ee2_calls, run_in_context
 from .specmanager import SpecManager
 from biokbase.narrative.app_util import map_inputs_from_job, map_outputs_from_state
 from biokbase.narrative.exception_util import transform_job_exception
@@ -6,6 +8,7 @@ import copy
 import json
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from jinja2 import Template
 from pprint import pprint
 from typing import List
@@ -31,6 +34,11 @@ JOB_INIT_EXCLUDED_JOB_STATE_FIELDS = [
 
 EXTRA_JOB_STATE_FIELDS = ["batch_id", "cell_id", "run_id", "child_jobs"]
 
+# Job states are fetched from ee2.check_jobs in chunks of at most CHECK_JOBS_CHUNK_SIZE
+# job IDs, with up to CHECK_JOBS_WORKERS chunks in flight at once
+CHECK_JOBS_CHUNK_SIZE = 500
+CHECK_JOBS_WORKERS = 4
+
 
 # The app_id and app_version should both align with what's available in
 # the Narrative Method Store service.
@@ -79,8 +87,11 @@ STATE_ATTRS = list(set(JOB_ATTRS) - set(JOB_INPUT_ATTRS) - set(NARR_CELL_INFO_AT
 
 
 class Job(object):
-    _job_logs = list()
-    _acc_state = None  # accumulates state
+    # accumulates state. This is copy-on-write: updates replace the dict (and any nested
+    # dicts they change) rather than modifying it, so it can be shared with readers.
+    _acc_state = None
+    _cached_output_state = None  # output_state() result, kept once the job is terminal
+    _state_listener = None  # called with this Job when its state changes (see JobManager)
 
     def __init__(self, ee2_state, extra_data=None, children=None):
         """
@@ -99,8 +110,9 @@ class Job(object):
         if ee2_state.get("job_id") is None:
             raise ValueError("Cannot create a job without a job ID!")
 
-        self._acc_state = ee2_state
+        self._acc_state = dict(ee2_state)
         self.extra_data = extra_data
+        self._job_log = JobLog(self.job_id)
 
         # verify parent-children relationship
         if ee2_state.get("batch_job"):
@@ -192,18 +204,24 @@ class Job(object):
 
     def __setattr__(self, name, value):
         if name in STATE_ATTRS:
-            self._acc_state[name] = value
+            update = {name: value}
         elif name in JOB_INPUT_ATTRS:
-            self._acc_state["job_input"] = self._acc_state.get("job_input", {})
-            self._acc_state["job_input"][name] = value
+            update = {"job_input": {**self._acc_state.get("job_input", {}), name: value}}
         elif name in NARR_CELL_INFO_ATTRS:
-            self._acc_state["job_input"] = self._acc_state.get("job_input", {})
-            self._acc_state["job_input"]["narrative_cell_info"] = self._acc_state[
-                "job_input"
-            ].get("narrative_cell_info", {})
-            self._acc_state["job_input"]["narrative_cell_info"][name] = value
+            job_input = dict(self._acc_state.get("job_input", {}))
+            job_input["narrative_cell_info"] = {
+                **job_input.get("narrative_cell_info", {}),
+                name: value,
+            }
+            update = {"job_input": job_input}
         else:
             object.__setattr__(self, name, value)
+            return
+        # copy-on-write, see _acc_state
+        self._acc_state = {**self._acc_state, **update}
+        self._cached_output_state = None
+        if self._state_listener is not None:
+            self._state_listener(self)
 
     @property
     def app_name(self):
@@ -286,9 +304,8 @@ class Job(object):
             return self.params
         else:
             try:
-                self.params = clients.get("execution_engine2").get_job_params(
-                    self.job_id
-                )["params"]
+                ee2 = count_ee2_calls(clients.get("execution_engine2"))
+                self.params = ee2.get_job_params(self.job_id)["params"]
                 return self.params
             except Exception as e:
                 raise Exception(
@@ -298,6 +315,9 @@ class Job(object):
     def _update_state(self, state: dict) -> None:
         """
         given a state data structure (as emitted by ee2), update the stored state in the job object
+
+        The stored state is replaced by a merged copy, and only if something changed. The
+        values in the given state are kept as-is, so it shouldn't be modified afterward.
         """
         if state:
 
@@ -306,11 +326,20 @@ class Job(object):
                     f"Job ID mismatch in _update_state: job ID: {self.job_id}; state ID: {state['job_id']}"
                 )
 
-            state = copy.deepcopy(state)
             if self._acc_state is None:
-                self._acc_state = state
-            else:
-                self._acc_state.update(state)
+                self._acc_state = dict(state)
+                return
+
+            changed = {
+                field: value
+                for field, value in state.items()
+                if field not in self._acc_state or self._acc_state[field] != value
+            }
+            if changed:
+                self._cached_output_state = None
+                self._acc_state = {**self._acc_state, **changed}
+                if self._state_listener is not None:
+                    self._state_listener(self)
 
     @staticmethod
     def _trim_ee2_state(state: dict, exclude: list) -> None:
@@ -322,6 +351,9 @@ class Job(object):
     def state(self, force_refresh=False):
         """
         Queries the job service to see the state of the current job.
+
+        The returned dict is a new copy at the top level only; nested values (e.g. the
+        job_output) are shared with the Job, so they shouldn't be modified.
         """
 
         if force_refresh or not self.was_terminal():
@@ -331,17 +363,22 @@ class Job(object):
         return self._internal_state(JOB_INIT_EXCLUDED_JOB_STATE_FIELDS)
 
     def _internal_state(self, exclude=None):
-        """Wrapper for self._acc_state"""
-        state = copy.deepcopy(self._acc_state)
-        self._trim_ee2_state(state, exclude)
-        return state
+        """
+        Wrapper for self._acc_state. Returns a new top-level dict without the excluded
+        fields; nested values are shared with the stored state and shouldn't be modified.
+        """
+        if self._acc_state is None:
+            return None
+        exclude = exclude or []
+        return {k: v for k, v in self._acc_state.items() if k not in exclude}
 
     @staticmethod
     def query_ee2_state(
         job_id: str,
         init: bool = True,
     ) -> dict:
-        return clients.get("execution_engine2").check_job(
+        ee2 = count_ee2_calls(clients.get("execution_engine2"))
+        return ee2.check_job(
             {
                 "job_id": job_id,
                 "exclude_fields": (
@@ -356,26 +393,74 @@ class Job(object):
     def query_ee2_states(
         job_ids: List[str],
         init: bool = True,
+        errors: dict = None,
     ) -> dict:
+        """
+        Fetches job states from ee2.check_jobs, keyed by job ID. Large lists of job IDs are
+        split into chunks of CHECK_JOBS_CHUNK_SIZE, which are fetched concurrently.
+
+        :param errors: if given, the job IDs in chunks that fail get added to it, with the
+            exception as the value, and the states from the other chunks are still returned.
+            Otherwise, any failure is raised.
+        """
         if not job_ids:
             return {}
 
-        return clients.get("execution_engine2").check_jobs(
-            {
-                "job_ids": job_ids,
-                "exclude_fields": (
-                    JOB_INIT_EXCLUDED_JOB_STATE_FIELDS
-                    if init
-                    else EXCLUDED_JOB_STATE_FIELDS
-                ),
-                "return_list": 0,
-            }
+        exclude_fields = (
+            JOB_INIT_EXCLUDED_JOB_STATE_FIELDS if init else EXCLUDED_JOB_STATE_FIELDS
         )
 
-    def output_state(self, state=None) -> dict:
+        def check_jobs(chunk):
+            ee2 = count_ee2_calls(clients.get("execution_engine2"))
+            return ee2.check_jobs(
+                {
+                    "job_ids": chunk,
+                    "exclude_fields": exclude_fields,
+                    "return_list": 0,
+                }
+            )
+
+        job_ids = list(job_ids)
+        chunks = [
+            job_ids[i : i + CHECK_JOBS_CHUNK_SIZE]
+            for i in range(0, len(job_ids), CHECK_JOBS_CHUNK_SIZE)
+        ]
+        states = dict()
+
+        def collect(chunk, fetch):
+            try:
+                states.update(fetch())
+            except Exception as e:
+                if errors is None:
+                    raise
+                for job_id in chunk:
+                    errors[job_id] = e
+
+        if len(chunks) == 1:
+            # the usual case, which isn't worth starting threads for
+            collect(chunks[0], lambda: check_jobs(chunks[0]))
+            return states
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(chunks), CHECK_JOBS_WORKERS)
+        ) as pool:
+            futures = [
+                pool.submit(run_in_context(check_jobs), chunk) for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                collect(chunk, future.result)
+        return states
+
+    def output_state(self, state=None, force_refresh=False) -> dict:
         """
+        Once a job is terminal, the output state is built only once and cached. The cache is
+        reset when a state update changes the job (e.g. after a retry), or if force_refresh
+        is True. The cached result is shared, so callers should not modify it.
+
         :param state: can be queried individually from ee2/cache with self.state(),
             but sometimes want it to be queried in bulk from ee2 upstream
+        :param force_refresh: if True, drop any cached output state, and if no state is
+            given, fetch the current state from ee2 even if the job is terminal
         :return: dict, with structure
 
         {
@@ -405,10 +490,17 @@ class Job(object):
             }
         }
         """
+        if force_refresh:
+            self._cached_output_state = None
+
         if not state:
-            state = self.state()
+            if self._cached_output_state is not None:
+                return self._cached_output_state
+            state = self.state(force_refresh=True) if force_refresh else self.state()
         else:
             self._update_state(state)
+            if self._cached_output_state is not None:
+                return self._cached_output_state
             state = self._internal_state()
 
         if state is None:
@@ -451,6 +543,8 @@ class Job(object):
             "user": self.user,
             "cell_id": self.cell_id,
         }
+        if self.was_terminal():
+            self._cached_output_state = job_state
         return job_state
 
     def show_output_widget(self, state=None):
@@ -489,7 +583,7 @@ class Job(object):
             state, map_inputs_from_job(self.parameters(), spec), spec
         )
 
-    def log(self, first_line=0, num_lines=None):
+    def log(self, first_line=0, num_lines=None, latest_only=False):
         """
         Fetch a list of Job logs from the Job Service.
         This returns a 2-tuple (number of available log lines, list of log lines)
@@ -506,36 +600,26 @@ class Job(object):
         num_lines - int or None
             Limit on the number of lines to return (if None, return everything). If <= 0,
             returns no lines.
+        latest_only - bool
+            If True, returns the last num_lines lines, and first_line is ignored.
         Usage:
         ------
         The parameters are kwargs, so the following cases can be true:
         log() - returns all available log lines
         log(first_line=5) - returns every line available starting with line 5
         log(num_lines=100) - returns the first 100 lines (or all lines available if < 100)
-        """
-        self._update_log()
-        num_available_lines = len(self._job_logs)
-
-        if first_line < 0:
-            first_line = 0
-        if num_lines is None:
-            num_lines = num_available_lines - first_line
-        if num_lines < 0:
-            num_lines = 0
-
-        if first_line >= num_available_lines or num_lines <= 0:
-            return (num_available_lines, list())
-        return (
-            num_available_lines,
-            self._job_logs[first_line : first_line + num_lines],
-        )
+        log(num_lines=100, latest_only=True) - returns the last 100 lines
 
-    def _update_log(self):
-        log_update = clients.get("execution_engine2").get_job_logs(
-            {"job_id": self.job_id, "skip_lines": len(self._job_logs)}
+        Lines are kept in a JobLog, so only lines that haven't been seen yet are fetched.
+        """
+        # once the job's done, its log can't grow, so stop checking after the next fetch
+        was_terminal = self.was_terminal()
+        logs = self._job_log.get_lines(
+            first_line=first_line, num_lines=num_lines, latest_only=latest_only
         )
-        if log_update["lines"]:
-            self._job_logs = self._job_logs + log_update["lines"]
+        if was_terminal:
+            self._job_log.complete = True
+        return logs
 
     def is_finished(self):
         """
@@ -637,3 +721,4 @@ class Job(object):
     def update_children(self, children: List["Job"]) -> None:
         self._verify_children(children)
         self.children = children
+        self._cached_output_state = None
@@ -1,9 +1,18 @@
+import base64
 import copy
+import heapq
+import itertools
+import json
 import threading
-from typing import List, Union
+import zlib
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+from typing import Callable, Hashable, List, Union
 from ipykernel.comm import Comm
 import biokbase.narrative.jobs.jobmanager as jobmanager
 from biokbase.narrative.jobs.jobmanager import JOBS_TYPE_ERR
+from biokbase.narrative.jobs.jobmetrics import JobCommMetrics, STATUS_LOOP
 from biokbase.narrative.exception_util import NarrativeException, JobIDException
 from biokbase.narrative.common import kblogging
 
@@ -14,7 +23,80 @@ JOBS_NOT_PROVIDED_ERR = "job_id_list not provided"
 
 BOTH_INPUTS_PRESENT_ERR = "Both job_id and job_id_list present"
 
+# the status loop runs when the next job is due to be polled (see jobmanager.POLL_INTERVALS),
+# but no sooner than MIN_LOOKUP_TIMER_INTERVAL and no later than LOOKUP_TIMER_INTERVAL seconds.
+# In "all" mode, the terminal job states are only sent every LOOKUP_TIMER_INTERVAL seconds.
 LOOKUP_TIMER_INTERVAL = 5
+MIN_LOOKUP_TIMER_INTERVAL = 1
+
+# job status loop modes
+# all: every tick sends the state of every job in the Narrative that was due to be polled as
+#   job_status_all, along with the cached states of all the terminal jobs, at most every
+#   LOOKUP_TIMER_INTERVAL seconds
+# delta: every tick looks up only jobs with update listeners (refresh > 0) and sends
+#   a job_status_delta with the jobs whose status or updated timestamp has changed
+LOOKUP_MODE_ALL = "all"
+LOOKUP_MODE_DELTA = "delta"
+LOOKUP_MODES = [LOOKUP_MODE_ALL, LOOKUP_MODE_DELTA]
+# The Narrative front end asks for delta mode, and async request mode (below), when it sets up
+# the channel (see getJobInitCode in jobCommChannel.js). Other callers get all and sync.
+
+# comm request handling modes
+# sync: requests are handled on the thread that receives the comm message
+# async: requests are handled on a pool of REQUEST_WORKERS threads
+REQUEST_MODE_SYNC = "sync"
+REQUEST_MODE_ASYNC = "async"
+REQUEST_MODES = [REQUEST_MODE_SYNC, REQUEST_MODE_ASYNC]
+REQUEST_WORKERS = 4
+
+# in async request mode, waiting requests are run in priority order (lowest first), so that
+# e.g. a cancel isn't held up behind a big status lookup
+REQUEST_PRIORITY_INTERACTIVE = 0
+REQUEST_PRIORITY_DEFAULT = 1
+REQUEST_PRIORITY_LOOKUP = 2
+INTERACTIVE_REQUESTS = [
+    "cancel_job",
+    "retry_job",
+    "job_logs",
+    "job_logs_follow",
+    "stop_job_logs_follow",
+]
+# requests that only look things up. In async request mode, these don't hold up later
+# requests for the same jobs, and one that's the same as a request still waiting to run is
+# dropped, as that one will send the same information. Requests that run at the same time
+# share their EE2 state lookups by job (see jobmanager.JobStateFetcher): e.g. job_status for
+# [a, b] and then [b, c] makes one EE2 call for [a, b] and one for [c], and each sends its
+# own job_status message. That goes for start_job_update and the status loop too, though
+# they're never dropped, as each one changes something.
+LOOKUP_REQUESTS = [
+    "all_status",
+    "job_status",
+    "job_status_batch",
+    "job_status_batch_summary",
+    "job_info",
+    "job_info_batch",
+]
+
+# followed job logs (job_logs_follow) are checked every LOG_FOLLOW_INTERVAL seconds, and at
+# most LOG_FOLLOW_MAX_LINES new lines are sent at a time
+LOG_FOLLOW_INTERVAL = 2
+LOG_FOLLOW_MAX_LINES = 1000
+
+# outgoing message handling that the front end can ask for (see set_comm_capabilities)
+# coalesce: messages sent within COALESCE_WINDOW seconds of each other go out together, with
+#   consecutive messages of the COALESCED_MSG_TYPES merged into one, as a job_comm_batch
+#   message, or as themselves if there's only one
+# zlib: messages that are at least COMPRESS_THRESHOLD bytes as JSON are zlib-compressed and
+#   base64-encoded into a job_comm_compressed message
+COMM_CAPABILITY_COALESCE = "coalesce"
+COMM_CAPABILITY_ZLIB = "zlib"
+COMM_CAPABILITIES = [COMM_CAPABILITY_COALESCE, COMM_CAPABILITY_ZLIB]
+COALESCE_WINDOW = 0.05
+COMPRESS_THRESHOLD = 10000
+# these messages have content keyed by job id, so two of them can be merged into one
+COALESCED_MSG_TYPES = ["job_status", "job_status_all", "job_status_delta", "job_info"]
+BATCH_MSG_TYPE = "job_comm_batch"
+COMPRESSED_MSG_TYPE = "job_comm_compressed"
 
 
 class JobRequest:
@@ -60,9 +142,12 @@ class JobRequest:
     REQUIRE_JOB_ID = [
         "job_info_batch",
         "job_status_batch",
+        "job_status_batch_summary",
         "start_job_update_batch",
         "stop_job_update_batch",
         "job_logs",
+        "job_logs_follow",
+        "stop_job_logs_follow",
     ]
     REQUIRE_JOB_ID_LIST = [
         "job_info",
@@ -150,6 +235,151 @@ class JobRequest:
         return requests
 
 
+class JobRequestExecutor:
+    """
+    Runs functions on a bounded pool of worker threads, keeping the order of the ones
+    submitted for the same job IDs. A function is only started once everything submitted
+    before it for any of its job IDs has finished. Functions with no job IDs, or with
+    different job IDs, can run concurrently.
+
+    Functions that are ready to run are started in priority order, then in the order they
+    were submitted. Functions submitted as non-blocking (i.e. lookups) still wait for earlier
+    ones for their job IDs, but don't hold up later non-blocking ones. Blocking ones (i.e.
+    those that change something) wait for them, though, so e.g. a lookup can't send a job's
+    state from before a cancel that was submitted after it. Functions submitted with the
+    same dedupe_key as one that hasn't started yet aren't run again.
+    """
+
+    def __init__(self, max_workers: int = REQUEST_WORKERS):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="JobRequestExecutor"
+        )
+        self._lock = threading.Lock()
+        # keys = job_id, values = Future of the last blocking function submitted for that job
+        self._last_futures = dict()
+        # keys = job_id, values = set of Futures of the unfinished non-blocking functions
+        # submitted for that job since then
+        self._lookup_futures = dict()
+        # heap of (priority, sequence number, Future, job ids, function, args, dedupe_key)
+        # for functions that are ready to run
+        self._ready = list()
+        self._seq = itertools.count()
+        # keys = dedupe_key, values = Future of a function that hasn't started yet
+        self._pending = dict()
+        # Futures of the functions that haven't finished, including those still waiting
+        # for others
+        self._unfinished = set()
+
+    def submit(
+        self,
+        job_ids: List[str],
+        fn: Callable,
+        *args,
+        priority: int = REQUEST_PRIORITY_DEFAULT,
+        blocking: bool = True,
+        dedupe_key: Hashable = None,
+    ) -> Future:
+        """
+        Schedules fn(*args) to run after anything already submitted for these job IDs.
+        Returns a Future with its result.
+
+        :param priority: int - ready functions with lower priorities are started first
+        :param blocking: bool - if False, non-blocking functions submitted later for the
+            same job IDs don't wait for this one, but blocking ones still do
+        :param dedupe_key: if given, and a function submitted with the same key hasn't
+            started yet, this returns its Future instead of scheduling fn again
+        """
+        with self._lock:
+            if dedupe_key is not None and dedupe_key in self._pending:
+                return self._pending[dedupe_key]
+            future = Future()
+            self._unfinished.add(future)
+            prev_futures = {
+                self._last_futures[job_id]
+                for job_id in job_ids
+                if job_id in self._last_futures
+            }
+            if blocking:
+                lookups = set()
+                for job_id in job_ids:
+                    lookups.update(self._lookup_futures.pop(job_id, ()))
+                    self._last_futures[job_id] = future
+                prev_futures.update(lookups)
+                # later lookups should see what this does, so they don't join earlier ones
+                for key in [key for key, f in self._pending.items() if f in lookups]:
+                    del self._pending[key]
+            else:
+                for job_id in job_ids:
+                    self._lookup_futures.setdefault(job_id, set()).add(future)
+            if dedupe_key is not None:
+                self._pending[dedupe_key] = future
+
+        def start(*_):
+            with self._lock:
+                heapq.heappush(
+                    self._ready,
+                    (priority, next(self._seq), future, job_ids, fn, args, dedupe_key),
+                )
+            self._pool.submit(self._run_next)
+
+        if not prev_futures:
+            start()
+        else:
+            waiting = [len(prev_futures)]
+
+            def prev_done(_):
+                with self._lock:
+                    waiting[0] -= 1
+                    ready = waiting[0] == 0
+                if ready:
+                    start()
+
+            for prev_future in prev_futures:
+                prev_future.add_done_callback(prev_done)
+        return future
+
+    def _run_next(self) -> None:
+        """
+        Runs the ready function with the lowest priority. There's one call to this for each
+        function that becomes ready.
+        """
+        with self._lock:
+            _, _, future, job_ids, fn, args, dedupe_key = heapq.heappop(self._ready)
+            if dedupe_key is not None and self._pending.get(dedupe_key) is future:
+                del self._pending[dedupe_key]
+        self._run(future, job_ids, fn, args)
+
+    def _run(self, future: Future, job_ids: List[str], fn: Callable, args: tuple) -> None:
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._unfinished.discard(future)
+                for job_id in job_ids:
+                    if self._last_futures.get(job_id) is future:
+                        del self._last_futures[job_id]
+                    lookups = self._lookup_futures.get(job_id)
+                    if lookups is not None:
+                        lookups.discard(future)
+                        if not lookups:
+                            del self._lookup_futures[job_id]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Shuts down the worker threads. If wait is True, this first waits for everything
+        submitted to finish, including functions still waiting for others to finish.
+        """
+        while wait:
+            with self._lock:
+                unfinished = list(self._unfinished)
+            if not unfinished:
+                break
+            futures_wait(unfinished)
+        self._pool.shutdown(wait=wait)
+
+
 class JobComm:
     """
     The main JobComm channel. This is the kernel-side of the connection, and routes
@@ -163,8 +393,18 @@ class JobComm:
     needs to send messages about Jobs to the front end should use JobComm.send_comm_message.
 
     It also maintains the lookup loop thread. This is a threading.Timer that, after
-    some interval, will lookup the status of all running jobs. If there are no jobs to
-    look up, this cancels itself.
+    some interval, will lookup the status of the running jobs that are due to be polled.
+    Each job has its own poll schedule, kept by the JobManager. If there are no jobs to
+    look up, this cancels itself. In the default "all" mode, each lookup sends the state
+    of every polled job as a job_status_all message, with the terminal jobs included every
+    LOOKUP_TIMER_INTERVAL seconds; in "delta" mode, only jobs that something is listening
+    to are looked up, and only the ones that changed since the previous lookup are sent,
+    as a job_status_delta message.
+
+    Requests are handled synchronously by default. In "async" request mode (see
+    set_request_mode), they are handled on a pool of worker threads instead, so slow EE2
+    calls don't block the kernel, and the results get sent back over the channel as they
+    finish. Requests for the same jobs are still handled in the order they came in.
 
     Allowed messages:
     * all_status - return job state for all jobs in this Narrative.
@@ -174,6 +414,9 @@ class JobComm:
     * stop_job_update - has the update loop not include a job when updating (requires a job_id)
     * cancel_job - cancels a running job, if it hasn't otherwise terminated (requires a job_id)
     * job_logs - sends job logs back over the comm channel (requires a job id)
+    * job_logs_follow - sends new job log lines over the comm channel as they come in, until
+        the job is done (requires a job id)
+    * stop_job_logs_follow - stops sending new log lines for a job (requires a job id)
     """
 
     # An instance of this class. It's meant to be a singleton, so this just gets created and
@@ -189,6 +432,30 @@ class JobComm:
     _msg_map = None
     _running_lookup_loop = False
     _lookup_timer = None
+    # whether a status loop tick is running right now
+    _lookup_ticking = False
+    # guards starting, stopping and rescheduling the status loop, which happen on request
+    # worker threads (in async request mode) and the loop's own Timer threads
+    _lookup_lock = None
+    _lookup_mode = LOOKUP_MODE_ALL
+    # when the status loop last sent the terminal job states, in "all" mode
+    _last_full_lookup = None
+    _request_executor = None  # JobRequestExecutor, in async request mode
+    # keys = job_id, values = (status, updated) as of the last delta lookup
+    _last_job_updates = None
+    # keys = job_id, values = dict with the next log line to send ("next_line") and the
+    # Timer that will send it ("timer"), and the lock that guards it, as it's used by Timer
+    # threads and (in async request mode) request worker threads
+    _log_follows = None
+    _log_follows_lock = None
+    # negotiated COMM_CAPABILITIES
+    _comm_capabilities = frozenset()
+    # messages waiting to be sent, when coalescing, and the Timer that will send them
+    _outbox = None
+    _outbox_timer = None
+    _outbox_lock = None
+    # JobCommMetrics for the requests and the status loop
+    _metrics = None
     _log = kblogging.get_logger(__name__)
 
     def __new__(cls):
@@ -207,6 +474,7 @@ class JobComm:
                 "all_status": self._lookup_all_job_states,
                 "job_status": self._lookup_job_states,
                 "job_status_batch": self._lookup_job_states_batch,
+                "job_status_batch_summary": self._lookup_batch_summary,
                 "job_info": self._lookup_job_info,
                 "job_info_batch": self._lookup_job_info_batch,
                 "start_job_update": self._modify_job_updates,
@@ -216,21 +484,70 @@ class JobComm:
                 "cancel_job": self._cancel_jobs,
                 "retry_job": self._retry_jobs,
                 "job_logs": self._get_job_logs,
+                "job_logs_follow": self._follow_job_logs,
+                "stop_job_logs_follow": self._stop_following_job_logs,
+                "job_comm_metrics": self._send_metrics,
             }
+        if self._lookup_lock is None:
+            self._lookup_lock = threading.RLock()
+        if self._log_follows is None:
+            self._log_follows = dict()
+            self._log_follows_lock = threading.Lock()
+        if self._outbox is None:
+            self._outbox = list()
+            self._outbox_lock = threading.Lock()
+        if self._metrics is None:
+            self._metrics = JobCommMetrics()
+
+    def set_request_mode(self, mode: str, max_workers: int = REQUEST_WORKERS) -> None:
+        """
+        Sets how comm requests get handled, one of REQUEST_MODES.
+        :param mode: "sync" to handle them on the thread that receives them, or "async" to
+            hand them off to a pool of worker threads
+        :param max_workers: the number of worker threads, in async mode
+        """
+        if mode not in REQUEST_MODES:
+            raise ValueError(f"Unknown request mode '{mode}'")
+        if self._request_executor is not None:
+            self._request_executor.shutdown(wait=False)
+            self._request_executor = None
+        if mode == REQUEST_MODE_ASYNC:
+            self._request_executor = JobRequestExecutor(max_workers=max_workers)
+
+    def set_comm_capabilities(self, capabilities: List[str]) -> None:
+        """
+        Sets which of the COMM_CAPABILITIES the front end can handle. Unknown ones are
+        ignored, and by default messages are sent one at a time and uncompressed, so older
+        front ends that don't ask for anything keep getting plain messages.
+        :param capabilities: list of capability names, e.g. ["coalesce", "zlib"]
+        """
+        capabilities = frozenset(c for c in capabilities or [] if c in COMM_CAPABILITIES)
+        if COMM_CAPABILITY_COALESCE not in capabilities:
+            # don't leave anything stuck in the outbox
+            self.flush_comm_messages()
+        self._comm_capabilities = capabilities
 
     def start_job_status_loop(
         self,
         init_jobs: bool = False,
         cell_list: List[str] = None,
+        mode: str = None,
     ) -> None:
         """
-        Starts the job status lookup loop. This runs every LOOKUP_TIMER_INTERVAL seconds.
+        Starts the job status lookup loop. This runs at most every LOOKUP_TIMER_INTERVAL
+        seconds, or sooner if a job is due to be polled.
 
         :param init_jobs: If init_jobs=True, this attempts to (re-)initialize
             the JobManager's list of known jobs from the workspace.
         :param cell_list: from FE, the list of extant cell IDs
+        :param mode: one of LOOKUP_MODES. If given, sets the mode used by the loop,
+            otherwise the current mode is kept.
         """
-        self._running_lookup_loop = True
+        if mode is not None:
+            if mode not in LOOKUP_MODES:
+                raise ValueError(f"Unknown job status loop mode '{mode}'")
+            with self._lookup_lock:
+                self._lookup_mode = mode
         if init_jobs:
             try:
                 self._jm.initialize_jobs(cell_list)
@@ -243,32 +560,87 @@ class JobComm:
                     "name": getattr(e, "name", type(e).__name__),
                 }
                 self.send_comm_message("job_comm_err", error)
-        if self._lookup_timer is None:
-            self._lookup_job_status_loop()
+        with self._lookup_lock:
+            self._running_lookup_loop = True
+            if self._lookup_timer is not None or self._lookup_ticking:
+                # it's already running, and its next tick picks up any new jobs
+                return
+            self._lookup_ticking = True
+        self._lookup_job_status_loop()
 
     def stop_job_status_loop(self, *args, **kwargs) -> None:
         """
         Stops the job status lookup loop if it's running. Otherwise, this effectively
         does nothing.
         """
-        if self._lookup_timer:
-            self._lookup_timer.cancel()
-            self._lookup_timer = None
-        self._running_lookup_loop = False
+        with self._lookup_lock:
+            if self._lookup_timer:
+                self._lookup_timer.cancel()
+                self._lookup_timer = None
+            self._running_lookup_loop = False
+            self._last_job_updates = None
+            self._last_full_lookup = None
 
     def _lookup_job_status_loop(self) -> None:
         """
         Run a loop that will look up job info. After running, this spawns a Timer thread on
-        a loop to run itself again. LOOKUP_TIMER_INTERVAL sets the frequency at which the loop runs.
+        a loop to run itself again, once the next job is due to be polled (but within
+        LOOKUP_TIMER_INTERVAL seconds).
+
+        The caller sets _lookup_ticking first, under _lookup_lock, so only one of these
+        runs at a time.
         """
-        all_job_states = self._lookup_all_job_states()
-        if len(all_job_states) == 0 or not self._running_lookup_loop:
-            self.stop_job_status_loop()
-        else:
-            self._lookup_timer = threading.Timer(
-                LOOKUP_TIMER_INTERVAL, self._lookup_job_status_loop
-            )
-            self._lookup_timer.start()
+        ignore_refresh_flag = self._lookup_mode != LOOKUP_MODE_DELTA
+        try:
+            with self._metrics.track(STATUS_LOOP) as stats:
+                if self._lookup_mode == LOOKUP_MODE_DELTA:
+                    job_states = self._lookup_job_states_delta()
+                else:
+                    job_states = self._lookup_scheduled_job_states()
+                self._metrics.record_status_loop_jobs(stats, len(job_states))
+        except BaseException:
+            with self._lookup_lock:
+                self._lookup_ticking = False
+            raise
+        with self._lookup_lock:
+            self._lookup_ticking = False
+            if (
+                len(self._jm.get_job_ids_to_lookup(ignore_refresh_flag)) == 0
+                or not self._running_lookup_loop
+            ):
+                self.stop_job_status_loop()
+            else:
+                self._lookup_timer = threading.Timer(
+                    self._get_lookup_interval(ignore_refresh_flag),
+                    self._lookup_timer_fired,
+                )
+                self._lookup_timer.start()
+
+    def _lookup_timer_fired(self) -> None:
+        """
+        Runs the next tick of the status loop, from its Timer thread.
+        """
+        with self._lookup_lock:
+            # a Timer can fire just as the loop gets stopped, or stopped and started again,
+            # so it only runs if it's still the loop's current one
+            if threading.current_thread() is not self._lookup_timer:
+                return
+            self._lookup_timer = None
+            self._lookup_ticking = True
+        self._lookup_job_status_loop()
+
+    def _get_lookup_interval(self, ignore_refresh_flag: bool) -> float:
+        """
+        Returns the number of seconds until the next job is due to be polled, bounded
+        by MIN_LOOKUP_TIMER_INTERVAL and LOOKUP_TIMER_INTERVAL.
+        """
+        next_poll_time = self._jm.get_next_poll_time(ignore_refresh_flag)
+        if next_poll_time is None:
+            return LOOKUP_TIMER_INTERVAL
+        return min(
+            max(next_poll_time - time.time(), MIN_LOOKUP_TIMER_INTERVAL),
+            LOOKUP_TIMER_INTERVAL,
+        )
 
     def _lookup_all_job_states(self, req: JobRequest = None) -> dict:
         """
@@ -279,6 +651,71 @@ class JobComm:
         self.send_comm_message("job_status_all", all_job_states)
         return all_job_states
 
+    def _lookup_scheduled_job_states(self) -> dict:
+        """
+        Fetches status of the jobs in the current workspace that are due to be polled, and
+        sends them to the front end as a job_status_all message. The (cached) terminal job
+        states are included if it's been LOOKUP_TIMER_INTERVAL seconds since they were last
+        sent. Nothing is sent if there's nothing to send.
+        """
+        now = time.time()
+        include_terminal = (
+            self._last_full_lookup is None
+            or now - self._last_full_lookup >= LOOKUP_TIMER_INTERVAL
+        )
+        job_states = self._jm.lookup_scheduled_job_states(
+            ignore_refresh_flag=True, include_terminal=include_terminal
+        )
+        if include_terminal:
+            self._last_full_lookup = now
+        if include_terminal or len(job_states):
+            self.send_comm_message("job_status_all", job_states)
+        return job_states
+
+    def _lookup_job_states_delta(self) -> dict:
+        """
+        Fetches the status of the jobs that are being listened to (i.e. refresh > 0) and are
+        terminal or due to be polled, and sends the states of those that are new or have a
+        different status or updated timestamp from the previous call as a job_status_delta
+        message. Nothing is sent if there are no changes.
+
+        Returns all the looked up job states, changed or not.
+        """
+        job_states = self._jm.lookup_scheduled_job_states()
+        if self._last_job_updates is None:
+            self._last_job_updates = dict()
+        delta_states = dict()
+        for job_id, output_state in job_states.items():
+            state = output_state.get("state", {})
+            job_update = (state.get("status"), state.get("updated"))
+            if self._last_job_updates.get(job_id) != job_update:
+                delta_states[job_id] = output_state
+            self._last_job_updates[job_id] = job_update
+
+        if len(delta_states):
+            self.send_comm_message("job_status_delta", delta_states)
+        return job_states
+
+    def get_metrics(self, reset: bool = False) -> dict:
+        """
+        Returns the metrics for the requests handled and the status loop, as described in
+        JobCommMetrics.get_metrics.
+        :param reset: if True, the metrics are reset after they're fetched
+        """
+        metrics = self._metrics.get_metrics()
+        if reset:
+            self._metrics.reset()
+        return metrics
+
+    def _send_metrics(self, req: JobRequest) -> dict:
+        """
+        Sends the metrics as a job_comm_metrics message. If the request has "reset" set,
+        they're reset afterward.
+        """
+        metrics = self.get_metrics(reset=bool(req.rq_data.get("reset")))
+        self.send_comm_message("job_comm_metrics", metrics)
+        return metrics
+
     def _lookup_job_info(self, req: JobRequest) -> dict:
         """
         Looks up job info. This is just some high-level generic information about the running
@@ -344,6 +781,22 @@ class JobComm:
         self.send_comm_message("job_status", output_states)
         return output_states
 
+    def _lookup_batch_summary(self, req: JobRequest) -> dict:
+        """
+        Sends a summary of a batch job, with the states of the batch parent and only those
+        children whose state has changed since the summary seq given as "since" in the
+        request. Without one, all the children are sent. The full child states can still be
+        had with job_status_batch.
+        """
+        result = self._jm.lookup_batch_summary(req.job_id, req.rq_data.get("since"))
+        content = {
+            "batch_id": req.job_id,
+            "summary": result["summary"],
+            "job_states": result["job_states"],
+        }
+        self.send_comm_message("job_status_batch_summary", content)
+        return content
+
     def _modify_job_updates(self, req: JobRequest) -> None:
         """
         Modifies how many things want to listen to a job update.
@@ -389,12 +842,25 @@ class JobComm:
         """
         This cancels a running job.
         If there are no valid jobs, this raises a ValueError.
-        If there's an error while attempting to cancel, this raises a NarrativeError.
-        In the end, after a successful cancel, this finishes up by fetching and returning the
-        job state with the new status.
+        In the end, this finishes up by fetching and returning the job states with the new
+        status. Then, for each job that couldn't be canceled, a job_comm_error is sent
+        with the job_id and the error.
         """
-        cancel_results = self._jm.cancel_jobs(req.job_id_list)
+        errors = dict()
+        cancel_results = self._jm.cancel_jobs(req.job_id_list, errors=errors)
         self.send_comm_message("job_status", cancel_results)
+        for job_id, e in errors.items():
+            self.send_error_message(
+                "job_comm_error",
+                req.request,
+                {
+                    "job_id": job_id,
+                    "name": getattr(e, "name", type(e).__name__),
+                    "message": getattr(e, "message", str(e)),
+                    "error": getattr(e, "error", UNKNOWN_REASON),
+                    "code": getattr(e, "code", -1),
+                },
+            )
 
     def _retry_jobs(self, req: JobRequest) -> None:
         retry_results = self._jm.retry_jobs(req.job_id_list)
@@ -426,6 +892,88 @@ class JobComm:
         log_output["latest"] = latest_only
         self.send_comm_message("job_logs", log_output)
 
+    def _follow_job_logs(self, req: JobRequest) -> None:
+        """
+        Starts following a job's log. New lines, starting from the request's first_line
+        (default 0), are sent as job_logs messages with "following": True. Lines are checked
+        for every LOG_FOLLOW_INTERVAL seconds, and any new ones are sent together in one
+        message of up to LOG_FOLLOW_MAX_LINES lines. Once the job is terminal and all of its
+        log has been sent, a last message is sent with "following": False and this stops.
+
+        If the job is already being followed, this starts over from first_line.
+        """
+        self._jm.get_job(req.job_id)  # raises a JobIDException if it's not a known job
+        with self._log_follows_lock:
+            old_follow = self._log_follows.get(req.job_id)
+            self._log_follows[req.job_id] = {
+                "next_line": max(req.rq_data.get("first_line", 0), 0),
+                "timer": None,
+            }
+        if old_follow is not None and old_follow["timer"] is not None:
+            old_follow["timer"].cancel()
+        self._send_followed_job_logs(req.job_id)
+
+    def _stop_following_job_logs(self, req: JobRequest) -> None:
+        self.stop_following_job_logs(req.job_id)
+
+    def stop_following_job_logs(self, job_id: str = None) -> None:
+        """
+        Stops following the log of the given job, or of all jobs if job_id is None.
+        """
+        with self._log_follows_lock:
+            job_ids = list(self._log_follows.keys()) if job_id is None else [job_id]
+            follows = [self._log_follows.pop(follow_id, None) for follow_id in job_ids]
+        for follow in follows:
+            if follow is not None and follow["timer"] is not None:
+                follow["timer"].cancel()
+
+    def _send_followed_job_logs(self, job_id: str) -> None:
+        """
+        Sends any new log lines for a followed job, then sets a Timer to do it again unless
+        the job's done.
+        """
+        with self._log_follows_lock:
+            follow = self._log_follows.get(job_id)
+        if follow is None:
+            return
+        try:
+            # check this first, so once it's terminal the log fetch gets the rest of it
+            is_terminal = self._jm.get_job(job_id).is_terminal()
+            log_output = self._jm.get_job_logs(
+                job_id, first_line=follow["next_line"], num_lines=LOG_FOLLOW_MAX_LINES
+            )
+        except Exception as e:
+            self.stop_following_job_logs(job_id)
+            self.send_error_message(
+                "job_comm_error",
+                "job_logs_follow",
+                {
+                    "job_id": job_id,
+                    "name": getattr(e, "name", type(e).__name__),
+                    "message": getattr(e, "message", str(e)),
+                },
+            )
+            return
+
+        follow["next_line"] = log_output["first"] + len(log_output["lines"])
+        following = not is_terminal or follow["next_line"] < log_output["max_lines"]
+        if log_output["lines"] or not following:
+            log_output["latest"] = False
+            log_output["following"] = following
+            self.send_comm_message("job_logs", log_output)
+
+        with self._log_follows_lock:
+            # it may have been stopped or restarted while this was running
+            if self._log_follows.get(job_id) is not follow:
+                return
+            if following:
+                follow["timer"] = threading.Timer(
+                    LOG_FOLLOW_INTERVAL, self._send_followed_job_logs, [job_id]
+                )
+                follow["timer"].start()
+            else:
+                del self._log_follows[job_id]
+
     def _handle_comm_message(self, msg: dict) -> None:
         """
         Handles comm messages that come in from the other end of the KBaseJobs channel.
@@ -436,6 +984,9 @@ class JobComm:
 
         Any unknown request is returned over the channel as a job_comm_error, and a
         ValueError is raised.
+
+        In async request mode, the handlers are run by the request executor, and any errors
+        they raise are returned over the channel as a job_comm_error, but not raised here.
         """
         with exc_to_msg(msg):
             requests = JobRequest.translate(msg)
@@ -444,17 +995,121 @@ class JobComm:
                 kblogging.log_event(
                     self._log, "handle_comm_message", {"msg": request.request}
                 )
-                if request.request in self._msg_map:
-                    self._msg_map[request.request](request)
-                else:
+                if request.request not in self._msg_map:
                     raise ValueError(f"Unknown KBaseJobs message '{request.request}'")
+                if self._request_executor is None:
+                    with self._metrics.track(request.request):
+                        self._msg_map[request.request](request)
+                else:
+                    self._submit_request(request)
+
+    def _submit_request(self, req: JobRequest) -> Future:
+        """
+        Hands a request to the request executor, in async request mode. Interactive requests
+        are run ahead of the rest, and lookups don't hold up other lookups for the same jobs.
+        A lookup with the same request data as one that's still waiting to run is dropped,
+        and lookups that run at the same time share their EE2 calls (see LOOKUP_REQUESTS).
+        """
+        job_ids = self._get_request_job_ids(req)
+        if req.request in INTERACTIVE_REQUESTS:
+            return self._request_executor.submit(
+                job_ids, self._run_request, req, priority=REQUEST_PRIORITY_INTERACTIVE
+            )
+        if req.request in LOOKUP_REQUESTS:
+            return self._request_executor.submit(
+                job_ids,
+                self._run_request,
+                req,
+                priority=REQUEST_PRIORITY_LOOKUP,
+                blocking=False,
+                dedupe_key=(req.request, json.dumps(req.rq_data, sort_keys=True, default=str)),
+            )
+        return self._request_executor.submit(job_ids, self._run_request, req)
+
+    @staticmethod
+    def _get_request_job_ids(req: JobRequest) -> List[str]:
+        input_ = req.input()
+        if input_ is None:
+            return []
+        job_ids = input_[1] if isinstance(input_[1], list) else [input_[1]]
+        # malformed ids get their errors from the handler, they don't need ordering
+        return [job_id for job_id in job_ids if isinstance(job_id, str)]
+
+    def _run_request(self, req: JobRequest) -> None:
+        """
+        Runs the handler for a request in async request mode. Errors are sent over the
+        channel and logged.
+        """
+        try:
+            with exc_to_msg(req), self._metrics.track(req.request):
+                self._msg_map[req.request](req)
+        except Exception as e:
+            kblogging.log_event(
+                self._log, "handle_comm_message_error", {"msg": req.request, "err": str(e)}
+            )
 
     def send_comm_message(self, msg_type: str, content: dict) -> None:
         """
         Sends a ipykernel.Comm message to the KBaseJobs channel with the given msg_type
         and content. These just get encoded into the message itself.
         """
+        self._metrics.record_message(content)
         msg = {"msg_type": msg_type, "content": content}
+        if COMM_CAPABILITY_COALESCE not in self._comm_capabilities:
+            self._send_comm_data(msg)
+            return
+        with self._outbox_lock:
+            last_msg = self._outbox[-1] if self._outbox else None
+            if (
+                last_msg is not None
+                and last_msg["msg_type"] == msg_type
+                and msg_type in COALESCED_MSG_TYPES
+                and isinstance(content, dict)
+                and isinstance(last_msg["content"], dict)
+            ):
+                # later states for the same job replace earlier ones
+                last_msg["content"] = {**last_msg["content"], **content}
+            else:
+                self._outbox.append(msg)
+            if self._outbox_timer is None:
+                self._outbox_timer = threading.Timer(
+                    COALESCE_WINDOW, self.flush_comm_messages
+                )
+                self._outbox_timer.daemon = True
+                self._outbox_timer.start()
+
+    def flush_comm_messages(self) -> None:
+        """
+        Sends any messages waiting in the outbox right away.
+        """
+        with self._outbox_lock:
+            if self._outbox_timer is not None:
+                self._outbox_timer.cancel()
+                self._outbox_timer = None
+            messages = self._outbox
+            self._outbox = list()
+        if len(messages) == 1:
+            self._send_comm_data(messages[0])
+        elif messages:
+            self._send_comm_data(
+                {"msg_type": BATCH_MSG_TYPE, "content": {"messages": messages}}
+            )
+
+    def _send_comm_data(self, msg: dict) -> None:
+        """
+        Sends a message over the comm channel, compressing it first if it's big enough and
+        the front end can handle that.
+        """
+        if COMM_CAPABILITY_ZLIB in self._comm_capabilities:
+            encoded = json.dumps(msg).encode("utf-8")
+            if len(encoded) >= COMPRESS_THRESHOLD:
+                msg = {
+                    "msg_type": COMPRESSED_MSG_TYPE,
+                    "content": {
+                        "encoding": "zlib+base64",
+                        "data": base64.b64encode(zlib.compress(encoded)).decode("ascii"),
+                    },
+                }
         self._comm.send(msg)
 
     def send_error_message(
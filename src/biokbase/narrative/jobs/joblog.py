@@ -0,0 +1,132 @@
+"""
+Storage for job logs, fetched from the execution engine as they're needed.
+"""
+import threading
+from typing import Iterator, List, Tuple
+import biokbase.narrative.clients as clients
+from .jobmetrics import count_ee2_calls
+
+LOG_CHUNK_SIZE = 1000
+
+
+class JobLog:
+    """
+    An append-only store for one job's log lines.
+
+    Lines are kept by position in chunks of LOG_CHUNK_SIZE lines. Each chunk has a list of
+    line strings (None for lines not fetched yet) and a bytearray of is_error flags, rather
+    than a dict per line. Only the ranges of lines that are asked for and not already
+    stored are fetched from ee2.get_job_logs, so e.g. the last 100 lines of a very long
+    log can be returned without fetching the rest of it.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        # number of lines available in the log, as of the last fetch
+        self.num_lines = 0
+        # set once the job is done and the whole log has been counted, so there's no need
+        # to check ee2 for new lines
+        self.complete = False
+        # keys = chunk index, values = (list of line strings or None, bytearray of flags)
+        self._chunks = dict()
+        self._lock = threading.RLock()
+
+    def get_lines(
+        self, first_line: int = 0, num_lines: int = None, latest_only: bool = False
+    ) -> Tuple[int, List[dict]]:
+        """
+        Returns a 2-tuple of (number of available log lines, list of log lines), fetching
+        anything new or missing from ee2 first. Each line is a dict with keys "line" and
+        "is_error".
+
+        :param first_line: int - the first line to return (0-indexed). Ignored if
+            latest_only is True.
+        :param num_lines: int - the maximum number of lines to return. If None, returns
+            everything from first_line to the end of the log.
+        :param latest_only: bool - if True, return the last num_lines lines
+        """
+        first_line = max(first_line, 0)
+        if num_lines is not None:
+            num_lines = max(num_lines, 0)
+
+        with self._lock:
+            if not self.complete:
+                # check for new lines. If just a window of lines is wanted, the limit
+                # keeps this from pulling in the whole log when it's first seen
+                self._fetch(
+                    self.num_lines, None if num_lines is None else max(num_lines, 1)
+                )
+
+            if latest_only:
+                first_line = (
+                    0 if num_lines is None else max(self.num_lines - num_lines, 0)
+                )
+            end = (
+                self.num_lines
+                if num_lines is None
+                else min(first_line + num_lines, self.num_lines)
+            )
+            if first_line >= end:
+                return (self.num_lines, list())
+
+            for start, stop in self._missing_ranges(first_line, end):
+                self._fetch(start, stop - start)
+            return (self.num_lines, self._read(first_line, end))
+
+    def _fetch(self, skip_lines: int, limit: int = None) -> None:
+        """
+        Fetches lines from ee2, starting at skip_lines, and stores them. last_line_number
+        from ee2 is the total number of lines in the log.
+        """
+        params = {"job_id": self.job_id, "skip_lines": skip_lines}
+        if limit is not None:
+            params["limit"] = limit
+        ee2 = count_ee2_calls(clients.get("execution_engine2"))
+        log_update = ee2.get_job_logs(params)
+        lines = log_update.get("lines", [])
+        self._store(skip_lines, lines)
+        self.num_lines = max(
+            self.num_lines,
+            log_update.get("last_line_number", 0),
+            skip_lines + len(lines),
+        )
+
+    def _store(self, first_line: int, lines: List[dict]) -> None:
+        for pos, line in enumerate(lines, first_line):
+            chunk_idx, idx = divmod(pos, LOG_CHUNK_SIZE)
+            if chunk_idx not in self._chunks:
+                self._chunks[chunk_idx] = (
+                    [None] * LOG_CHUNK_SIZE,
+                    bytearray(LOG_CHUNK_SIZE),
+                )
+            texts, flags = self._chunks[chunk_idx]
+            texts[idx] = line.get("line", "")
+            flags[idx] = 1 if line.get("is_error") else 0
+
+    def _missing_ranges(self, first_line: int, end: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, stop) ranges of lines between first_line and end that aren't stored.
+        """
+        start = None
+        for pos in range(first_line, end):
+            chunk = self._chunks.get(pos // LOG_CHUNK_SIZE)
+            missing = chunk is None or chunk[0][pos % LOG_CHUNK_SIZE] is None
+            if missing and start is None:
+                start = pos
+            elif not missing and start is not None:
+                yield (start, pos)
+                start = None
+        if start is not None:
+            yield (start, end)
+
+    def _read(self, first_line: int, end: int) -> List[dict]:
+        lines = list()
+        for pos in range(first_line, end):
+            chunk = self._chunks.get(pos // LOG_CHUNK_SIZE)
+            if chunk is None or chunk[0][pos % LOG_CHUNK_SIZE] is None:
+                # ee2 returned fewer lines than it said it had
+                continue
+            texts, flags = chunk
+            idx = pos % LOG_CHUNK_SIZE
+            lines.append({"is_error": flags[idx], "line": texts[idx]})
+        return lines
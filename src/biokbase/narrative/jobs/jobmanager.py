@@ -1,14 +1,19 @@
 from IPython.display import HTML
 from jinja2 import Template
 from datetime import datetime, timezone, timedelta
-import copy
-from typing import List, Tuple
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Set, Tuple
 import biokbase.narrative.clients as clients
 from .job import (
     Job,
     EXCLUDED_JOB_STATE_FIELDS,
     JOB_INIT_EXCLUDED_JOB_STATE_FIELDS,
 )
+from .jobmetrics import count_ee2_calls, run_in_context
+from .jobsnapshot import JobStateSnapshot
 from biokbase.narrative.common import kblogging
 from biokbase.narrative.app_util import system_variable
 from biokbase.narrative.exception_util import (
@@ -35,6 +40,177 @@ JOB_NOT_BATCH_ERR = "Job ID is not for a batch job"
 JOBS_TYPE_ERR = "List expected for job_id_list"
 JOBS_MISSING_FALSY_ERR = "Job IDs are missing or all falsy"
 
+# Job status polling intervals, in seconds.
+# Each job has its own next poll time. A job is polled at the base interval for its status,
+# and every poll that finds the status unchanged backs its interval off by
+# POLL_BACKOFF_FACTOR, up to the max interval for the status.
+# keys = job status, values = (base interval, max interval)
+POLL_INTERVALS = {
+    "created": (5, 30),
+    "estimating": (5, 30),
+    "queued": (10, 300),
+    "running": (5, 60),
+}
+DEFAULT_POLL_INTERVALS = (5, 60)
+# interval for jobs that something just started listening to
+HOT_POLL_INTERVAL = 2
+POLL_BACKOFF_FACTOR = 1.5
+
+# cancel_jobs makes its ee2 cancel_job calls on up to this many threads at once
+CANCEL_JOBS_WORKERS = 8
+
+# When there's a job state snapshot, the workspace's jobs are listed without these (possibly
+# large) fields, and only the jobs that aren't in the snapshot get fully looked up.
+SNAPSHOT_LISTING_EXCLUDED_FIELDS = EXCLUDED_JOB_STATE_FIELDS + [
+    "job_output",
+    "error",
+    "errormsg",
+]
+
+
+# the job fields that query_jobs and list_jobs can sort by
+JOB_LIST_SORT_KEYS = [
+    "job_id",
+    "app_id",
+    "user",
+    "status",
+    "created",
+    "updated",
+    "running",
+    "finished",
+]
+JOB_LIST_TEMPLATE = Template(
+    """
+<table class="table table-bordered table-striped table-condensed">
+    <tr>
+        <th>Id</th>
+        <th>Name</th>
+        <th>Submitted</th>
+        <th>Submitted By</th>
+        <th>Status</th>
+        <th>Run Time</th>
+        <th>Complete Time</th>
+    </tr>
+    {% for j in jobs %}
+    <tr>
+        <td>{{ j.job_id|e }}</td>
+        <td>{{ j.app_id|e }}</td>
+        <td>{{ j.created|e }}</td>
+        <td>{{ j.user|e }}</td>
+        <td>{{ j.status|e }}</td>
+        <td>{{ j.run_time|e }}</td>
+        <td>{% if j.finish_time %}{{ j.finish_time|e }}{% else %}Incomplete{% endif %}</td>
+    </tr>
+    {% endfor %}
+</table>
+{% if total > jobs|length %}<p>Showing jobs {{ first }}-{{ last }} of {{ total }}</p>{% endif %}
+"""
+)
+
+
+def _format_job_time(timestamp: int) -> str:
+    """
+    Formats an ee2 timestamp (epoch ms) as a local time.
+    """
+    return datetime.fromtimestamp(timestamp / 1000.0).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_run_time(seconds: float) -> str:
+    """
+    Formats a run time, without the fractions of a second.
+    """
+    return str(timedelta(seconds=int(seconds)))
+
+
+class JobStateFetcher:
+    """
+    Fetches job states from EE2, sharing the fetches between threads that want the same
+    jobs at the same time. A thread that asks for a job that's already being fetched waits
+    for that fetch instead of making its own, and the jobs asked for while a fetch is
+    running are all fetched together in the next one, by one of the threads waiting on them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # keys = job_id, values = Future of its (state, error) from a running or queued fetch
+        self._in_flight = dict()
+        # job ids waiting for the next fetch
+        self._queued = list()
+        # job ids in the running fetch
+        self._fetching = set()
+        self._is_fetching = False
+
+    def fetch(self, job_ids: List[str], errors: dict = None) -> dict:
+        """
+        Like Job.query_ee2_states(job_ids, init=False, errors=errors).
+        """
+        with self._cond:
+            futures = dict()
+            for job_id in job_ids:
+                if job_id not in self._in_flight:
+                    self._in_flight[job_id] = Future()
+                    self._queued.append(job_id)
+                futures[job_id] = self._in_flight[job_id]
+            while not all(future.done() for future in futures.values()):
+                if self._is_fetching:
+                    self._cond.wait()
+                    continue
+                # run the next fetch, for everything that's queued
+                batch = {job_id: self._in_flight[job_id] for job_id in self._queued}
+                self._queued = list()
+                self._fetching = set(batch)
+                self._is_fetching = True
+                self._cond.release()
+                try:
+                    self._fetch_batch(batch)
+                finally:
+                    self._cond.acquire()
+                    self._fetching = set()
+                    self._is_fetching = False
+                    self._cond.notify_all()
+
+        states = dict()
+        for job_id, future in futures.items():
+            state, error = future.result()
+            if state is not None:
+                states[job_id] = state
+            if error is not None and errors is not None:
+                errors[job_id] = error
+        return states
+
+    def _fetch_batch(self, batch: dict) -> None:
+        """
+        :param batch: dict, keys = job ids to fetch, values = the Futures to set
+        """
+        errors = dict()
+        states = exception = None
+        try:
+            states = Job.query_ee2_states(list(batch), init=False, errors=errors)
+        except BaseException as e:
+            exception = e
+        with self._cond:
+            for job_id, future in batch.items():
+                if self._in_flight.get(job_id) is future:
+                    del self._in_flight[job_id]
+        for job_id, future in batch.items():
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result((states.get(job_id), errors.get(job_id)))
+        if exception is not None and not isinstance(exception, Exception):
+            raise exception
+
+    def forget(self, job_ids: List[str]) -> None:
+        """
+        Makes later fetches of these jobs start anew, instead of waiting for a fetch that's
+        already running, e.g. once they've been canceled, as that fetch may be out of date.
+        """
+        with self._cond:
+            for job_id in job_ids:
+                if job_id in self._fetching:
+                    self._fetching.discard(job_id)
+                    del self._in_flight[job_id]
+
 
 def get_error_output_state(job_id, error="does_not_exist"):
     if error not in ["does_not_exist", "ee2_error"]:
@@ -51,9 +227,49 @@ class JobManager(object):
 
     __instance = None
 
-    # keys = job_id, values = { refresh = 1/0, job = Job object }
+    # keys = job_id, values = {
+    #     refresh = 1/0, job = Job object,
+    #     poll_at = time of the next status poll, poll_interval = current poll interval (s),
+    #     poll_status = status as of the last poll
+    # }
     _running_jobs = dict()
 
+    # Secondary indexes of the jobs in _running_jobs, kept up to date by _index_job as jobs
+    # are registered and their states change.
+    # keys = cell_id, values = set of job_ids
+    _jobs_by_cell_id = dict()
+    # keys = batch_id, values = set of child job_ids (not including the batch parent)
+    _jobs_by_batch_id = dict()
+    # keys = status, values = set of job_ids
+    _jobs_by_status = dict()
+    # keys = job_id, values = (cell_id, batch_id, status) it's indexed under
+    _job_index_keys = dict()
+    # keys = batch_id, values = a summary of the batch's registered children, kept up to
+    # date by _update_batch_summary: {
+    #     statuses = {child job_id: status}, status_counts = {status: count},
+    #     created = earliest child created time, updated = latest child updated time,
+    #     seqs = {child job_id: _batch_summary_seq value when its state last changed},
+    #     seq = the latest of the seqs
+    # }
+    _batch_summaries = dict()
+    # numbers the batch summary updates, so a caller of get_batch_summary can ask for the
+    # children that changed since the summary it last had. It's never reset, so numbers from
+    # before a re-initialization still work.
+    _batch_summary_seq = itertools.count(1)
+    # guards _running_jobs and the indexes, which the status loop, comm handler, and (in
+    # async request mode) request worker threads all use. It's reentrant, as registering a
+    # job indexes it.
+    _index_lock = threading.RLock()
+
+    # the JobStateSnapshot of terminal jobs for this workspace, if snapshots are set up,
+    # and the set of job ids that have been queued to be saved in it
+    _snapshot = None
+    _snapshot_job_ids = set()
+    _snapshot_lock = threading.Lock()
+
+    # shares EE2 state lookups between threads that want the same jobs at once
+    _state_fetcher = JobStateFetcher()
+
     _log = kblogging.get_logger(__name__)
 
     def __new__(cls):
@@ -82,43 +298,119 @@ class JobManager(object):
         2. get list of jobs with that ws id from ee2 (also gets tag, cell_id, run_id)
         3. initialize the Job objects and add them to the running jobs list
         4. start the status lookup loop.
+
+        If there's a snapshot of terminal job states for the workspace (see
+        jobsnapshot.SNAPSHOT_DIR_ENV), the jobs are listed without their large fields, and
+        only those that aren't in the snapshot, or have changed since, are fully looked up.
+        The snapshot is then updated.
         """
         ws_id = system_variable("workspace_id")
         job_states = dict()
         kblogging.log_event(self._log, "JobManager.initialize_jobs", {"ws_id": ws_id})
+        if self._snapshot is not None:
+            # so any states still queued for it are in the file before it's loaded again
+            self._snapshot.flush()
+        self._snapshot = JobStateSnapshot.for_workspace(ws_id)
+        snapshot_states = self._snapshot.load() if self._snapshot else dict()
         try:
-            job_states = clients.get("execution_engine2").check_workspace_jobs(
+            ee2 = count_ee2_calls(clients.get("execution_engine2"))
+            job_states = ee2.check_workspace_jobs(
                 {
                     "workspace_id": ws_id,
                     "return_list": 0,  # do not remove
-                    "exclude_fields": JOB_INIT_EXCLUDED_JOB_STATE_FIELDS,
+                    "exclude_fields": (
+                        SNAPSHOT_LISTING_EXCLUDED_FIELDS
+                        if snapshot_states
+                        else JOB_INIT_EXCLUDED_JOB_STATE_FIELDS
+                    ),
                 }
             )
+            if snapshot_states:
+                job_states = self._merge_snapshot_states(job_states, snapshot_states)
         except Exception as e:
             kblogging.log_event(self._log, "init_error", {"err": str(e)})
             new_e = transform_job_exception(e, "Unable to initialize jobs")
             raise new_e
 
-        self._running_jobs = dict()
         job_states = self._reorder_parents_children(job_states)
-
-        for job_state in job_states.values():
-            child_jobs = None
-            if job_state.get("batch_job"):
-                child_jobs = [
-                    self.get_job(child_id)
-                    for child_id in job_state.get("child_jobs", [])
-                ]
-
-            job = Job(job_state, children=child_jobs)
-
-            # Set to refresh when job is not in terminal state
-            # and when job is present in cells (if given)
-            refresh = not job.was_terminal()
+        with self._index_lock:
+            self._running_jobs = dict()
+            self._jobs_by_cell_id = dict()
+            self._jobs_by_batch_id = dict()
+            self._jobs_by_status = dict()
+            self._job_index_keys = dict()
+            self._batch_summaries = dict()
+
+            for job_state in job_states.values():
+                child_jobs = None
+                if job_state.get("batch_job"):
+                    child_jobs = [
+                        self.get_job(child_id)
+                        for child_id in job_state.get("child_jobs", [])
+                    ]
+
+                job = Job(job_state, children=child_jobs)
+
+                # Set to refresh when job is not in terminal state
+                self.register_new_job(job, int(not job.was_terminal()))
+
+            # and when job is present in cells (if given). A batch job is in the cells
+            # that any of its children are in.
             if cell_ids is not None:
-                refresh = refresh and job.in_cells(cell_ids)
+                in_cells = self.get_job_ids_by_cell(cell_ids)
+                for job_id, job_info in self._running_jobs.items():
+                    if job_info["job"].batch_job:
+                        in_cell = not self._jobs_by_batch_id.get(
+                            job_id, set()
+                        ).isdisjoint(in_cells)
+                    else:
+                        in_cell = job_id in in_cells
+                    if not in_cell:
+                        job_info["refresh"] = 0
+
+        self._save_snapshot(rewrite=True)
 
-            self.register_new_job(job, int(refresh))
+    @staticmethod
+    def _merge_snapshot_states(listed_states: dict, snapshot_states: dict) -> dict:
+        """
+        Given the trimmed states of all the workspace's jobs, returns their full states,
+        keeping the order. These come from the snapshot where it's still current, and from ee2
+        for the rest.
+        """
+        to_fetch = [
+            job_id
+            for job_id, state in listed_states.items()
+            if job_id not in snapshot_states
+            or not JobStateSnapshot.is_current(snapshot_states[job_id], state)
+        ]
+        fetched_states = Job.query_ee2_states(to_fetch, init=True)
+        return {
+            job_id: fetched_states.get(job_id, snapshot_states.get(job_id, state))
+            for job_id, state in listed_states.items()
+        }
+
+    def _save_snapshot(self, rewrite: bool = False) -> None:
+        """
+        Queues the states of the terminal jobs that aren't in the snapshot yet to be added to
+        it, if there's one. With rewrite, the snapshot is replaced with all the terminal jobs'
+        states instead, which drops any jobs that aren't in the workspace any more. Either
+        way, the snapshot writes them on its own thread, a little later (see
+        JobStateSnapshot.save_later).
+        """
+        if self._snapshot is None:
+            return
+        with self._snapshot_lock:
+            if rewrite:
+                self._snapshot_job_ids = set()
+            new_states = {
+                job_info["job"].job_id: dict(job_info["job"]._acc_state)
+                for job_info in list(self._running_jobs.values())
+                if job_info["job"].job_id not in self._snapshot_job_ids
+                and job_info["job"].was_terminal()
+            }
+            if new_states or rewrite:
+                self._snapshot.save_later(new_states, rewrite=rewrite)
+                self._snapshot_job_ids.update(new_states)
 
     def _create_jobs(self, job_ids) -> dict:
         """
@@ -129,13 +421,7 @@ class JobManager(object):
         if not len(job_ids):
             return {}
 
-        job_states = clients.get("execution_engine2").check_jobs(
-            {
-                "job_ids": job_ids,
-                "exclude_fields": JOB_INIT_EXCLUDED_JOB_STATE_FIELDS,
-                "return_list": 0,
-            }
-        )
+        job_states = Job.query_ee2_states(job_ids, init=True)
         for job_state in job_states.values():
             # set new jobs to be automatically refreshed
             self.register_new_job(job=Job(job_state), refresh=1)
@@ -160,8 +446,10 @@ class JobManager(object):
 
         job_ids = []
         error_ids = []
+        seen = set()
         for input_id in input_ids:
-            if input_id and input_id not in job_ids + error_ids:
+            if input_id and input_id not in seen:
+                seen.add(input_id)
                 if input_id in self._running_jobs:
                     job_ids.append(input_id)
                 else:
@@ -172,85 +460,186 @@ class JobManager(object):
 
         return job_ids, error_ids
 
-    def list_jobs(self):
+    def query_jobs(
+        self,
+        status=None,
+        app_id=None,
+        user=None,
+        created_after: int = None,
+        created_before: int = None,
+        sort_by: str = "created",
+        reverse: bool = False,
+        offset: int = 0,
+        limit: int = None,
+    ) -> dict:
+        """
+        Returns a page of the registered jobs, filtered and sorted. This uses the job states
+        as of their last lookup, and doesn't look anything up itself.
+
+        :param status: str or list of str - only jobs with (one of) these statuses
+        :param app_id: str or list of str - only jobs for (one of) these apps
+        :param user: str or list of str - only jobs run by (one of) these users
+        :param created_after: int - only jobs created at or after this time (epoch ms)
+        :param created_before: int - only jobs created before this time (epoch ms)
+        :param sort_by: str - one of JOB_LIST_SORT_KEYS. Jobs without a value go last.
+        :param reverse: bool - if True, sort in descending order
+        :param offset: int - the number of matching jobs to skip
+        :param limit: int - the maximum number of jobs to return, or None for all of them
+        :return: dict with keys
+            total: int - the number of matching jobs
+            offset: int
+            limit: int or None
+            jobs: list of dicts, with keys job_id, app_id, user, status, batch_id, cell_id
+                and the created, updated, running and finished times (epoch ms, or None)
+        """
+        if sort_by not in JOB_LIST_SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort_by}'")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must not be negative")
+
+        def as_set(value):
+            if value is None:
+                return None
+            return {value} if isinstance(value, str) else set(value)
+
+        app_ids = as_set(app_id)
+        users = as_set(user)
+        if status is None:
+            job_ids = list(self._running_jobs.keys())
+        else:
+            job_ids = self.get_job_ids_by_status(as_set(status))
+
+        rows = list()
+        for job_id in job_ids:
+            job = self._running_jobs[job_id]["job"]
+            state = job._acc_state
+            created = state.get("created")
+            if created_after is not None and (created is None or created < created_after):
+                continue
+            if created_before is not None and (created is None or created >= created_before):
+                continue
+            row = {
+                "job_id": job_id,
+                "app_id": job.app_id,
+                "user": job.user,
+                "status": state.get("status"),
+                "batch_id": job.batch_id,
+                "cell_id": job.cell_id,
+                "created": created,
+                "updated": state.get("updated"),
+                "running": state.get("running"),
+                "finished": state.get("finished"),
+            }
+            if app_ids is not None and row["app_id"] not in app_ids:
+                continue
+            if users is not None and row["user"] not in users:
+                continue
+            rows.append(row)
+
+        # jobs without a value always go last, so they're sorted separately
+        with_value = [row for row in rows if row[sort_by] is not None]
+        without_value = [row for row in rows if row[sort_by] is None]
+        with_value.sort(key=lambda row: (row[sort_by], row["job_id"]), reverse=reverse)
+        without_value.sort(key=lambda row: row["job_id"], reverse=reverse)
+        rows = with_value + without_value
+
+        end = None if limit is None else offset + limit
+        return {
+            "total": len(rows),
+            "offset": offset,
+            "limit": limit,
+            "jobs": rows[offset:end],
+        }
+
+    def list_jobs(
+        self,
+        status=None,
+        app_id=None,
+        user=None,
+        created_after: int = None,
+        created_before: int = None,
+        sort_by: str = "created",
+        reverse: bool = False,
+        offset: int = 0,
+        limit: int = None,
+        output: str = "html",
+    ):
         """
-        List all job ids, their info, and status in a quick HTML format.
+        List the job ids, their info, and status, in a quick HTML format.
+        The filtering, sorting and paging parameters are the same as for query_jobs. By
+        default, every job is listed; pass a limit (and offset) to list a page at a time.
+
+        :param output: str - "html" for an HTML table, or "json" for the query_jobs results
         """
+        if output not in ["html", "json"]:
+            raise ValueError(f"Unknown output format '{output}'")
         try:
-            all_states = self.lookup_all_job_states(ignore_refresh_flag=True)
-            state_list = [copy.deepcopy(s["state"]) for s in all_states.values()]
+            result = self.query_jobs(
+                status=status,
+                app_id=app_id,
+                user=user,
+                created_after=created_after,
+                created_before=created_before,
+                sort_by=sort_by,
+                reverse=reverse,
+                offset=offset,
+                limit=limit,
+            )
+            if output == "json":
+                return result
 
-            if not len(state_list):
+            if not len(self._running_jobs):
                 return "No running jobs!"
-
-            state_list = sorted(state_list, key=lambda s: s.get("created", 0))
-            for state in state_list:
-                job = self.get_job(state["job_id"])
-                state["created"] = datetime.fromtimestamp(
-                    state["created"] / 1000.0
-                ).strftime("%Y-%m-%d %H:%M:%S")
-                state["run_time"] = "Not started"
-                state["owner"] = job.user
-                state["app_id"] = job.app_id
-                exec_start = state.get("running", None)
-
-                if state.get("finished"):
-                    finished_time = datetime.fromtimestamp(
-                        state.get("finished") / 1000.0
-                    )
-                    state["finish_time"] = finished_time.strftime("%Y-%m-%d %H:%M:%S")
+            if not len(result["jobs"]):
+                return "No matching jobs!"
+
+            now = datetime.now(timezone.utc)
+            job_list = list()
+            for row in result["jobs"]:
+                job = dict(row)
+                if row["created"] is not None:
+                    job["created"] = _format_job_time(row["created"])
+                job["run_time"] = "Not started"
+                exec_start = row["running"]
+                if row["finished"]:
+                    job["finish_time"] = _format_job_time(row["finished"])
                     if exec_start:
-                        exec_start_time = datetime.fromtimestamp(exec_start / 1000.0)
-                        delta = finished_time - exec_start_time
-                        delta = delta - timedelta(microseconds=delta.microseconds)
-                        state["run_time"] = str(delta)
+                        job["run_time"] = _format_run_time(
+                            (row["finished"] - exec_start) / 1000.0
+                        )
                 elif exec_start:
-                    exec_start_time = datetime.fromtimestamp(
-                        exec_start / 1000.0
-                    ).replace(tzinfo=timezone.utc)
-                    delta = datetime.now(timezone.utc) - exec_start_time
-                    delta = delta - timedelta(microseconds=delta.microseconds)
-                    state["run_time"] = str(delta)
-
-            tmpl = """
-            <table class="table table-bordered table-striped table-condensed">
-                <tr>
-                    <th>Id</th>
-                    <th>Name</th>
-                    <th>Submitted</th>
-                    <th>Submitted By</th>
-                    <th>Status</th>
-                    <th>Run Time</th>
-                    <th>Complete Time</th>
-                </tr>
-                {% for j in jobs %}
-                <tr>
-                    <td>{{ j.job_id|e }}</td>
-                    <td>{{ j.app_id|e }}</td>
-                    <td>{{ j.created|e }}</td>
-                    <td>{{ j.user|e }}</td>
-                    <td>{{ j.status|e }}</td>
-                    <td>{{ j.run_time|e }}</td>
-                    <td>{% if j.finish_time %}{{ j.finish_time|e }}{% else %}Incomplete{% endif %}</td>
-                </tr>
-                {% endfor %}
-            </table>
-            """
-            return HTML(Template(tmpl).render(jobs=state_list))
+                    job["run_time"] = _format_run_time(
+                        now.timestamp() - exec_start / 1000.0
+                    )
+                job_list.append(job)
+
+            return HTML(
+                JOB_LIST_TEMPLATE.render(
+                    jobs=job_list,
+                    first=offset + 1,
+                    last=offset + len(job_list),
+                    total=result["total"],
+                )
+            )
 
         except Exception as e:
             kblogging.log_event(self._log, "list_jobs.error", {"err": str(e)})
             raise
 
-    def _construct_job_output_state_set(self, job_ids: list, states: dict = None) -> dict:
+    def _construct_job_output_state_set(
+        self, job_ids: list, states: dict = None, force_refresh: bool = False
+    ) -> dict:
         """
         Builds a set of job states for the list of job ids.
         :param states: dict, where each value is a state is from EE2
+        :param force_refresh: if True, terminal jobs without a state in states are
+            looked up in EE2 as well, instead of using their cached output state
         """
+        # if given, use 'em.
         # if cached, use 'em.
         # otherwise, lookup.
         # do transform
-        # cache terminal ones.
+        # (Job caches terminal ones.)
         # return all.
         if not isinstance(job_ids, list):
             raise ValueError("job_ids must be a list")
@@ -265,36 +654,68 @@ class JobManager(object):
         # These are already post-processed and ready to return.
         for job_id in job_ids:
             job = self.get_job(job_id)
-            if job.was_terminal():
+            if states and job_id in states:
+                output_states[job_id] = job.output_state(states[job_id])
+            elif job.was_terminal() and not force_refresh:
                 output_states[job_id] = job.output_state()
-            elif states and job_id in states:
-                state = states[job_id]
-                output_states[job_id] = job.output_state(state)
             else:
                 jobs_to_lookup.append(job_id)
 
-        fetched_states = dict()
+        if states:
+            for job_id in output_states:
+                if job_id in states:
+                    self._schedule_poll(job_id, states[job_id].get("status"))
+
         # Get the rest of states direct from EE2.
-        if len(jobs_to_lookup):
-            try:
-                fetched_states = clients.get("execution_engine2").check_jobs(
-                    {
-                        "job_ids": jobs_to_lookup,
-                        "exclude_fields": EXCLUDED_JOB_STATE_FIELDS,
-                        "return_list": 0,
-                    }
-                )
-            except Exception as e:
-                kblogging.log_event(
-                    self._log, "_construct_job_output_state_set", {"err": str(e)}
-                )
-                for job_id in jobs_to_lookup:
-                    output_states[job_id] = get_error_output_state(job_id, "ee2_error")
+        # If some of them can't be fetched, just those ones get an error state.
+        errors = dict()
+        fetched_states = self._fetch_job_states(jobs_to_lookup, errors)
+        for job_id in errors:
+            output_states[job_id] = get_error_output_state(job_id, "ee2_error")
 
         for job_id, state in fetched_states.items():
             output_states[job_id] = self.get_job(job_id).output_state(state)
         return output_states
 
+    def _fetch_job_states(self, job_ids: List[str], errors: dict) -> dict:
+        """
+        Looks up job states in EE2, and updates the jobs, their poll times, and the snapshot
+        with them. Returns the states, keyed by job id. The jobs that couldn't be looked up
+        are left out, and their exceptions are put in errors.
+        """
+        fetched_states = self._state_fetcher.fetch(job_ids, errors=errors)
+        for err in {str(e) for e in errors.values()}:
+            kblogging.log_event(
+                self._log, "_construct_job_output_state_set", {"err": err}
+            )
+        for job_id, state in fetched_states.items():
+            self.get_job(job_id)._update_state(state)
+            self._schedule_poll(job_id, state.get("status"))
+
+        if any(
+            job_id not in self._snapshot_job_ids and self.get_job(job_id).was_terminal()
+            for job_id in fetched_states
+        ):
+            self._save_snapshot()
+        return fetched_states
+
+    def _schedule_poll(self, job_id: str, status: str) -> None:
+        """
+        Sets the next status poll time for a job that was just looked up in EE2.
+        The job's current poll interval is used, then backed off for the next poll.
+        If the status has changed since the last poll, the interval is first brought
+        back down to (at most) the base interval for the new status.
+        """
+        (base_interval, max_interval) = POLL_INTERVALS.get(status, DEFAULT_POLL_INTERVALS)
+        with self._index_lock:
+            job_info = self._running_jobs[job_id]
+            interval = job_info.get("poll_interval", base_interval)
+            if status != job_info.get("poll_status"):
+                job_info["poll_status"] = status
+                interval = min(interval, base_interval)
+            job_info["poll_at"] = time.time() + interval
+            job_info["poll_interval"] = min(interval * POLL_BACKOFF_FACTOR, max_interval)
+
     def lookup_job_info(self, job_ids: List[str]) -> dict:
         """
         Sends the info over the comm channel as these packets:
@@ -333,15 +754,61 @@ class JobManager(object):
         :param ignore_refresh_flag: boolean - if True, ignore the usual refresh state of the job.
             Even if the job is stopped, or completed, fetch and return its state from the service.
         """
-        jobs_to_lookup = list()
-        # grab the list of running job ids, so we don't run into update-while-iterating problems.
-        for job_id in self._running_jobs.keys():
-            if self._running_jobs[job_id]["refresh"] > 0 or ignore_refresh_flag:
-                jobs_to_lookup.append(job_id)
+        jobs_to_lookup = self.get_job_ids_to_lookup(ignore_refresh_flag)
         if len(jobs_to_lookup) > 0:
             return self._construct_job_output_state_set(jobs_to_lookup)
         return dict()
 
+    def lookup_scheduled_job_states(
+        self, ignore_refresh_flag=False, include_terminal=True
+    ) -> dict:
+        """
+        Like lookup_all_job_states, but only the non-terminal jobs whose next poll time has
+        come are looked up, in a single EE2 call. See POLL_INTERVALS for how the poll times
+        are set.
+        :param ignore_refresh_flag: boolean - if True, ignore the usual refresh state of the job.
+        :param include_terminal: boolean - if True, the cached states of the terminal jobs
+            are included as well.
+        """
+        now = time.time()
+        with self._index_lock:
+            jobs_to_lookup = list()
+            for job_id in self.get_job_ids_to_lookup(ignore_refresh_flag):
+                job_info = self._running_jobs[job_id]
+                if job_info["job"].was_terminal():
+                    if include_terminal:
+                        jobs_to_lookup.append(job_id)
+                elif job_info.get("poll_at", 0) <= now:
+                    jobs_to_lookup.append(job_id)
+        if len(jobs_to_lookup) > 0:
+            return self._construct_job_output_state_set(jobs_to_lookup)
+        return dict()
+
+    def get_job_ids_to_lookup(self, ignore_refresh_flag=False) -> List[str]:
+        """
+        Returns the IDs of the jobs that something wants updates for (i.e. refresh > 0),
+        or all job IDs if ignore_refresh_flag is True.
+        """
+        with self._index_lock:
+            return [
+                job_id
+                for job_id, job_info in self._running_jobs.items()
+                if job_info["refresh"] > 0 or ignore_refresh_flag
+            ]
+
+    def get_next_poll_time(self, ignore_refresh_flag=False) -> float:
+        """
+        Returns the earliest next poll time (as from time.time()) of the non-terminal jobs
+        to look up, or None if there are none.
+        """
+        with self._index_lock:
+            poll_times = [
+                self._running_jobs[job_id].get("poll_at", 0)
+                for job_id in self.get_job_ids_to_lookup(ignore_refresh_flag)
+                if not self._running_jobs[job_id]["job"].was_terminal()
+            ]
+        return min(poll_times) if len(poll_times) else None
+
     def register_new_job(self, job: Job, refresh: int = None) -> None:
         """
         Registers a new Job with the manager and stores the job locally.
@@ -356,15 +823,189 @@ class JobManager(object):
 
         if refresh is None:
             refresh = int(not job.was_terminal())
-        self._running_jobs[job.job_id] = {"job": job, "refresh": refresh}
+        with self._index_lock:
+            self._running_jobs[job.job_id] = {"job": job, "refresh": refresh}
+            job._state_listener = self._on_job_state_update
+            self._on_job_state_update(job)
+
+    def _on_job_state_update(self, job: Job) -> None:
+        """
+        Called by each registered Job when its state changes.
+        """
+        self._index_job(job)
+        self._update_batch_summary(job)
+
+    def _index_job(self, job: Job) -> None:
+        """
+        Adds a registered job to the cell, batch, and status indexes, or moves it if
+        its state has changed since it was last indexed. Each Job calls this on a state
+        change, once it's registered.
+        """
+        job_id = job.job_id
+        batch_id = None if job.batch_job else job.batch_id
+        keys = (job.cell_id, batch_id, job._acc_state.get("status"))
+        with self._index_lock:
+            old_keys = self._job_index_keys.get(job_id)
+            if old_keys == keys:
+                return
+            indexes = (self._jobs_by_cell_id, self._jobs_by_batch_id, self._jobs_by_status)
+            for index, old_key, key in zip(indexes, old_keys or (None,) * 3, keys):
+                if old_keys is not None and old_key == key:
+                    continue
+                if old_keys is not None and old_key is not None:
+                    index[old_key].discard(job_id)
+                    if not index[old_key]:
+                        del index[old_key]
+                if key is not None:
+                    index.setdefault(key, set()).add(job_id)
+            self._job_index_keys[job_id] = keys
+
+    def _update_batch_summary(self, job: Job) -> None:
+        """
+        Updates the summary of a child job's batch with its current state.
+        """
+        if job.batch_job or job.batch_id is None:
+            return
+        job_id = job.job_id
+        state = job._acc_state
+        status = state.get("status")
+        with self._index_lock:
+            summary = self._batch_summaries.setdefault(
+                job.batch_id,
+                {
+                    "statuses": dict(),
+                    "status_counts": dict(),
+                    "created": None,
+                    "updated": None,
+                    "seqs": dict(),
+                    "seq": 0,
+                },
+            )
+            counts = summary["status_counts"]
+            if job_id in summary["statuses"]:
+                old_status = summary["statuses"][job_id]
+                counts[old_status] -= 1
+                if not counts[old_status]:
+                    del counts[old_status]
+            summary["statuses"][job_id] = status
+            counts[status] = counts.get(status, 0) + 1
+            if state.get("created") is not None and (
+                summary["created"] is None or state["created"] < summary["created"]
+            ):
+                summary["created"] = state["created"]
+            if state.get("updated") is not None and (
+                summary["updated"] is None or state["updated"] > summary["updated"]
+            ):
+                summary["updated"] = state["updated"]
+            summary["seq"] = summary["seqs"][job_id] = next(self._batch_summary_seq)
+
+    def get_batch_summary(self, batch_id: str, since: int = None) -> dict:
+        """
+        Returns a summary of a batch job's registered children, as of their last state
+        updates, without looking anything up. Each caller keeps its own place: since is the
+        seq of the last summary it had, and changed lists the children whose state has changed
+        after that. If since is None, or is later than any seq here (e.g. it's from before a
+        kernel restart), all the children are listed. This has keys:
+            batch_id: str
+            status: str - the batch parent's status
+            child_count: int - the number of registered children
+            status_counts: dict - keys = status, values = number of children with it
+            created: int - the earliest child created time (epoch ms), or None
+            updated: int - the latest child updated time (epoch ms), or None
+            seq: int - pass this as since to the next call to only get the later changes
+            changed: list - the children whose state has changed after since
+
+        Raises a JobIDException if batch_id isn't a registered batch job, or a ValueError if
+        since isn't None or an int.
+        """
+        batch_job = self.get_job(batch_id)
+        if not batch_job.batch_job:
+            raise JobIDException(JOB_NOT_BATCH_ERR, batch_id)
+        if since is not None and (not isinstance(since, int) or isinstance(since, bool)):
+            raise ValueError("since must be an int")
+        with self._index_lock:
+            summary = self._batch_summaries.get(batch_id, dict())
+            seq = summary.get("seq", 0)
+            if since is None or since > seq:
+                since = 0
+            changed = [
+                job_id
+                for job_id, job_seq in summary.get("seqs", dict()).items()
+                if job_seq > since
+            ]
+            return {
+                "batch_id": batch_id,
+                "status": batch_job._acc_state.get("status"),
+                "child_count": len(summary.get("statuses", ())),
+                "status_counts": dict(summary.get("status_counts", dict())),
+                "created": summary.get("created"),
+                "updated": summary.get("updated"),
+                "seq": seq,
+                "changed": sorted(changed),
+            }
+
+    def lookup_batch_summary(self, batch_id: str, since: int = None) -> dict:
+        """
+        Looks up the batch job and its unfinished children in EE2, then returns a dict with
+            summary: the batch summary, from get_batch_summary(batch_id, since)
+            job_states: the output states of the batch parent and of the children in
+                summary["changed"], keyed by job id
+        Output states are only built for those jobs, not the whole batch.
+        """
+        job_ids = self.update_batch_job(batch_id)
+        errors = dict()
+        fetched_states = self._fetch_job_states(
+            [job_id for job_id in job_ids if not self.get_job(job_id).was_terminal()],
+            errors,
+        )
+        summary = self.get_batch_summary(batch_id, since)
+        job_states = dict()
+        for job_id in [batch_id] + summary["changed"]:
+            if job_id in errors:
+                job_states[job_id] = get_error_output_state(job_id, "ee2_error")
+            else:
+                job_states[job_id] = self.get_job(job_id).output_state(
+                    fetched_states.get(job_id)
+                )
+        return {"summary": summary, "job_states": job_states}
+
+    @staticmethod
+    def _lookup_index(index: dict, keys: Iterable[str]) -> Set[str]:
+        job_ids = set()
+        for key in keys:
+            job_ids.update(index.get(key, ()))
+        return job_ids
+
+    def get_job_ids_by_cell(self, cell_ids: Iterable[str]) -> Set[str]:
+        """
+        Returns the IDs of the registered jobs that were started from any of the given cells.
+        """
+        with self._index_lock:
+            return self._lookup_index(self._jobs_by_cell_id, cell_ids)
+
+    def get_job_ids_by_status(self, statuses: Iterable[str]) -> Set[str]:
+        """
+        Returns the IDs of the registered jobs that have any of the given statuses, as of
+        their last state update.
+        """
+        with self._index_lock:
+            return self._lookup_index(self._jobs_by_status, statuses)
+
+    def get_batch_child_ids(self, batch_id: str) -> Set[str]:
+        """
+        Returns the IDs of the registered child jobs of a batch job.
+        """
+        with self._index_lock:
+            return set(self._jobs_by_batch_id.get(batch_id, ()))
 
     def get_job(self, job_id):
         """
         Returns a Job with the given job_id.
         Raises a JobIDException if not found.
         """
-        self._check_job(job_id)
-        return self._running_jobs[job_id]["job"]
+        with self._index_lock:
+            self._check_job(job_id)
+            return self._running_jobs[job_id]["job"]
 
     def get_job_logs(
         self,
@@ -403,12 +1044,11 @@ class JobManager(object):
 
         try:
             if latest_only:
-                (max_lines, logs) = job.log()
+                (max_lines, logs) = job.log(num_lines=num_lines, latest_only=True)
                 if num_lines is None or max_lines <= num_lines:
                     first_line = 0
                 else:
                     first_line = max_lines - num_lines
-                    logs = logs[first_line:]
             else:
                 (max_lines, logs) = job.log(first_line=first_line, num_lines=num_lines)
 
@@ -422,26 +1062,51 @@ class JobManager(object):
         except Exception as e:
             raise transform_job_exception(e, "Unable to retrieve job logs")
 
-    def cancel_jobs(self, job_id_list: List[str]) -> dict:
+    def cancel_jobs(self, job_id_list: List[str], errors: dict = None) -> dict:
         """
         Cancel a list of running jobs, placing them in a canceled state
         Does NOT delete the jobs.
         If the job_ids are not present or are not found in the Narrative,
         a ValueError is raised.
 
+        The jobs are canceled concurrently, on up to CANCEL_JOBS_WORKERS threads, then
+        their states are all looked up at once.
+
         Results are returned as a dict of job status objects keyed by job id
 
         :param job_id_list: list of strs
+        :param errors: if given, any job that can't be canceled gets its exception added to
+            this dict, keyed by job id, and the rest are still returned. Otherwise, the
+            first of those exceptions is raised, once all the cancels are done.
         :return job_states: dict with keys job IDs and values job state objects
 
         """
         job_ids, error_ids = self._check_job_list(job_id_list)
 
-        for job_id in job_ids:
-            if not self.get_job(job_id).was_terminal():
-                self._cancel_job(job_id)
-
+        to_cancel = [
+            job_id for job_id in job_ids if not self.get_job(job_id).was_terminal()
+        ]
+        cancel_errors = dict()
+        if to_cancel:
+            with ThreadPoolExecutor(
+                max_workers=min(CANCEL_JOBS_WORKERS, len(to_cancel)),
+                thread_name_prefix="cancel_jobs",
+            ) as pool:
+                futures = {
+                    job_id: pool.submit(run_in_context(self._cancel_job), job_id)
+                    for job_id in to_cancel
+                }
+            for job_id, future in futures.items():
+                if future.exception() is not None:
+                    cancel_errors[job_id] = future.exception()
+        if cancel_errors and errors is None:
+            raise next(iter(cancel_errors.values()))
+
+        # a lookup that started before the cancels would give their old states
+        self._state_fetcher.forget(to_cancel)
         job_states = self._construct_job_output_state_set(job_ids)
+        if errors is not None:
+            errors.update(cancel_errors)
 
         for job_id in error_ids:
             job_states[job_id] = {
@@ -458,7 +1123,8 @@ class JobManager(object):
         self._running_jobs[job_id]["canceling"] = True
 
         try:
-            clients.get("execution_engine2").cancel_job({"job_id": job_id})
+            ee2 = count_ee2_calls(clients.get("execution_engine2"))
+            ee2.cancel_job({"job_id": job_id})
         except Exception as e:
             raise transform_job_exception(e, "Unable to cancel job")
         finally:
@@ -488,9 +1154,8 @@ class JobManager(object):
         """
         job_ids, error_ids = self._check_job_list(job_id_list)
         try:
-            retry_results = clients.get("execution_engine2").retry_jobs(
-                {"job_ids": job_ids}
-            )
+            ee2 = count_ee2_calls(clients.get("execution_engine2"))
+            retry_results = ee2.retry_jobs({"job_ids": job_ids})
         except Exception as e:
             raise transform_job_exception(e, "Unable to retry job(s)")
         # for each retry result, refresh the state of the retried and new jobs
@@ -498,11 +1163,15 @@ class JobManager(object):
         retry_ids = [
             result["retry_id"] for result in retry_results if "retry_id" in result
         ]
-        orig_states = self._construct_job_output_state_set(orig_ids)
-        retry_states = self._construct_job_output_state_set(
-            retry_ids, self._create_jobs(retry_ids)  # add to self._running_jobs index
-        )
-        job_states = {**orig_states, **retry_states}
+        # the retried jobs have changed in ee2 (e.g. their retry_ids), so they get refreshed
+        # along with the lookup of the new jobs, in a single query
+        lookup_ids = list(dict.fromkeys(orig_ids + retry_ids))
+        ee2_states = Job.query_ee2_states(lookup_ids, init=True)
+        for retry_id in retry_ids:
+            if retry_id not in self._running_jobs and retry_id in ee2_states:
+                # set new jobs to be automatically refreshed
+                self.register_new_job(job=Job(ee2_states[retry_id]), refresh=1)
+        job_states = self._construct_job_output_state_set(lookup_ids, ee2_states)
         # fill in the job state details
         for result in retry_results:
             result["job"] = job_states[result["job_id"]]
@@ -531,14 +1200,28 @@ class JobManager(object):
         """
         Modifies how many things want to get the job updated.
         If this sets the current "refresh" key to be less than 0, it gets reset to 0.
+        If this adds listeners, the jobs are switched to hot polling.
         If the job isn't present or None, a ValueError is raised.
         """
         job_ids, _ = self._check_job_list(job_ids)
 
-        for job_id in job_ids:
-            self._running_jobs[job_id]["refresh"] += update_adjust
-            if self._running_jobs[job_id]["refresh"] < 0:
-                self._running_jobs[job_id]["refresh"] = 0
+        with self._index_lock:
+            for job_id in job_ids:
+                job_info = self._running_jobs[job_id]
+                job_info["refresh"] = max(job_info["refresh"] + update_adjust, 0)
+
+        if update_adjust > 0:
+            self.set_hot_polling(job_ids)
+
+    def set_hot_polling(self, job_ids: List[str]) -> None:
+        """
+        Makes the given jobs due to be polled now, and then every HOT_POLL_INTERVAL
+        seconds, backing off as usual while their status doesn't change.
+        """
+        with self._index_lock:
+            for job_id in job_ids:
+                self._running_jobs[job_id]["poll_at"] = 0
+                self._running_jobs[job_id]["poll_interval"] = HOT_POLL_INTERVAL
 
     def update_batch_job(self, batch_id: str) -> List[str]:
         """
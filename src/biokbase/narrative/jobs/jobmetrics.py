@@ -0,0 +1,239 @@
+"""
+Metrics for the kernel side of the job machinery: how long each JobComm request takes, how
+many ee2 calls it makes and how much it sends to the front end, and how the job status loop
+is doing.
+"""
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds of the latency histogram buckets, in ms. Anything slower goes in a last,
+# unbounded bucket.
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# the name that the job status loop's stats are kept under
+STATUS_LOOP = "status_loop"
+
+# the stats of whatever is being tracked in this context (see JobCommMetrics.track)
+_current_stats = contextvars.ContextVar("job_metrics_stats", default=None)
+
+
+class LatencyHistogram:
+    """
+    Counts durations into the LATENCY_BUCKETS_MS buckets.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for idx, upper in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= upper:
+                self.bucket_counts[idx] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def to_dict(self) -> dict:
+        """
+        Returns the histogram as a dict with keys count, total_ms, max_ms, mean_ms, and
+        buckets, a list of [upper bound in ms, count] pairs, where the last upper bound is
+        None.
+        """
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "buckets": [
+                [upper, count]
+                for upper, count in zip(LATENCY_BUCKETS_MS + [None], self.bucket_counts)
+            ],
+        }
+
+
+class _Stats:
+    """
+    The stats for one kind of request, or for the status loop.
+    """
+
+    def __init__(self):
+        self.errors = 0
+        self.ee2_calls = 0
+        self.messages = 0
+        self.payload_bytes = 0
+        self.jobs = 0
+        self.max_jobs = 0
+        self.latency = LatencyHistogram()
+
+
+class JobCommMetrics:
+    """
+    Keeps the metrics for JobComm requests and the job status loop. This is a singleton, so
+    the ee2 calls made anywhere in the job code can be counted toward the request they're
+    made for.
+
+    Everything that's counted is cheap to count, except for the size of the messages sent to
+    the front end, which means encoding them an extra time. That's only done if
+    measure_payloads is set.
+    """
+
+    __instance = None
+    measure_payloads = False
+    _lock = None
+    _since = None
+    # keys = request type (or STATUS_LOOP), values = _Stats
+    _stats = None
+
+    def __new__(cls):
+        if JobCommMetrics.__instance is None:
+            JobCommMetrics.__instance = object.__new__(cls)
+            JobCommMetrics.__instance._lock = threading.Lock()
+            JobCommMetrics.__instance.reset()
+        return JobCommMetrics.__instance
+
+    def reset(self) -> None:
+        with self._lock:
+            self._since = time.time()
+            self._stats = dict()
+
+    def _get_stats(self, name: str) -> _Stats:
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = _Stats()
+            return self._stats[name]
+
+    @contextmanager
+    def track(self, name: str):
+        """
+        Context manager that times what it wraps, and counts the ee2 calls and messages
+        made in it (including in any threads started with run_in_context) toward name.
+        """
+        stats = self._get_stats(name)
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        except Exception:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            _current_stats.reset(token)
+            with self._lock:
+                stats.latency.record(elapsed)
+
+    def record_status_loop_jobs(self, stats: _Stats, num_jobs: int) -> None:
+        """
+        Records the number of jobs a status loop tick sent states for.
+        """
+        with self._lock:
+            stats.jobs += num_jobs
+            stats.max_jobs = max(stats.max_jobs, num_jobs)
+
+    def record_ee2_call(self) -> None:
+        stats = _current_stats.get()
+        if stats is not None:
+            with self._lock:
+                stats.ee2_calls += 1
+
+    def record_message(self, content) -> None:
+        """
+        Records a message sent to the front end, and its size as JSON if measure_payloads
+        is set.
+        """
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        size = 0
+        if self.measure_payloads:
+            size = len(json.dumps(content, default=str))
+        with self._lock:
+            stats.messages += 1
+            stats.payload_bytes += size
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the metrics since they were last reset, as a dict with keys
+            since: float - when the metrics were last reset (epoch seconds)
+            requests: dict - keys = request type, values = dict with keys
+                latency_ms: dict - see LatencyHistogram.to_dict
+                errors: int - the number of requests that raised an error
+                ee2_calls: int - the number of ee2 calls made
+                messages: int - the number of messages sent to the front end
+                payload_bytes: int - their total size, if measure_payloads is set
+            status_loop: dict - like those, but with tick_ms instead of latency_ms, and
+                jobs: int - the total number of job states sent
+                max_jobs: int - the most job states sent in one tick
+        """
+        with self._lock:
+            metrics = {"since": self._since, "requests": dict(), "status_loop": None}
+            for name, stats in self._stats.items():
+                out = {
+                    "errors": stats.errors,
+                    "ee2_calls": stats.ee2_calls,
+                    "messages": stats.messages,
+                    "payload_bytes": stats.payload_bytes,
+                }
+                if name == STATUS_LOOP:
+                    out["tick_ms"] = stats.latency.to_dict()
+                    out["jobs"] = stats.jobs
+                    out["max_jobs"] = stats.max_jobs
+                    metrics["status_loop"] = out
+                else:
+                    out["latency_ms"] = stats.latency.to_dict()
+                    metrics["requests"][name] = out
+            return metrics
+
+
+def run_in_context(fn):
+    """
+    Wraps fn so it runs in a copy of the current context, so anything it does is tracked
+    along with whatever's being tracked now. For handing functions to other threads, e.g.
+    pool.submit(run_in_context(fn), *args). The copy can only be run in one thread at a
+    time, so this should be called for each submission.
+    """
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+
+    return run
+
+
+class _CountedClient:
+    """
+    Passes calls through to a client, counting each one.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            JobCommMetrics().record_ee2_call()
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def count_ee2_calls(client):
+    """
+    If a request is being tracked, wraps an ee2 client so its calls are counted toward it.
+    Otherwise, returns the client as it is.
+    """
+    if _current_stats.get() is None:
+        return client
+    return _CountedClient(client)
@@ -0,0 +1,169 @@
+"""
+On-disk snapshots of terminal job states, so a restarted kernel doesn't have to fetch the
+full state of every old job in its workspace again.
+"""
+import json
+import os
+import threading
+from typing import Optional
+from biokbase.narrative.common import kblogging
+
+# The directory to keep snapshots in. If this isn't set, snapshots aren't used.
+SNAPSHOT_DIR_ENV = "KB_JOB_SNAPSHOT_DIR"
+SNAPSHOT_VERSION = 2
+# how long save_later waits to write the states queued, in seconds
+SNAPSHOT_SAVE_DELAY = 2
+
+# A snapshot state is only used if these fields still match what ee2 has for the job, e.g.
+# a job that's been retried since the snapshot gets looked up again.
+SNAPSHOT_CHECK_FIELDS = ["status", "updated", "retry_count", "retry_ids", "child_jobs"]
+
+_log = kblogging.get_logger(__name__)
+
+
+class JobStateSnapshot:
+    """
+    The snapshot for one workspace. This is a file of JSON lines. The first one is the header,
+        {"version": SNAPSHOT_VERSION, "ws_id": workspace id}
+    and each of the others holds one job's state,
+        {"job_id": job id, "state": job state}
+    Jobs are added by appending their lines, so adding a few jobs doesn't rewrite all the
+    others. If a job is there more than once, its last line is used.
+    """
+
+    def __init__(self, ws_id: int, snapshot_dir: str, save_delay: float = SNAPSHOT_SAVE_DELAY):
+        self.ws_id = ws_id
+        self.path = os.path.join(snapshot_dir, f"ws_{ws_id}_jobs.json")
+        self.save_delay = save_delay
+        # the job states waiting to be written by save_later, whether they replace the
+        # snapshot, and the timer that writes them
+        self._pending = dict()
+        self._pending_rewrite = False
+        self._timer = None
+        self._pending_lock = threading.Lock()
+        # keeps the writes in the order their states were queued
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def for_workspace(cls, ws_id: int) -> Optional["JobStateSnapshot"]:
+        """
+        Returns the snapshot for a workspace, or None if snapshots aren't set up.
+        """
+        snapshot_dir = os.environ.get(SNAPSHOT_DIR_ENV)
+        if not snapshot_dir or ws_id is None:
+            return None
+        return cls(ws_id, snapshot_dir)
+
+    def load(self) -> dict:
+        """
+        Returns the snapshot job states, keyed by job id. If there's no snapshot yet, or it
+        can't be read, this returns an empty dict. A line that can't be read, e.g. one that
+        was being appended when the kernel stopped, is skipped.
+        """
+        if not os.path.exists(self.path):
+            return dict()
+        job_states = dict()
+        try:
+            with open(self.path) as f:
+                header = json.loads(f.readline())
+                if header.get("version") != SNAPSHOT_VERSION or str(
+                    header.get("ws_id")
+                ) != str(self.ws_id):
+                    return dict()
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        job_states[entry["job_id"]] = entry["state"]
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except Exception as e:
+            kblogging.log_event(_log, "job_snapshot_load_error", {"err": str(e)})
+            return dict()
+        return job_states
+
+    def save(self, job_states: dict) -> None:
+        """
+        Replaces the snapshot with the given job states, keyed by job id. Errors are logged,
+        not raised, as the snapshot is just a cache.
+        """
+        # the file is only replaced once it's all written, and each thread has its own
+        # temp file
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                f.write(json.dumps({"version": SNAPSHOT_VERSION, "ws_id": self.ws_id}) + "\n")
+                self._write_states(f, job_states)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            kblogging.log_event(_log, "job_snapshot_save_error", {"err": str(e)})
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def append(self, job_states: dict) -> None:
+        """
+        Adds the given job states, keyed by job id, to the snapshot, or makes a new one with
+        them if there isn't one. Errors are logged, not raised.
+        """
+        if not os.path.exists(self.path):
+            self.save(job_states)
+            return
+        try:
+            with open(self.path, "a") as f:
+                self._write_states(f, job_states)
+        except Exception as e:
+            kblogging.log_event(_log, "job_snapshot_save_error", {"err": str(e)})
+
+    @staticmethod
+    def _write_states(f, job_states: dict) -> None:
+        f.write(
+            "".join(
+                json.dumps({"job_id": job_id, "state": state}) + "\n"
+                for job_id, state in job_states.items()
+            )
+        )
+
+    def save_later(self, job_states: dict, rewrite: bool = False) -> None:
+        """
+        Queues job states to be appended to the snapshot on a timer thread, save_delay
+        seconds after the first of them is queued, so states queued close together are
+        written at once, and the caller doesn't wait on the disk. With rewrite, the
+        snapshot is replaced with the states queued from now on, instead.
+        """
+        with self._pending_lock:
+            if rewrite:
+                self._pending = dict()
+                self._pending_rewrite = True
+            self._pending.update(job_states)
+            if self._timer is None:
+                # not a daemon, so the states queued just before the kernel stops are kept
+                self._timer = threading.Timer(self.save_delay, self.flush)
+                self._timer.start()
+
+    def flush(self) -> None:
+        """
+        Writes the states queued by save_later now.
+        """
+        with self._write_lock:
+            with self._pending_lock:
+                job_states, self._pending = self._pending, dict()
+                rewrite, self._pending_rewrite = self._pending_rewrite, False
+                if self._timer is not None and self._timer is not threading.current_thread():
+                    self._timer.cancel()
+                self._timer = None
+            if rewrite:
+                self.save(job_states)
+            elif job_states:
+                self.append(job_states)
+
+    @staticmethod
+    def is_current(snapshot_state: dict, ee2_state: dict) -> bool:
+        """
+        Returns True if a snapshot state still matches the given (possibly trimmed) ee2 state.
+        """
+        return all(
+            snapshot_state.get(field) == ee2_state.get(field)
+            for field in SNAPSHOT_CHECK_FIELDS
+        )
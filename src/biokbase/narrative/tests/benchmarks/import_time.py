@@ -0,0 +1,128 @@
+"""
+Benchmark for how long biokbase.narrative and its major submodules take to import.
+
+Imports each module in a fresh interpreter with python -X importtime, and reports the
+cumulative import time of the module itself, along with the slowest modules it pulled in,
+so a new heavy import at kernel startup shows up. Each module is imported a few times and
+the fastest run is kept, as the first run also pays for reading and compiling files.
+
+Usage:
+    python -m biokbase.narrative.tests.benchmarks.import_time \
+        [--modules biokbase.narrative.clients ...] [--runs 3] [--output results.json]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+__author__ = "KBase Narrative team"
+
+MODULES = [
+    "biokbase.narrative",
+    "biokbase.narrative.clients",
+    "biokbase.narrative.common.util",
+    "biokbase.narrative.app_util",
+    "biokbase.narrative.upa",
+    "biokbase.narrative.viewers",
+    "biokbase.narrative.widgetmanager",
+    "biokbase.narrative.jobs.appmanager",
+    "biokbase.narrative.jobs.jobmanager",
+    "biokbase.narrative.jobs.jobcomm",
+    "biokbase.narrative.contents.narrativeio",
+]
+
+# the number of slowest imports to report for each module
+TOP_IMPORTS = 10
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parses -X importtime output into a dict of module name -> cumulative microseconds.
+    Lines look like "import time:       123 |       4567 |     some.module".
+    """
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def time_import(module: str) -> dict:
+    """
+    Imports module in a fresh interpreter and returns its -X importtime results.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Unable to import {module}: {proc.stderr.splitlines()[-1:]}")
+    return parse_importtime(proc.stderr)
+
+
+def run(modules: list, runs: int = 3) -> dict:
+    results = list()
+    for module in modules:
+        best = None
+        for _ in range(runs):
+            try:
+                times = time_import(module)
+            except RuntimeError as e:
+                best = {"error": str(e)}
+                break
+            if best is None or times.get(module, 0) < best.get(module, 0):
+                best = times
+        if "error" in best:
+            results.append({"module": module, "error": best["error"]})
+            continue
+        slowest = sorted(
+            ((name, us) for name, us in best.items() if name != module),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:TOP_IMPORTS]
+        results.append(
+            {
+                "module": module,
+                "cumulative_us": best.get(module),
+                "modules_imported": len(best),
+                "slowest_imports": [
+                    {"module": name, "cumulative_us": us} for name, us in slowest
+                ],
+            }
+        )
+    return {
+        "benchmark": "import_time",
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "runs": runs,
+        "modules": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--modules", nargs="+", default=MODULES, help="modules to import (default: all)"
+    )
+    parser.add_argument("--runs", type=int, default=3, help="imports of each module")
+    parser.add_argument("--output", help="file to write the results to (default: stdout)")
+    args = parser.parse_args()
+
+    results = run(args.modules, runs=args.runs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
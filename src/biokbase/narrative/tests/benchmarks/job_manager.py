@@ -0,0 +1,334 @@
+"""
+Benchmarks for how the JobManager scales with the number of jobs in a workspace.
+
+Runs the JobManager against a synthetic ee2 that holds a workspace full of generated jobs,
+for a few workloads: 10, 1,000 and 50,000 jobs, batches with many children, and jobs with
+large outputs. For each one, it measures initialize_jobs, an all_status poll,
+get_job_states, list_jobs and log retrieval. Each operation is timed on its own, then run
+again with tracemalloc to get its peak memory use.
+
+The results are written as JSON, so runs from different releases can be compared.
+
+Usage:
+    python -m biokbase.narrative.tests.benchmarks.job_manager \
+        [--workloads small medium ...] [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from unittest import mock
+from biokbase.narrative.jobs.jobmanager import JobManager
+
+__author__ = "KBase Narrative team"
+
+WS_ID = 12345
+WS_NAME = "benchmark_workspace"
+
+# name -> the shape of the workspace's jobs
+#   jobs: the total number of jobs
+#   batch_size: if set, the jobs are put in batches of this many: a parent and its children
+#   output_size: the number of entries in each finished job's output
+#   log_lines: the number of lines in each job's log
+WORKLOADS = {
+    "small": {"jobs": 10},
+    "medium": {"jobs": 1000},
+    "large": {"jobs": 50000},
+    "batches": {"jobs": 5000, "batch_size": 1000},
+    "large_outputs": {"jobs": 1000, "output_size": 5000},
+}
+DEFAULT_WORKLOAD = {"batch_size": None, "output_size": 10, "log_lines": 1000}
+
+# how the statuses of the generated jobs are spread, as (status, weight)
+STATUS_MIX = [
+    ("completed", 12),
+    ("running", 4),
+    ("queued", 2),
+    ("error", 1),
+    ("terminated", 1),
+]
+
+# the number of jobs whose logs get fetched
+LOG_SAMPLE_SIZE = 20
+LOG_PAGE_SIZE = 100
+
+
+def _status_for(idx: int) -> str:
+    total = sum(weight for _, weight in STATUS_MIX)
+    pos = idx % total
+    for status, weight in STATUS_MIX:
+        if pos < weight:
+            return status
+        pos -= weight
+
+
+def make_ee2_state(
+    job_id: str, status: str, output_size: int, batch_id: str = None
+) -> dict:
+    """
+    A job's full state, as it would be stored by ee2.
+    """
+    state = {
+        "job_id": job_id,
+        "user": "some_user",
+        "authstrat": "kbaseworkspace",
+        "wsid": WS_ID,
+        "status": status,
+        "batch_job": False,
+        "child_jobs": [],
+        "retry_count": 0,
+        "retry_ids": [],
+        "created": 1600000000000,
+        "updated": 1600000000000,
+        "job_input": {
+            "app_id": "SomeModule/some_app",
+            "method": "SomeModule.some_app",
+            "service_ver": "0123456789abcdef",
+            "params": [{"input_ref": "1/2/3", "output_name": f"out_{job_id}"}],
+            "narrative_cell_info": {
+                "cell_id": f"cell_{(batch_id or job_id)[-2:]}",
+                "run_id": f"run_{job_id}",
+                "tag": "release",
+            },
+        },
+    }
+    if status != "queued":
+        state["queued"] = 1600000001000
+    if status not in ["queued", "terminated"]:
+        state["running"] = 1600000002000
+    if status in ["completed", "error", "terminated"]:
+        state["finished"] = 1600000003000
+        state["updated"] = 1600000003000
+    if status == "completed":
+        state["job_output"] = {
+            "id": job_id,
+            "version": "1.1",
+            "result": [
+                {f"key_{i}": {"value": i, "label": str(i)} for i in range(output_size)}
+            ],
+        }
+    if status == "error":
+        state["errormsg"] = "Something went wrong"
+        state["error"] = {"code": -32000, "name": "Server error", "message": "Oops"}
+    if batch_id is not None:
+        state["batch_id"] = batch_id
+        state["job_input"]["parent_job_id"] = batch_id
+    return state
+
+
+class SyntheticEE2:
+    """
+    Stands in for the ee2 and workspace clients. Holds the states of a generated workspace
+    full of jobs, and answers the calls the JobManager makes with them. Every lookup of a
+    job that's still running bumps its updated time, so each poll sees a change.
+    """
+
+    def __init__(
+        self,
+        jobs: int,
+        batch_size: int = None,
+        output_size: int = 10,
+        log_lines: int = 1000,
+    ):
+        self.log_lines = log_lines
+        self.states = dict()
+        self.calls = 0
+        idx = 0
+        while idx < jobs:
+            if batch_size:
+                n_children = min(batch_size, jobs - idx) - 1
+                self._add_batch(idx, n_children, output_size)
+                idx += n_children + 1
+            else:
+                job_id = f"job_{idx:08d}"
+                self.states[job_id] = make_ee2_state(job_id, _status_for(idx), output_size)
+                idx += 1
+
+    def _add_batch(self, idx: int, n_children: int, output_size: int) -> None:
+        batch_id = f"job_{idx:08d}"
+        child_ids = [f"job_{idx + n:08d}" for n in range(1, n_children + 1)]
+        for n, child_id in enumerate(child_ids, 1):
+            self.states[child_id] = make_ee2_state(
+                child_id, _status_for(idx + n), output_size, batch_id=batch_id
+            )
+        parent = make_ee2_state(batch_id, "running", 0)
+        parent.update(
+            {
+                "batch_job": True,
+                "child_jobs": child_ids,
+                "job_input": {
+                    "app_id": "batch",
+                    "method": "batch",
+                    "service_ver": "batch",
+                    "narrative_cell_info": {},
+                },
+            }
+        )
+        self.states[batch_id] = parent
+
+    def _state(self, job_id: str, exclude_fields: list) -> dict:
+        state = self.states[job_id]
+        if state["status"] in ["created", "queued", "estimating", "running"]:
+            state["updated"] += 1
+        return {k: v for k, v in state.items() if k not in exclude_fields}
+
+    # ----- workspace -----
+    def get_workspace_info(self, params):
+        return [WS_ID, WS_NAME, "some_user"]
+
+    # ----- ee2 -----
+    def check_workspace_jobs(self, params):
+        self.calls += 1
+        exclude_fields = params.get("exclude_fields", [])
+        states = {
+            job_id: self._state(job_id, exclude_fields) for job_id in self.states
+        }
+        if params.get("return_list"):
+            return list(states.values())
+        return states
+
+    def check_jobs(self, params):
+        self.calls += 1
+        exclude_fields = params.get("exclude_fields", [])
+        states = {
+            job_id: self._state(job_id, exclude_fields) for job_id in params["job_ids"]
+        }
+        if params.get("return_list"):
+            return list(states.values())
+        return states
+
+    def check_job(self, params):
+        self.calls += 1
+        return self._state(params["job_id"], params.get("exclude_fields", []))
+
+    def get_job_logs(self, params):
+        self.calls += 1
+        skip = params.get("skip_lines", 0)
+        stop = self.log_lines
+        if params.get("limit") is not None:
+            stop = min(stop, skip + params["limit"])
+        return {
+            "last_line_number": self.log_lines,
+            "lines": [
+                {"is_error": int(i % 50 == 0), "line": f"{params['job_id']} log line {i}"}
+                for i in range(skip, stop)
+            ],
+        }
+
+
+def measure(fn, setup=None, repeat: int = 1) -> dict:
+    """
+    Times fn over repeat runs, then runs it once more with tracemalloc on to get the peak
+    memory it allocates. setup, if given, is run before each run and isn't measured.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / repeat,
+        "peak_bytes": peak,
+    }
+
+
+def run_workload(name: str, repeat: int = 1) -> dict:
+    workload = dict(DEFAULT_WORKLOAD, **WORKLOADS[name])
+    ee2 = SyntheticEE2(
+        workload["jobs"],
+        batch_size=workload["batch_size"],
+        output_size=workload["output_size"],
+        log_lines=workload["log_lines"],
+    )
+    jm = JobManager()
+    ops = dict()
+
+    with mock.patch("biokbase.narrative.clients.get", lambda *args, **kwargs: ee2):
+        ops["initialize_jobs"] = measure(jm.initialize_jobs, repeat=repeat)
+        job_ids = list(jm._running_jobs.keys())
+        ops["all_status_poll"] = measure(
+            lambda: jm.lookup_all_job_states(ignore_refresh_flag=True), repeat=repeat
+        )
+        ops["get_job_states"] = measure(lambda: jm.get_job_states(job_ids), repeat=repeat)
+        ops["list_jobs"] = measure(jm.list_jobs, repeat=repeat)
+        ops["list_jobs_json"] = measure(
+            lambda: jm.list_jobs(output="json", sort_by="updated", reverse=True),
+            repeat=repeat,
+        )
+
+        # logs are cached once fetched, so start from fresh jobs each time
+        log_ids = [
+            job_id for job_id in job_ids if not jm.get_job(job_id).batch_job
+        ][:LOG_SAMPLE_SIZE]
+
+        def get_logs():
+            for job_id in log_ids:
+                jm.get_job_logs(job_id)
+                jm.get_job_logs(job_id, num_lines=LOG_PAGE_SIZE, latest_only=True)
+
+        ops["job_logs"] = measure(get_logs, setup=jm.initialize_jobs, repeat=repeat)
+
+    return {
+        "name": name,
+        "jobs": len(ee2.states),
+        "batch_size": workload["batch_size"],
+        "output_size": workload["output_size"],
+        "log_lines": workload["log_lines"],
+        "log_jobs": len(log_ids),
+        "ee2_calls": ee2.calls,
+        "operations": ops,
+    }
+
+
+def run(workloads: list, repeat: int = 1) -> dict:
+    # don't let a job state snapshot short cut initialize_jobs
+    os.environ.pop("KB_JOB_SNAPSHOT_DIR", None)
+    os.environ["KB_WORKSPACE_ID"] = WS_NAME
+    return {
+        "benchmark": "job_manager",
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "workloads": [run_workload(name, repeat=repeat) for name in workloads],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--workloads",
+        nargs="+",
+        choices=list(WORKLOADS.keys()),
+        default=list(WORKLOADS.keys()),
+        help="workloads to run (default: all of them)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed runs of each operation"
+    )
+    parser.add_argument("--output", help="file to write the results to (default: stdout)")
+    args = parser.parse_args()
+
+    results = run(args.workloads, repeat=args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark for the memory used by Job state updates during a status poll.
+
+Builds a set of running jobs with large inputs and outputs, then runs a few polls that
+look like an all_status sweep: each job gets a fresh state from "ee2" and builds its
+output state. Reports the time and the memory allocated (tracemalloc peak) per poll.
+
+Usage:
+    python -m biokbase.narrative.tests.benchmarks.job_state [--jobs 5000] [--polls 5]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from biokbase.narrative.jobs.job import Job
+
+__author__ = "KBase Narrative team"
+
+PARAM_SIZE = 100
+OUTPUT_SIZE = 500
+
+
+def make_ee2_state(job_id: str, updated: int) -> dict:
+    """
+    A running job's state, as from ee2.check_jobs, with largish params and output.
+    """
+    return {
+        "job_id": job_id,
+        "user": "some_user",
+        "authstrat": "kbaseworkspace",
+        "wsid": 12345,
+        "status": "running",
+        "created": 1600000000000,
+        "queued": 1600000001000,
+        "running": 1600000002000,
+        "updated": updated,
+        "job_input": {
+            "app_id": "SomeModule/some_app",
+            "method": "SomeModule.some_app",
+            "service_ver": "0123456789abcdef",
+            "params": [{f"param_{i}": [i, str(i)] for i in range(PARAM_SIZE)}],
+            "narrative_cell_info": {
+                "cell_id": f"cell_{job_id}",
+                "run_id": f"run_{job_id}",
+                "tag": "release",
+            },
+        },
+        "job_output": {
+            "result": [{f"key_{i}": {"value": i, "label": str(i)} for i in range(OUTPUT_SIZE)}]
+        },
+    }
+
+
+def run(n_jobs: int, n_polls: int) -> dict:
+    jobs = [Job(make_ee2_state(f"job_{i}", 0)) for i in range(n_jobs)]
+
+    polls = []
+    for poll in range(1, n_polls + 1):
+        # states as they come back from ee2, built outside of the measured part
+        states = [make_ee2_state(job.job_id, poll) for job in jobs]
+        start = time.perf_counter()
+        for job, state in zip(jobs, states):
+            job.output_state(state)
+        elapsed = time.perf_counter() - start
+
+        # again with new states, this time tracing allocations
+        states = [make_ee2_state(job.job_id, -poll) for job in jobs]
+        tracemalloc.start()
+        for job, state in zip(jobs, states):
+            job.output_state(state)
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        polls.append({"seconds": elapsed, "allocated_bytes": allocated})
+
+    return {
+        "benchmark": "job_state_poll",
+        "jobs": n_jobs,
+        "polls": polls,
+        "mean_seconds": sum(p["seconds"] for p in polls) / n_polls,
+        "mean_allocated_bytes": sum(p["allocated_bytes"] for p in polls) // n_polls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--jobs", type=int, default=5000, help="number of jobs")
+    parser.add_argument("--polls", type=int, default=5, help="number of polls")
+    args = parser.parse_args()
+    print(json.dumps(run(args.jobs, args.polls), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Benchmark for how much gzipping request bodies saves on the biggest requests the Narrative
+makes.
+
+Builds the bodies of two synthetic requests: a Workspace.save_objects of a Narrative with
+many cells and large outputs, as KBaseWSManagerMixin.write_narrative sends, and an
+execution_engine2.run_job_batch of many parameter sets, as AppManager.run_app_bulk sends.
+Each one is sent through a BaseClient with a fake session, with compression off and at the
+default threshold, and the client's wire_stats give the bytes before and after, along with
+the time spent encoding and compressing.
+
+Usage:
+    python -m biokbase.narrative.tests.benchmarks.request_compression \
+        [--payloads narrative_small ...] [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from unittest import mock
+from biokbase.narrative import clients
+from biokbase.workspace.baseclient import BaseClient
+
+__author__ = "KBase Narrative team"
+
+# name -> the shape of the request
+#   narrative: the number of cells, and the bytes of output in each one
+#   batch: the number of parameter sets for run_job_batch
+PAYLOADS = {
+    "narrative_small": {"cells": 20, "output_size": 10 * 1024},
+    "narrative_large": {"cells": 200, "output_size": 200 * 1024},
+    "batch_small": {"param_sets": 100},
+    "batch_large": {"param_sets": 5000},
+}
+
+
+def make_narrative(cells: int, output_size: int) -> list:
+    """
+    Returns the params of a save_objects call for a Narrative with the given cells, each
+    with a table-like output of about output_size bytes.
+    """
+    row = "contig_{0}\t{0}\t0.{0}\tGCA_000{0:06d}.1\n"
+    nb_cells = list()
+    for idx in range(cells):
+        rows = list()
+        size = 0
+        while size < output_size:
+            rows.append(row.format(len(rows) + idx))
+            size += len(rows[-1])
+        nb_cells.append(
+            {
+                "cell_type": "code",
+                "metadata": {"kbase": {"type": "app", "cellId": f"cell-{idx}"}},
+                "source": f"from biokbase.narrative.jobs.appmanager import AppManager\n# {idx}",
+                "outputs": [{"output_type": "stream", "name": "stdout", "text": rows}],
+            }
+        )
+    narrative = {"nbformat": 4, "nbformat_minor": 4, "metadata": {}, "cells": nb_cells}
+    return [
+        {
+            "id": 12345,
+            "objects": [
+                {"type": "KBaseNarrative.Narrative", "data": narrative, "objid": 1}
+            ],
+        }
+    ]
+
+
+def make_batch(param_sets: int) -> list:
+    """
+    Returns the params of a run_job_batch call with the given number of parameter sets.
+    """
+    jobs = [
+        {
+            "method": "kb_uploadmethods.import_fastq_sra_as_reads_from_staging",
+            "app_id": "kb_uploadmethods/import_fastq_sra_as_reads_from_staging",
+            "service_ver": "a1b2c3d4e5f60718293a4b5c6d7e8f9012345678",
+            "params": [
+                {
+                    "fastq_fwd_staging_file_name": f"sample_{idx}_R1.fastq.gz",
+                    "fastq_rev_staging_file_name": f"sample_{idx}_R2.fastq.gz",
+                    "sequencing_tech": "Illumina",
+                    "name": f"sample_{idx}_reads",
+                    "workspace_id": 12345,
+                }
+            ],
+            "wsid": 12345,
+            "meta": {"cell_id": "bulk-import-cell", "run_id": f"run-{idx}"},
+        }
+        for idx in range(param_sets)
+    ]
+    return [jobs, {"wsid": 12345}]
+
+
+def make_params(shape: dict) -> tuple:
+    if "param_sets" in shape:
+        return "execution_engine2.run_job_batch", make_batch(shape["param_sets"])
+    return "Workspace.save_objects", make_narrative(shape["cells"], shape["output_size"])
+
+
+def send(method: str, params: list, compress_min_bytes) -> dict:
+    """
+    Sends one request through a BaseClient with a fake session, and returns its
+    wire_stats, and how long the call took.
+    """
+    client = BaseClient("https://example.com/services/ws", token="benchmark")
+    client.compress_min_bytes = compress_min_bytes
+    client.session = mock.Mock()
+    client.session.post.return_value = mock.Mock(
+        status_code=200, ok=True, content=b'{"result": [null]}'
+    )
+    start = time.perf_counter()
+    client.call_method(method, params)
+    elapsed = time.perf_counter() - start
+    return dict(client.wire_stats.as_dict(), time_s=elapsed)
+
+
+def run(payloads: list, repeat: int = 3) -> dict:
+    results = list()
+    for name in payloads:
+        method, params = make_params(PAYLOADS[name])
+        result = {"payload": name, "method": method}
+        for label, min_bytes in (
+            ("uncompressed", None),
+            ("compressed", clients.COMPRESS_MIN_BYTES),
+        ):
+            runs = [send(method, params, min_bytes) for _ in range(repeat)]
+            best = min(runs, key=lambda stats: stats["time_s"])
+            result[label] = {
+                "body_bytes": best["body_bytes"],
+                "sent_bytes": best["sent_bytes"],
+                "compressed": bool(best["compressed_requests"]),
+                "time_s": best["time_s"],
+            }
+        result["ratio"] = result["compressed"]["sent_bytes"] / max(
+            result["uncompressed"]["sent_bytes"], 1
+        )
+        results.append(result)
+    return {
+        "benchmark": "request_compression",
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "compress_min_bytes": clients.COMPRESS_MIN_BYTES,
+        "repeat": repeat,
+        "payloads": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--payloads",
+        nargs="+",
+        choices=sorted(PAYLOADS),
+        default=list(PAYLOADS),
+        help="requests to send (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="sends of each request")
+    parser.add_argument("--output", help="file to write the results to (default: stdout)")
+    args = parser.parse_args()
+
+    results = run(args.payloads, repeat=args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
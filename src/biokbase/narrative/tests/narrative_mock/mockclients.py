@@ -300,8 +300,9 @@ class MockClients:
 
     def get_job_logs(self, params):
         """
-        params: job_id, skip_lines
+        params: job_id, skip_lines, limit
         skip_lines = number of lines to skip, get all the rest
+        limit = optional, the maximum number of lines to return
 
         single line: {
             is_error 0,1
@@ -317,6 +318,8 @@ class MockClients:
                 lines.append(
                     {"is_error": 0, "line": "This is line {}".format(i + skip)}
                 )
+        if params.get("limit"):
+            lines = lines[: params["limit"]]
         return {"last_line_number": max(total_lines, skip), "lines": lines}
 
     # ----- Service Wizard functions -----
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+import biokbase.narrative.clients as clients
+from biokbase.narrative.common.url_config import URLS
+from .util import make_rpc_response
+
+
+class ClientsTestCase(unittest.TestCase):
+    def setUp(self):
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+    def test_get__cached(self):
+        ws = clients.get("workspace", token="foo")
+        self.assertIs(ws, clients.get("workspace", token="foo"))
+        self.assertIsNot(ws, clients.get("workspace", token="bar"))
+        self.assertIsNot(ws, clients.get("catalog", token="foo"))
+
+    def test_get__env_token(self):
+        with mock.patch.dict("os.environ", {"KB_AUTH_TOKEN": "foo"}):
+            ws = clients.get("workspace")
+            self.assertIs(ws, clients.get("workspace", token="foo"))
+        with mock.patch.dict("os.environ", {"KB_AUTH_TOKEN": "bar"}):
+            self.assertIsNot(ws, clients.get("workspace"))
+
+    def test_get__unknown(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown client name "nope"'):
+            clients.get("nope")
+
+    def test_sessions(self):
+        ws = clients.get("workspace", token="foo")
+        ws2 = clients.get("workspace", token="bar")
+        ee2 = clients.get("execution_engine2", token="foo")
+        nms = clients.get("narrative_method_store", token="foo")
+        self.assertIsNotNone(ws._client.session)
+        self.assertIs(ws._client.session, ws2._client.session)
+        self.assertIs(ws._client.session, clients.get_session(URLS.workspace))
+        self.assertIs(nms.session, clients.get_session(URLS.narrative_method_store))
+        # same host, so same session
+        self.assertIs(ws._client.session, ee2._client.session)
+        self.assertIsNot(
+            clients.get_session("https://example.com/services/ws"),
+            clients.get_session("http://example.com/services/ws"),
+        )
+
+    def test_reset(self):
+        ws = clients.get("workspace", token="foo")
+        session = ws._client.session
+        with mock.patch.object(session, "close") as close:
+            clients.reset()
+            close.assert_called_once()
+        self.assertIsNot(ws, clients.get("workspace", token="foo"))
+        self.assertIsNot(session, clients.get_session(URLS.workspace))
+
+    def test_configure_sessions(self):
+        ws = clients.get("workspace", token="foo")
+        self.addCleanup(
+            clients.configure_sessions,
+            clients.POOL_CONNECTIONS,
+            clients.POOL_MAXSIZE,
+            clients.KEEP_ALIVE,
+        )
+        clients.configure_sessions(pool_maxsize=3, keep_alive=False)
+        self.assertIsNot(ws, clients.get("workspace", token="foo"))
+        session = clients.get_session(URLS.workspace)
+        adapter = session.get_adapter(URLS.workspace)
+        self.assertEqual(3, adapter._pool_maxsize)
+        self.assertEqual("close", session.headers["Connection"])
+
+    def test_call__uses_session(self):
+        ws = clients.get("workspace", token="foo")
+        resp = mock.Mock(status_code=200, ok=True, content=b'{"result": ["0.1.0"]}')
+        with mock.patch.object(ws._client.session, "post", return_value=resp) as post:
+            self.assertEqual("0.1.0", ws.ver())
+        post.assert_called_once()
+        self.assertEqual(URLS.workspace, post.call_args[0][0])
+
+
+class CallManyTestCase(unittest.TestCase):
+    def setUp(self):
+        clients.reset()
+        self.addCleanup(clients.reset)
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, **kwargs):
+        """
+        Answers with the first param, or an error if it's "fail". Earlier calls take
+        longer, so they finish out of order.
+        """
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        body = json.loads(data)
+        value = body["params"][0]
+        time.sleep(0.01 * (5 - value) if isinstance(value, int) else 0)
+        with self.lock:
+            self.running -= 1
+        if value == "fail":
+            return make_rpc_response(error="it failed")
+        return make_rpc_response(result=value)
+
+    def test_call_many(self):
+        ws = clients.get("workspace", token="foo")
+        calls = [("Workspace.echo", [i]) for i in range(5)]
+        calls.insert(2, ("Workspace.echo", ["fail"]))
+        with mock.patch.object(ws._client.session, "post", side_effect=self.post):
+            results = ws.call_many(calls, max_workers=3)
+        self.assertEqual([0, 1], results[:2])
+        self.assertEqual([2, 3, 4], results[3:])
+        self.assertIsInstance(results[2], Exception)
+        self.assertEqual("it failed", results[2].message)
+        self.assertEqual(3, self.max_running)
+
+    def test_call_many__empty(self):
+        ws = clients.get("workspace", token="foo")
+        self.assertEqual([], ws.call_many([]))
+
+    def test_call_many__nms(self):
+        nms = clients.get("narrative_method_store", token="foo")
+        calls = [("NarrativeMethodStore.echo", [i]) for i in range(4)]
+
+        # NMS decodes ret.text itself
+        def post(url, data=None, **kwargs):
+            value = json.loads(data)["params"][0]
+            resp = mock.Mock(status_code=200)
+            resp.text = json.dumps({"result": [value]})
+            return resp
+
+        with mock.patch.object(nms.session, "post", side_effect=post):
+            self.assertEqual([0, 1, 2, 3], nms.call_many(calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -503,6 +503,89 @@ class JobTest(unittest.TestCase):
             state = job.output_state()
         self.assertEqual(expected, state)
 
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_output_state__terminal__cached(self):
+        job = create_job_from_ee2(JOB_COMPLETED)
+        with mock.patch.object(
+            Job, "get_viewer_params", wraps=job.get_viewer_params
+        ) as m:
+            output_state = job.output_state()
+            self.assertEqual(get_test_job_state(JOB_COMPLETED), output_state)
+            # same state again, so no change
+            self.assertIs(output_state, job.output_state())
+            self.assertIs(
+                output_state, job.output_state(get_test_job(JOB_COMPLETED))
+            )
+        m.assert_called_once()
+
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_output_state__terminal__invalidated(self):
+        job = create_job_from_ee2(JOB_ERROR)
+        output_state = job.output_state()
+
+        # state changes, e.g. after a retry updates it
+        new_state = get_test_job(JOB_ERROR)
+        new_state["updated"] += 1000
+        new_output_state = job.output_state(new_state)
+        self.assertIsNot(output_state, new_output_state)
+        self.assertEqual(new_state["updated"], new_output_state["state"]["updated"])
+        self.assertIs(new_output_state, job.output_state())
+
+        # forced refresh
+        with assert_obj_method_called(MockClients, "check_job"):
+            refreshed_output_state = job.output_state(force_refresh=True)
+        self.assertIsNot(new_output_state, refreshed_output_state)
+        self.assertEqual(get_test_job_state(JOB_ERROR), refreshed_output_state)
+
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_output_state__active__not_cached(self):
+        job = create_job_from_ee2(JOB_RUNNING)
+        output_state = job.output_state()
+        self.assertEqual(get_test_job_state(JOB_RUNNING), output_state)
+        self.assertIsNone(job._cached_output_state)
+        with assert_obj_method_called(MockClients, "check_job"):
+            self.assertIsNot(output_state, job.output_state())
+
+    def test_job_update__copy_on_write(self):
+        job = create_job_from_ee2(JOB_RUNNING)
+        old_acc_state = job._acc_state
+        old_state = job._internal_state(JOB_INIT_EXCLUDED_JOB_STATE_FIELDS)
+
+        # nothing changed, so nothing is copied
+        job._update_state(get_test_job(JOB_RUNNING))
+        self.assertIs(old_acc_state, job._acc_state)
+
+        job._update_state({"job_id": JOB_RUNNING, "status": "completed", "finished": 1})
+        self.assertIsNot(old_acc_state, job._acc_state)
+        self.assertEqual(create_state_from_ee2(JOB_RUNNING), old_state)
+        self.assertEqual(get_test_job(JOB_RUNNING), old_acc_state)
+        self.assertEqual("completed", job._acc_state["status"])
+        # unchanged nested values are shared
+        self.assertIs(old_acc_state["job_input"], job._acc_state["job_input"])
+
+    def test_job_setattr__copy_on_write(self):
+        job = create_job_from_ee2(JOB_RUNNING)
+        old_acc_state = job._acc_state
+        old_cell_id = job.cell_id
+        job.cell_id = "some_other_cell"
+        job.app_id = "some/app"
+        self.assertEqual("some_other_cell", job.cell_id)
+        self.assertEqual("some/app", job.app_id)
+        self.assertEqual(
+            old_cell_id, old_acc_state["job_input"]["narrative_cell_info"]["cell_id"]
+        )
+        self.assertEqual(get_test_job(JOB_RUNNING), old_acc_state)
+
+    def test_internal_state__projection(self):
+        job = create_job_from_ee2(JOB_COMPLETED)
+        state = job._internal_state(EXCLUDED_JOB_STATE_FIELDS)
+        for field in EXCLUDED_JOB_STATE_FIELDS:
+            self.assertNotIn(field, state)
+        # modifying the top level doesn't affect the job
+        state["status"] = "error"
+        self.assertEqual("completed", job._acc_state["status"])
+        self.assertIs(job._acc_state["job_output"], state["job_output"])
+
     def test_job_update__no_state(self):
         """
         test that without a state object supplied, the job state is unchanged
@@ -616,6 +699,28 @@ class JobTest(unittest.TestCase):
         self.assertEqual(logs[0], total_lines)
         self.assertEqual(len(logs[1]), 0)
 
+    @mock.patch("biokbase.narrative.jobs.joblog.clients.get", get_mock_client)
+    def test_log__per_job(self):
+        job = create_job_from_ee2(JOB_COMPLETED)
+        other_job = create_job_from_ee2(JOB_RUNNING)
+        job.log()
+        self.assertIsNot(job._job_log, other_job._job_log)
+        self.assertEqual(0, other_job._job_log.num_lines)
+        self.assertTrue(job._job_log.complete)
+        # the job's done, so its log isn't fetched again
+        with assert_obj_method_called(MockClients, "get_job_logs", call_status=False):
+            self.assertEqual(100, job.log()[0])
+
+    @mock.patch("biokbase.narrative.jobs.joblog.clients.get", get_mock_client)
+    def test_log__latest_only(self):
+        job = create_job_from_ee2(JOB_RUNNING)
+        (num_lines, lines) = job.log(first_line=10, num_lines=5, latest_only=True)
+        self.assertEqual(100, num_lines)
+        self.assertEqual(
+            [f"This is line {i}" for i in range(95, 100)], [line["line"] for line in lines]
+        )
+        self.assertFalse(job._job_log.complete)
+
     @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
     def test_parameters(self):
         """
@@ -772,6 +877,46 @@ class JobTest(unittest.TestCase):
             )
             self.assertEqual(exp, got)
 
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_query_job_states__one_chunk(self):
+        # a single chunk is fetched without a thread pool
+        with mock.patch("biokbase.narrative.jobs.job.ThreadPoolExecutor") as pool:
+            states = Job.query_ee2_states(ALL_JOBS, init=True)
+        pool.assert_not_called()
+        self.assertEqual(set(ALL_JOBS), set(states.keys()))
+
+    @mock.patch("biokbase.narrative.jobs.job.CHECK_JOBS_CHUNK_SIZE", 3)
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_query_job_states__chunked(self):
+        with assert_obj_method_called(MockClients, "check_jobs") as aomc:
+            states = Job.query_ee2_states(ALL_JOBS, init=True)
+        self.assertEqual(set(ALL_JOBS), set(states.keys()))
+        chunk_calls = [call[1][0]["job_ids"] for call in aomc.calls]
+        self.assertEqual((len(ALL_JOBS) + 2) // 3, len(chunk_calls))
+        self.assertCountEqual(ALL_JOBS, [j for chunk in chunk_calls for j in chunk])
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunk_calls))
+
+    @mock.patch("biokbase.narrative.jobs.job.CHECK_JOBS_CHUNK_SIZE", 3)
+    @mock.patch("biokbase.narrative.jobs.job.clients.get", get_mock_client)
+    def test_query_job_states__chunk_error(self):
+        bad_chunk = ALL_JOBS[3:6]
+        check_jobs = MockClients.check_jobs
+
+        def mock_check_jobs(self, params):
+            if params["job_ids"] == bad_chunk:
+                raise Exception("Test exception")
+            return check_jobs(self, params)
+
+        with mock.patch.object(MockClients, "check_jobs", mock_check_jobs):
+            errors = dict()
+            states = Job.query_ee2_states(ALL_JOBS, init=True, errors=errors)
+            self.assertEqual(set(ALL_JOBS) - set(bad_chunk), set(states.keys()))
+            self.assertEqual(set(bad_chunk), set(errors.keys()))
+            self.assertEqual("Test exception", str(errors[bad_chunk[0]]))
+
+            with self.assertRaisesRegex(Exception, "Test exception"):
+                Job.query_ee2_states(ALL_JOBS, init=True)
+
     NEW_RETRY_IDS = ["hello", "goodbye"]
     NEW_CHILD_JOBS = ["cerulean", "magenta"]
 
@@ -1,11 +1,18 @@
+import base64
+import copy
+import json
 import unittest
+import zlib
 from unittest import mock
 import os
 import itertools
 import re
+import threading
+import time
 
 from biokbase.narrative.exception_util import transform_job_exception
 from biokbase.narrative.jobs.jobcomm import exc_to_msg
+from biokbase.narrative.jobs.job import Job
 import biokbase.narrative.jobs.jobcomm
 import biokbase.narrative.jobs.jobmanager
 from biokbase.narrative.jobs.jobmanager import (
@@ -20,6 +27,19 @@ from biokbase.narrative.jobs.jobcomm import (
     JobComm,
     JOB_NOT_PROVIDED_ERR,
     JOBS_NOT_PROVIDED_ERR,
+    LOOKUP_MODE_ALL,
+    LOOKUP_MODE_DELTA,
+    LOOKUP_TIMER_INTERVAL,
+    MIN_LOOKUP_TIMER_INTERVAL,
+    REQUEST_MODE_ASYNC,
+    LOG_FOLLOW_INTERVAL,
+    REQUEST_MODE_SYNC,
+    REQUEST_PRIORITY_INTERACTIVE,
+    REQUEST_PRIORITY_LOOKUP,
+    JobRequestExecutor,
+    BATCH_MSG_TYPE,
+    COMPRESSED_MSG_TYPE,
+    COMPRESS_THRESHOLD,
 )
 from biokbase.narrative.exception_util import (
     NarrativeException,
@@ -112,6 +132,10 @@ class JobCommTestCase(unittest.TestCase):
         self.jc._comm.clear_message_cache()
         self.jc._jm.initialize_jobs()
         self.jc.stop_job_status_loop()
+        self.jc._lookup_mode = LOOKUP_MODE_ALL
+        self.jc.set_request_mode(REQUEST_MODE_SYNC)
+        self.jc.stop_following_job_logs()
+        self.jc.set_comm_capabilities([])
         self.job_states = get_test_job_states()
 
     def check_error_message(self, source, input_, err):
@@ -331,6 +355,190 @@ class JobCommTestCase(unittest.TestCase):
             self.assertIsInstance(job_id, str)
             validate_job_state(state)
 
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_start_stop_job_status_loop__delta(self):
+        self.jc.start_job_status_loop(mode=LOOKUP_MODE_DELTA)
+        self.assertEqual(LOOKUP_MODE_DELTA, self.jc._lookup_mode)
+        msg = self.jc._comm.last_message
+        self.assertEqual(
+            {
+                "msg_type": "job_status_delta",
+                "content": get_test_job_states(ACTIVE_JOBS),
+            },
+            msg["data"],
+        )
+        self.assertTrue(self.jc._running_lookup_loop)
+        self.assertIsNotNone(self.jc._lookup_timer)
+
+        self.jc.stop_job_status_loop()
+        self.assertFalse(self.jc._running_lookup_loop)
+        self.assertIsNone(self.jc._lookup_timer)
+        self.assertIsNone(self.jc._last_job_updates)
+
+    @mock.patch("biokbase.narrative.jobs.jobcomm.threading.Timer")
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_start_job_status_loop__concurrent(self, mock_timer):
+        # e.g. start_job_update requests on several request workers at once
+        started = threading.Event()
+        release = threading.Event()
+        lookup = self.jc._lookup_scheduled_job_states
+
+        def slow_lookup():
+            started.set()
+            release.wait(5)
+            return lookup()
+
+        with mock.patch.object(
+            self.jc, "_lookup_scheduled_job_states", side_effect=slow_lookup
+        ) as tick:
+            threads = [
+                threading.Thread(target=self.jc.start_job_status_loop) for _ in range(4)
+            ]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+                thread.join(5)
+            release.set()
+            threads[0].join(5)
+        # one tick, and one Timer for the next one
+        tick.assert_called_once()
+        mock_timer.assert_called_once_with(mock.ANY, self.jc._lookup_timer_fired)
+        self.assertIs(mock_timer.return_value, self.jc._lookup_timer)
+
+        self.jc.stop_job_status_loop()
+        mock_timer.return_value.cancel.assert_called_once()
+        self.assertFalse(self.jc._lookup_ticking)
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_lookup_timer_fired__stale(self):
+        # a Timer that fires after the loop it belonged to was stopped doesn't tick
+        with mock.patch.object(self.jc, "_lookup_job_status_loop") as tick:
+            thread = threading.Thread(target=self.jc._lookup_timer_fired)
+            thread.start()
+            thread.join(5)
+        tick.assert_not_called()
+        self.assertIsNone(self.jc._lookup_timer)
+
+    def test_start_job_status_loop__bad_mode(self):
+        with self.assertRaisesRegex(ValueError, "Unknown job status loop mode 'foo'"):
+            self.jc.start_job_status_loop(mode="foo")
+        self.assertFalse(self.jc._running_lookup_loop)
+        self.assertEqual(LOOKUP_MODE_ALL, self.jc._lookup_mode)
+
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_lookup_scheduled_job_states__terminal_interval(self):
+        now = [1000]
+        with mock.patch("biokbase.narrative.jobs.jobcomm.time.time", lambda: now[0]):
+            # the first lookup sends everything
+            states = self.jc._lookup_scheduled_job_states()
+            self.assertEqual(set(EXP_ALL_STATE_IDS), set(states.keys()))
+            self.assertEqual(1, len(self.jc._comm.messages))
+
+            # before LOOKUP_TIMER_INTERVAL is up, only the due jobs are sent, if any
+            now[0] += MIN_LOOKUP_TIMER_INTERVAL
+            self.assertEqual({}, self.jc._lookup_scheduled_job_states())
+            self.assertEqual(1, len(self.jc._comm.messages))
+            self.jm._running_jobs[JOB_RUNNING]["poll_at"] = 0
+            states = self.jc._lookup_scheduled_job_states()
+            self.assertEqual([JOB_RUNNING], list(states.keys()))
+            self.assertEqual(
+                {"msg_type": "job_status_all", "content": states},
+                self.jc._comm.last_message["data"],
+            )
+
+            # then the terminal jobs are sent again
+            now[0] += LOOKUP_TIMER_INTERVAL
+            states = self.jc._lookup_scheduled_job_states()
+            self.assertTrue(set(TERMINAL_JOBS).issubset(states.keys()))
+            self.assertEqual(3, len(self.jc._comm.messages))
+
+    def test_get_lookup_interval(self):
+        with mock.patch.object(
+            self.jm, "get_next_poll_time", return_value=None
+        ), mock.patch("biokbase.narrative.jobs.jobcomm.time.time", lambda: 1000):
+            self.assertEqual(LOOKUP_TIMER_INTERVAL, self.jc._get_lookup_interval(True))
+
+        for next_poll_time, interval in [
+            (0, MIN_LOOKUP_TIMER_INTERVAL),
+            (1000, MIN_LOOKUP_TIMER_INTERVAL),
+            (1000 + LOOKUP_TIMER_INTERVAL - 1, LOOKUP_TIMER_INTERVAL - 1),
+            (1000 + LOOKUP_TIMER_INTERVAL * 10, LOOKUP_TIMER_INTERVAL),
+        ]:
+            with mock.patch.object(
+                self.jm, "get_next_poll_time", return_value=next_poll_time
+            ), mock.patch("biokbase.narrative.jobs.jobcomm.time.time", lambda: 1000):
+                self.assertEqual(interval, self.jc._get_lookup_interval(False))
+
+    # -----------------------
+    # Lookup job states delta
+    # -----------------------
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_lookup_job_states_delta__no_change(self):
+        states = self.jc._lookup_job_states_delta()
+        self.assertEqual(get_test_job_states(ACTIVE_JOBS), states)
+        self.assertEqual(1, len(self.jc._comm.messages))
+        self.assertEqual(
+            {
+                "msg_type": "job_status_delta",
+                "content": get_test_job_states(ACTIVE_JOBS),
+            },
+            self.jc._comm.last_message["data"],
+        )
+
+        # no jobs are due to be polled yet
+        states = self.jc._lookup_job_states_delta()
+        self.assertEqual({}, states)
+        self.assertEqual(1, len(self.jc._comm.messages))
+
+        # nothing changed, so nothing gets sent
+        self.jm.set_hot_polling(ACTIVE_JOBS)
+        states = self.jc._lookup_job_states_delta()
+        self.assertEqual(get_test_job_states(ACTIVE_JOBS), states)
+        self.assertEqual(1, len(self.jc._comm.messages))
+
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_lookup_job_states_delta__change(self):
+        self.jc._lookup_job_states_delta()
+        self.jc._comm.clear_message_cache()
+
+        check_jobs = MockClients.check_jobs
+
+        def mock_check_jobs(params):
+            states = check_jobs(MockClients(), params)
+            states[JOB_RUNNING]["updated"] += 1000
+            return states
+
+        self.jm.set_hot_polling(ACTIVE_JOBS)
+        with mock.patch.object(MockClients, "check_jobs", side_effect=mock_check_jobs):
+            states = self.jc._lookup_job_states_delta()
+
+        self.assertEqual(set(ACTIVE_JOBS), set(states.keys()))
+        msg = self.jc._comm.last_message
+        self.assertEqual("job_status_delta", msg["data"]["msg_type"])
+        self.assertEqual([JOB_RUNNING], list(msg["data"]["content"].keys()))
+        self.assertEqual(
+            get_test_job(JOB_RUNNING)["updated"] + 1000,
+            msg["data"]["content"][JOB_RUNNING]["state"]["updated"],
+        )
+
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_lookup_job_states_delta__no_refresh(self):
+        self.jm.modify_job_refresh(ACTIVE_JOBS, -1)
+        states = self.jc._lookup_job_states_delta()
+        self.assertEqual({}, states)
+        self.assertIsNone(self.jc._comm.last_message)
+
     # -----------------------
     # Lookup single job state
     # -----------------------
@@ -502,6 +710,69 @@ class JobCommTestCase(unittest.TestCase):
             "job_status_batch", {"job_id": job_id}, err
         )
 
+    # -----------------------
+    # Lookup batch job summary
+    # -----------------------
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_lookup_batch_summary__ok(self):
+        job_id = BATCH_PARENT
+        req = make_comm_msg("job_status_batch_summary", job_id, False)
+        self.jc._handle_comm_message(req)
+        msg = self.jc._comm.last_message
+        self.assertEqual("job_status_batch_summary", msg["data"]["msg_type"])
+        content = msg["data"]["content"]
+        self.assertEqual(BATCH_PARENT, content["batch_id"])
+        self.assertEqual(len(BATCH_CHILDREN), content["summary"]["child_count"])
+        self.assertEqual(sorted(BATCH_CHILDREN), content["summary"]["changed"])
+        self.assertEqual(
+            {
+                job_id: self.job_states[job_id]
+                for job_id in [BATCH_PARENT] + BATCH_CHILDREN
+            },
+            content["job_states"],
+        )
+
+        # only the parent state is sent when no children have changed since the summary
+        # the request gives
+        seq = content["summary"]["seq"]
+        req = make_comm_msg("job_status_batch_summary", job_id, False, {"since": seq})
+        with mock.patch.object(
+            Job, "output_state", autospec=True, side_effect=Job.output_state
+        ) as output_state:
+            self.jc._handle_comm_message(req)
+        content = self.jc._comm.last_message["data"]["content"]
+        self.assertEqual([], content["summary"]["changed"])
+        self.assertEqual([BATCH_PARENT], list(content["job_states"].keys()))
+        # and only its output state is built
+        self.assertEqual(
+            [BATCH_PARENT], [c[0][0].job_id for c in output_state.call_args_list]
+        )
+
+        # a child that changes is sent to each request that's from before the change
+        child_id = BATCH_CHILDREN[0]
+        self.jm.get_job(child_id)._update_state(
+            {"job_id": child_id, "updated": 9999999999999}
+        )
+        for _ in range(2):
+            self.jc._handle_comm_message(req)
+            content = self.jc._comm.last_message["data"]["content"]
+            self.assertEqual([child_id], content["summary"]["changed"])
+            self.assertEqual(
+                [BATCH_PARENT, child_id], list(content["job_states"].keys())
+            )
+
+    def test_lookup_batch_summary__not_batch(self):
+        job_id = JOB_CREATED
+        req = make_comm_msg("job_status_batch_summary", job_id, False)
+        err = JobIDException(JOB_NOT_BATCH_ERR, job_id)
+        with self.assertRaisesRegex(type(err), re.escape(str(err))):
+            self.jc._handle_comm_message(req)
+        self.check_error_message(
+            "job_status_batch_summary", {"job_id": job_id}, err
+        )
+
     # -----------------------
     # Lookup job info
     # -----------------------
@@ -715,16 +986,22 @@ class JobCommTestCase(unittest.TestCase):
         get_failing_mock_client,
     )
     def test_cancel_jobs__failure(self):
-        job_id_list = [JOB_RUNNING]
+        job_id_list = [JOB_RUNNING, JOB_CREATED, JOB_COMPLETED]
         req = make_comm_msg("cancel_job", job_id_list, False)
-        with self.assertRaises(NarrativeException) as e:
-            self.jc._handle_comm_message(req)
-        self.assertIn("Can't cancel job", str(e.exception))
-        msg = self.jc._comm.last_message
-        self.assertEqual("job_comm_error", msg["data"]["msg_type"])
-        self.assertEqual("cancel_job", msg["data"]["content"]["source"])
-        self.assertEqual(job_id_list, msg["data"]["content"]["job_id_list"])
-        self.assertEqual("Unable to cancel job", msg["data"]["content"]["error"])
+        # the errors are per job, and don't stop the states being sent
+        self.jc._handle_comm_message(req)
+        messages = [msg["data"] for msg in self.jc._comm.messages]
+        self.assertEqual("job_status", messages[0]["msg_type"])
+        self.assertEqual(set(job_id_list), set(messages[0]["content"].keys()))
+        self.assertEqual(
+            ["job_comm_error"] * 2, [msg["msg_type"] for msg in messages[1:]]
+        )
+        errors = {msg["content"]["job_id"]: msg["content"] for msg in messages[1:]}
+        self.assertEqual({JOB_RUNNING, JOB_CREATED}, set(errors.keys()))
+        for content in errors.values():
+            self.assertEqual("cancel_job", content["source"])
+            self.assertEqual("Unable to cancel job", content["error"])
+            self.assertIn("Can't cancel job", content["message"])
 
     # ------------
     # Retry list of jobs
@@ -864,6 +1141,78 @@ class JobCommTestCase(unittest.TestCase):
         self.assertEqual("job_comm_error", msg["data"]["msg_type"])
         self.assertEqual("Unable to retrieve job logs", msg["data"]["content"]["error"])
 
+    # ------------
+    # Follow job logs
+    # ------------
+    @mock.patch("biokbase.narrative.jobs.jobcomm.LOG_FOLLOW_MAX_LINES", 60)
+    @mock.patch("biokbase.narrative.jobs.jobcomm.threading.Timer")
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_follow_job_logs__terminal(self, mock_timer):
+        req = make_comm_msg("job_logs_follow", JOB_COMPLETED, False)
+        self.jc._handle_comm_message(req)
+        content = self.jc._comm.last_message["data"]["content"]
+        self.assertEqual("job_logs", self.jc._comm.last_message["data"]["msg_type"])
+        self.assertEqual(
+            (0, 60, 100), (content["first"], len(content["lines"]), content["max_lines"])
+        )
+        self.assertTrue(content["following"])
+        mock_timer.assert_called_once_with(
+            LOG_FOLLOW_INTERVAL, self.jc._send_followed_job_logs, [JOB_COMPLETED]
+        )
+
+        # the timer fires: the rest of the log gets sent, and that's the end of it
+        self.jc._send_followed_job_logs(JOB_COMPLETED)
+        content = self.jc._comm.last_message["data"]["content"]
+        self.assertEqual((60, 40), (content["first"], len(content["lines"])))
+        self.assertEqual("This is line 60", content["lines"][0]["line"])
+        self.assertFalse(content["following"])
+        self.assertEqual(1, mock_timer.call_count)
+        self.assertNotIn(JOB_COMPLETED, self.jc._log_follows)
+
+    @mock.patch("biokbase.narrative.jobs.jobcomm.threading.Timer")
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_follow_job_logs__active(self, mock_timer):
+        req = make_comm_msg("job_logs_follow", JOB_RUNNING, False, {"first_line": 90})
+        self.jc._handle_comm_message(req)
+        content = self.jc._comm.last_message["data"]["content"]
+        self.assertEqual((90, 10), (content["first"], len(content["lines"])))
+        self.assertTrue(content["following"])
+
+        # no new lines, so nothing gets sent, but it keeps following
+        self.jc._comm.clear_message_cache()
+        self.jc._send_followed_job_logs(JOB_RUNNING)
+        self.assertIsNone(self.jc._comm.last_message)
+        self.assertEqual(2, mock_timer.call_count)
+        self.assertEqual(100, self.jc._log_follows[JOB_RUNNING]["next_line"])
+
+        # stop following
+        timer = self.jc._log_follows[JOB_RUNNING]["timer"]
+        req = make_comm_msg("stop_job_logs_follow", JOB_RUNNING, False)
+        self.jc._handle_comm_message(req)
+        timer.cancel.assert_called_once()
+        self.assertNotIn(JOB_RUNNING, self.jc._log_follows)
+        self.jc._send_followed_job_logs(JOB_RUNNING)
+        self.assertIsNone(self.jc._comm.last_message)
+
+    @mock.patch("biokbase.narrative.jobs.jobcomm.threading.Timer")
+    @mock.patch("biokbase.narrative.clients.get", get_failing_mock_client)
+    def test_follow_job_logs__failure(self, mock_timer):
+        req = make_comm_msg("job_logs_follow", JOB_COMPLETED, False)
+        self.jc._handle_comm_message(req)
+        msg = self.jc._comm.last_message
+        self.assertEqual("job_comm_error", msg["data"]["msg_type"])
+        self.assertEqual("job_logs_follow", msg["data"]["content"]["source"])
+        self.assertEqual(JOB_COMPLETED, msg["data"]["content"]["job_id"])
+        mock_timer.assert_not_called()
+        self.assertNotIn(JOB_COMPLETED, self.jc._log_follows)
+
+    def test_follow_job_logs__no_job(self):
+        req = make_comm_msg("job_logs_follow", JOB_NOT_FOUND, False)
+        err = JobIDException(JOB_NOT_REG_ERR, JOB_NOT_FOUND)
+        with self.assertRaisesRegex(type(err), str(err)):
+            self.jc._handle_comm_message(req)
+        self.assertNotIn(JOB_NOT_FOUND, self.jc._log_follows)
+
     def test_get_job_logs_no_job(self):
         job_id = None
         req = make_comm_msg("job_logs", job_id, False)
@@ -1075,6 +1424,182 @@ class JobCommTestCase(unittest.TestCase):
             )
         self.assertIn(f"Unknown KBaseJobs message '{unknown}'", str(e.exception))
 
+    # ------------------------
+    # Async request mode
+    # ------------------------
+    def _wait_for_requests(self):
+        self.jc._request_executor.shutdown(wait=True)
+        self.jc.set_request_mode(REQUEST_MODE_SYNC)
+
+    def test_set_request_mode__bad_mode(self):
+        with self.assertRaisesRegex(ValueError, "Unknown request mode 'nope'"):
+            self.jc.set_request_mode("nope")
+        self.assertIsNone(self.jc._request_executor)
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_handle_comm_message__async(self):
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        self.assertIsInstance(self.jc._request_executor, JobRequestExecutor)
+        req = make_comm_msg("job_status", [JOB_COMPLETED, JOB_RUNNING], False)
+        self.jc._handle_comm_message(req)
+        self._wait_for_requests()
+        msg = self.jc._comm.last_message
+        self.assertEqual(msg["data"]["msg_type"], "job_status")
+        self.assertEqual(
+            set(msg["data"]["content"].keys()), {JOB_COMPLETED, JOB_RUNNING}
+        )
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_handle_comm_message__async__dedupe_and_priority(self):
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC, max_workers=1)
+        gate = threading.Event()
+        # hold up the only worker until everything is submitted
+        self.jc._request_executor.submit([], gate.wait, 5)
+        status_req = make_comm_msg("job_status", [JOB_COMPLETED, JOB_RUNNING], False)
+        for _ in range(3):
+            self.jc._handle_comm_message(copy.deepcopy(status_req))
+        self.jc._handle_comm_message(make_comm_msg("cancel_job", [JOB_TERMINATED], False))
+        gate.set()
+        self._wait_for_requests()
+
+        # the cancel goes first, and the status lookup only happens once
+        messages = [msg["data"] for msg in self.jc._comm.messages]
+        self.assertEqual(["job_status", "job_status"], [m["msg_type"] for m in messages])
+        self.assertEqual({JOB_TERMINATED}, set(messages[0]["content"].keys()))
+        self.assertEqual(
+            {JOB_COMPLETED, JOB_RUNNING}, set(messages[1]["content"].keys())
+        )
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_handle_comm_message__async__shared_lookups(self):
+        # lookups for overlapping jobs, on different workers at once, share their EE2 calls
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        fetcher = self.jm._state_fetcher
+        query = Job.query_ee2_states
+        started = threading.Event()
+        release = threading.Event()
+        calls = list()
+
+        def slow_query(job_ids, *args, **kwargs):
+            calls.append(sorted(job_ids))
+            if len(calls) == 1:
+                started.set()
+                release.wait(5)
+            return query(job_ids, *args, **kwargs)
+
+        job_id_lists = [
+            [JOB_CREATED, JOB_RUNNING],
+            [JOB_RUNNING, BATCH_RETRY_RUNNING],
+            [JOB_CREATED, BATCH_RETRY_RUNNING],
+        ]
+        with mock.patch.object(Job, "query_ee2_states", side_effect=slow_query):
+            self.jc._handle_comm_message(make_comm_msg("job_status", job_id_lists[0], False))
+            started.wait(5)
+            for job_ids in job_id_lists[1:]:
+                self.jc._handle_comm_message(make_comm_msg("job_status", job_ids, False))
+            for _ in range(500):
+                if len(fetcher._cond._waiters) == 2:
+                    break
+                time.sleep(0.01)
+            release.set()
+            self._wait_for_requests()
+
+        # the first call, then one for everything the others needed that it didn't have
+        self.assertEqual(
+            [sorted(job_id_lists[0]), [BATCH_RETRY_RUNNING]], calls
+        )
+        # each request still gets its own answer
+        messages = [msg["data"] for msg in self.jc._comm.messages]
+        self.assertEqual(
+            sorted(sorted(job_ids) for job_ids in job_id_lists),
+            sorted(sorted(msg["content"].keys()) for msg in messages),
+        )
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_handle_comm_message__async__lookup_then_cancel(self):
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        gate = threading.Event()
+        events = list()
+        get_job_states = self.jm.get_job_states
+        cancel_jobs = self.jm.cancel_jobs
+
+        def slow_get_job_states(job_ids):
+            gate.wait(5)
+            states = get_job_states(job_ids)
+            events.append("lookup")
+            return states
+
+        def record_cancel_jobs(job_ids, errors=None):
+            events.append("cancel")
+            return cancel_jobs(job_ids, errors=errors)
+
+        with mock.patch.object(
+            self.jm, "get_job_states", side_effect=slow_get_job_states
+        ), mock.patch.object(self.jm, "cancel_jobs", side_effect=record_cancel_jobs):
+            self.jc._handle_comm_message(make_comm_msg("job_status", [JOB_RUNNING], False))
+            self.jc._handle_comm_message(make_comm_msg("cancel_job", [JOB_RUNNING], False))
+            gate.set()
+            self._wait_for_requests()
+        # the cancel waits for the lookup, so the lookup can't send a state from before it
+        # after the cancel's
+        self.assertEqual(["lookup", "cancel"], events)
+        messages = [msg["data"]["msg_type"] for msg in self.jc._comm.messages]
+        self.assertEqual(["job_status", "job_status"], messages)
+
+    def test_handle_comm_message__async__error(self):
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        msg = {
+            "msg_id": "some_id",
+            "content": {"data": {"request_type": "retry_job"}},
+        }
+        # errors come back over the channel, but aren't raised
+        self.jc._handle_comm_message(msg)
+        self._wait_for_requests()
+        self.check_error_message(
+            "retry_job", {}, JobIDException(JOBS_NOT_PROVIDED_ERR)
+        )
+
+    def test_handle_comm_message__async__unknown(self):
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        unknown = "NotAJobRequest"
+        with self.assertRaisesRegex(ValueError, f"Unknown KBaseJobs message '{unknown}'"):
+            self.jc._handle_comm_message(
+                {"content": {"data": {"request_type": unknown}}}
+            )
+        self._wait_for_requests()
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_front_end_init(self):
+        # as run by getJobInitCode in jobCommChannel.js
+        self.jc.set_request_mode(REQUEST_MODE_ASYNC)
+        self.jc.start_job_status_loop(init_jobs=True, mode=LOOKUP_MODE_DELTA)
+        self.addCleanup(self.jc.stop_job_status_loop)
+        self.assertEqual(LOOKUP_MODE_DELTA, self.jc._lookup_mode)
+        self.assertEqual(
+            {
+                "msg_type": "job_status_delta",
+                "content": get_test_job_states(ACTIVE_JOBS),
+            },
+            self.jc._comm.last_message["data"],
+        )
+        # cells ask for the states of the other jobs themselves
+        self.jc._handle_comm_message(make_comm_msg("job_status", [JOB_COMPLETED], False))
+        self._wait_for_requests()
+        self.assertEqual(
+            {JOB_COMPLETED}, set(self.jc._comm.last_message["data"]["content"].keys())
+        )
+
+    def test_get_request_job_ids(self):
+        cases = [
+            (make_comm_msg("job_status", [JOB_COMPLETED, JOB_RUNNING], True),
+             [JOB_COMPLETED, JOB_RUNNING]),
+            (make_comm_msg("job_logs", JOB_RUNNING, True), [JOB_RUNNING]),
+            (make_comm_msg("job_status", [None, 5, JOB_RUNNING], True), [JOB_RUNNING]),
+            (JobRequest({"content": {"data": {"request_type": "all_status"}}}), []),
+        ]
+        for req, expected in cases:
+            self.assertEqual(self.jc._get_request_job_ids(req), expected)
+
     # From here, this test the ability for the _handle_comm_message function to
     # deal with the various types of messages that will get passed to it. While
     # the majority of the tests above are sent directly to the function to be
@@ -1295,6 +1820,267 @@ class JobCommTestCase(unittest.TestCase):
         msg = self.jc._comm.last_message
         self.assertEqual(msg["data"]["msg_type"], "job_status")
 
+    # ------------------------
+    # Outgoing message coalescing and compression
+    # ------------------------
+    def test_send_comm_message__plain(self):
+        self.jc.set_comm_capabilities(["not_a_capability"])
+        self.jc.send_comm_message("job_status", {"a": {"status": "running"}})
+        self.jc.send_comm_message("job_status", {"b": {"status": "running"}})
+        self.assertEqual(
+            [
+                {"msg_type": "job_status", "content": {"a": {"status": "running"}}},
+                {"msg_type": "job_status", "content": {"b": {"status": "running"}}},
+            ],
+            [msg["data"] for msg in self.jc._comm.messages],
+        )
+
+    def test_send_comm_message__coalesce(self):
+        self.jc.set_comm_capabilities(["coalesce"])
+        self.jc.send_comm_message("job_status", {"a": {"status": "queued"}})
+        self.jc.send_comm_message("job_status", {"a": {"status": "running"}})
+        self.jc.send_comm_message("job_status", {"b": {"status": "running"}})
+        self.jc.send_comm_message("new_job", {"job_id": "c"})
+        self.jc.send_comm_message("job_status", {"c": {"status": "created"}})
+        self.assertEqual([], self.jc._comm.messages)
+
+        self.jc.flush_comm_messages()
+        self.assertEqual(
+            [
+                {
+                    "msg_type": BATCH_MSG_TYPE,
+                    "content": {
+                        "messages": [
+                            {
+                                "msg_type": "job_status",
+                                "content": {
+                                    "a": {"status": "running"},
+                                    "b": {"status": "running"},
+                                },
+                            },
+                            {"msg_type": "new_job", "content": {"job_id": "c"}},
+                            {
+                                "msg_type": "job_status",
+                                "content": {"c": {"status": "created"}},
+                            },
+                        ]
+                    },
+                }
+            ],
+            [msg["data"] for msg in self.jc._comm.messages],
+        )
+
+    def test_send_comm_message__coalesce_timer(self):
+        self.jc.set_comm_capabilities(["coalesce"])
+        sent = threading.Event()
+        send = self.jc._comm.send
+
+        def send_and_set(*args, **kwargs):
+            send(*args, **kwargs)
+            sent.set()
+
+        with mock.patch.object(self.jc._comm, "send", side_effect=send_and_set):
+            self.jc.send_comm_message("new_job", {"job_id": "a"})
+            self.assertTrue(sent.wait(timeout=5))
+        # a single message goes out as itself
+        self.assertEqual(
+            {"msg_type": "new_job", "content": {"job_id": "a"}},
+            self.jc._comm.last_message["data"],
+        )
+
+    def test_send_comm_message__compress(self):
+        self.jc.set_comm_capabilities(["zlib"])
+        small = {"a": {"status": "running"}}
+        self.jc.send_comm_message("job_status", small)
+        self.assertEqual(
+            {"msg_type": "job_status", "content": small},
+            self.jc._comm.last_message["data"],
+        )
+
+        big = {str(i): {"status": "running"} for i in range(COMPRESS_THRESHOLD)}
+        self.jc.send_comm_message("job_status_all", big)
+        msg = self.jc._comm.last_message["data"]
+        self.assertEqual(COMPRESSED_MSG_TYPE, msg["msg_type"])
+        self.assertEqual("zlib+base64", msg["content"]["encoding"])
+        self.assertEqual(
+            {"msg_type": "job_status_all", "content": big},
+            json.loads(zlib.decompress(base64.b64decode(msg["content"]["data"]))),
+        )
+
+    def test_set_comm_capabilities__flushes(self):
+        self.jc.set_comm_capabilities(["coalesce"])
+        self.jc.send_comm_message("new_job", {"job_id": "a"})
+        self.jc.set_comm_capabilities([])
+        self.assertEqual(
+            {"msg_type": "new_job", "content": {"job_id": "a"}},
+            self.jc._comm.last_message["data"],
+        )
+
+    # ------------
+    # Metrics
+    # ------------
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_metrics__requests(self):
+        self.jc._metrics.reset()
+        self.jc._handle_comm_message(
+            make_comm_msg("job_status", [JOB_RUNNING, JOB_COMPLETED], False)
+        )
+        with self.assertRaises(JobIDException):
+            self.jc._handle_comm_message(make_comm_msg("job_status", None, False))
+
+        self.jc._handle_comm_message(make_comm_msg("job_comm_metrics", None, False))
+        msg = self.jc._comm.last_message["data"]
+        self.assertEqual("job_comm_metrics", msg["msg_type"])
+        stats = msg["content"]["requests"]["job_status"]
+        self.assertEqual(2, stats["latency_ms"]["count"])
+        self.assertEqual(1, stats["errors"])
+        self.assertEqual(1, stats["ee2_calls"])
+        # the error message is sent outside of the request handler
+        self.assertEqual(1, stats["messages"])
+        self.assertIsNone(msg["content"]["status_loop"])
+
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_metrics__reset(self):
+        self.jc._handle_comm_message(make_comm_msg("job_status", [JOB_RUNNING], False))
+        self.jc._handle_comm_message(
+            make_comm_msg("job_comm_metrics", None, False, content={"reset": True})
+        )
+        self.assertIn(
+            "job_status", self.jc._comm.last_message["data"]["content"]["requests"]
+        )
+        self.assertEqual({}, self.jc.get_metrics()["requests"])
+
+    @mock.patch(
+        "biokbase.narrative.clients.get", get_mock_client
+    )
+    def test_metrics__status_loop(self):
+        self.jc._metrics.reset()
+        self.jc.start_job_status_loop()
+        self.jc.stop_job_status_loop()
+        loop_stats = self.jc.get_metrics()["status_loop"]
+        self.assertEqual(1, loop_stats["tick_ms"]["count"])
+        self.assertEqual(len(EXP_ALL_STATE_IDS), loop_stats["jobs"])
+        self.assertEqual(len(EXP_ALL_STATE_IDS), loop_stats["max_jobs"])
+        self.assertEqual(1, loop_stats["messages"])
+
+
+class JobRequestExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = JobRequestExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_submit__result(self):
+        future = self.executor.submit(["a"], lambda x, y: x + y, 1, 2)
+        self.assertEqual(future.result(timeout=5), 3)
+
+    def test_submit__exception(self):
+        def fail():
+            raise ValueError("nope")
+
+        future = self.executor.submit(["a"], fail)
+        with self.assertRaisesRegex(ValueError, "nope"):
+            future.result(timeout=5)
+        # later functions for the same job still run
+        self.assertEqual(self.executor.submit(["a"], lambda: 1).result(timeout=5), 1)
+
+    def test_submit__same_job_ordering(self):
+        gate = threading.Event()
+        order = []
+
+        def first():
+            gate.wait(timeout=5)
+            order.append("first")
+
+        def run(name):
+            order.append(name)
+
+        f1 = self.executor.submit(["a", "b"], first)
+        f2 = self.executor.submit(["b"], run, "second")
+        f3 = self.executor.submit(["c"], run, "other")
+        # a different job isn't held up
+        f3.result(timeout=5)
+        self.assertEqual(order, ["other"])
+        self.assertFalse(f2.done())
+        gate.set()
+        f1.result(timeout=5)
+        f2.result(timeout=5)
+        self.assertEqual(order, ["other", "first", "second"])
+        self.assertEqual(self.executor._last_futures, {})
+
+    def test_submit__priority(self):
+        executor = JobRequestExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        gate = threading.Event()
+        order = []
+        executor.submit([], gate.wait, 5)
+        executor.submit(["a"], order.append, "lookup", priority=REQUEST_PRIORITY_LOOKUP)
+        executor.submit(["b"], order.append, "default")
+        executor.submit(
+            ["c"], order.append, "interactive", priority=REQUEST_PRIORITY_INTERACTIVE
+        )
+        gate.set()
+        executor.shutdown(wait=True)
+        self.assertEqual(["interactive", "default", "lookup"], order)
+
+    def test_submit__non_blocking(self):
+        gate = threading.Event()
+        order = []
+
+        def lookup():
+            gate.wait(timeout=5)
+            order.append("lookup")
+
+        f1 = self.executor.submit(["a"], lookup, blocking=False)
+        f2 = self.executor.submit(["a"], order.append, "other lookup", blocking=False)
+        f3 = self.executor.submit(["a"], order.append, "cancel")
+        f4 = self.executor.submit(["a"], order.append, "last lookup", blocking=False)
+        # another lookup doesn't wait for the first one
+        f2.result(timeout=5)
+        self.assertEqual(["other lookup"], order)
+        # but the cancel does, and so later lookups wait for it
+        self.assertFalse(f3.done())
+        gate.set()
+        for future in [f1, f3, f4]:
+            future.result(timeout=5)
+        self.assertEqual(["other lookup", "lookup", "cancel", "last lookup"], order)
+        self.assertEqual({}, self.executor._lookup_futures)
+
+    def test_submit__dedupe_after_blocking(self):
+        gate = threading.Event()
+        calls = []
+        self.executor.submit(["a"], gate.wait, 5)
+        f1 = self.executor.submit(["a"], calls.append, "lookup", blocking=False, dedupe_key="key")
+        self.executor.submit(["a"], calls.append, "cancel")
+        # the same lookup after the cancel isn't answered by the one from before it
+        f2 = self.executor.submit(["a"], calls.append, "lookup", blocking=False, dedupe_key="key")
+        self.assertIsNot(f1, f2)
+        gate.set()
+        f2.result(timeout=5)
+        self.assertEqual(["lookup", "cancel", "lookup"], calls)
+
+    def test_submit__dedupe(self):
+        gate = threading.Event()
+        calls = []
+        first = self.executor.submit(["a"], gate.wait, 5)
+        f1 = self.executor.submit(["a"], calls.append, 1, dedupe_key="key")
+        f2 = self.executor.submit(["a"], calls.append, 2, dedupe_key="key")
+        f3 = self.executor.submit(["a"], calls.append, 3, dedupe_key="other_key")
+        self.assertIs(f1, f2)
+        gate.set()
+        for future in [first, f1, f3]:
+            future.result(timeout=5)
+        self.assertEqual([1, 3], calls)
+        # once it's started, the same key gets run again
+        self.executor.submit(["a"], calls.append, 4, dedupe_key="key").result(timeout=5)
+        self.assertEqual([1, 3, 4], calls)
+        self.assertEqual({}, self.executor._pending)
+
 
 class JobRequestTestCase(unittest.TestCase):
     """
@@ -0,0 +1,126 @@
+import unittest
+from unittest import mock
+from biokbase.narrative.jobs.joblog import JobLog, LOG_CHUNK_SIZE
+
+JOB_ID = "some_job_id"
+
+
+class FakeEE2:
+    """
+    Makes get_job_logs results for a log with total_lines lines, and records the calls.
+    Every 10th line is an error.
+    """
+
+    def __init__(self, total_lines):
+        self.total_lines = total_lines
+        self.calls = list()
+
+    def get_job_logs(self, params):
+        self.calls.append(params)
+        skip = params.get("skip_lines", 0)
+        end = self.total_lines
+        if params.get("limit"):
+            end = min(skip + params["limit"], end)
+        return {
+            "last_line_number": self.total_lines,
+            "lines": [
+                {"is_error": int(i % 10 == 0), "line": f"This is line {i}", "ts": i}
+                for i in range(skip, end)
+            ],
+        }
+
+
+def expected_lines(first, end):
+    return [
+        {"is_error": int(i % 10 == 0), "line": f"This is line {i}"}
+        for i in range(first, end)
+    ]
+
+
+class JobLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ee2 = FakeEE2(250)
+        patcher = mock.patch(
+            "biokbase.narrative.jobs.joblog.clients.get", lambda name: self.ee2
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.log = JobLog(JOB_ID)
+
+    def test_get_lines__all(self):
+        self.assertEqual((250, expected_lines(0, 250)), self.log.get_lines())
+        self.assertEqual([{"job_id": JOB_ID, "skip_lines": 0}], self.ee2.calls)
+
+    def test_get_lines__new_lines_only(self):
+        self.log.get_lines()
+        self.ee2.total_lines = 300
+        self.assertEqual((300, expected_lines(100, 300)), self.log.get_lines(100))
+        self.assertEqual({"job_id": JOB_ID, "skip_lines": 250}, self.ee2.calls[-1])
+
+    def test_get_lines__window(self):
+        self.assertEqual(
+            (250, expected_lines(100, 120)), self.log.get_lines(100, num_lines=20)
+        )
+        # one call to count lines (that gets the first 20), one for the window
+        self.assertEqual(
+            [
+                {"job_id": JOB_ID, "skip_lines": 0, "limit": 20},
+                {"job_id": JOB_ID, "skip_lines": 100, "limit": 20},
+            ],
+            self.ee2.calls,
+        )
+        # now only the missing range gets fetched
+        self.log.complete = True
+        self.assertEqual(
+            (250, expected_lines(90, 130)), self.log.get_lines(90, num_lines=40)
+        )
+        self.assertEqual(
+            [
+                {"job_id": JOB_ID, "skip_lines": 90, "limit": 10},
+                {"job_id": JOB_ID, "skip_lines": 120, "limit": 10},
+            ],
+            self.ee2.calls[2:],
+        )
+
+    def test_get_lines__latest_only(self):
+        self.ee2.total_lines = 1000000
+        self.assertEqual(
+            (1000000, expected_lines(999900, 1000000)),
+            self.log.get_lines(num_lines=100, latest_only=True),
+        )
+        self.assertEqual(
+            [
+                {"job_id": JOB_ID, "skip_lines": 0, "limit": 100},
+                {"job_id": JOB_ID, "skip_lines": 999900, "limit": 100},
+            ],
+            self.ee2.calls,
+        )
+        # only the ends of the log are stored
+        self.assertEqual(
+            {0, 999900 // LOG_CHUNK_SIZE}, set(self.log._chunks.keys())
+        )
+
+    def test_get_lines__out_of_range(self):
+        self.assertEqual((250, []), self.log.get_lines(300))
+        self.assertEqual((250, []), self.log.get_lines(num_lines=0))
+        self.assertEqual((250, expected_lines(0, 250)), self.log.get_lines(-5))
+
+    def test_get_lines__complete(self):
+        self.log.get_lines()
+        self.log.complete = True
+        self.ee2.total_lines = 300
+        self.assertEqual((250, expected_lines(200, 250)), self.log.get_lines(200))
+        self.assertEqual(1, len(self.ee2.calls))
+
+    def test_compact_storage(self):
+        self.log.get_lines()
+        texts, flags = self.log._chunks[0]
+        self.assertEqual("This is line 5", texts[5])
+        self.assertIsInstance(flags, bytearray)
+        self.assertEqual(1, flags[10])
+        self.assertEqual(0, flags[11])
+        self.assertIsNone(texts[250])
+
+
+if __name__ == "__main__":
+    unittest.main()
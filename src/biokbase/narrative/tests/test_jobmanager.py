@@ -7,6 +7,9 @@ import itertools
 from unittest import mock
 import re
 import os
+import tempfile
+import threading
+import time
 from IPython.display import HTML
 
 import biokbase.narrative.jobs.jobmanager
@@ -14,7 +17,11 @@ from biokbase.narrative.jobs.jobmanager import (
     JOB_NOT_REG_ERR,
     JOB_NOT_BATCH_ERR,
     JOBS_MISSING_FALSY_ERR,
+    POLL_INTERVALS,
+    HOT_POLL_INTERVAL,
+    POLL_BACKOFF_FACTOR,
     get_error_output_state,
+    JobStateFetcher,
 )
 from biokbase.narrative.jobs.job import (
     Job,
@@ -28,6 +35,8 @@ from biokbase.narrative.exception_util import (
 )
 
 from biokbase.narrative.jobs.jobmanager import JOBS_TYPE_ERR
+from biokbase.narrative.jobs.jobmanager import SNAPSHOT_LISTING_EXCLUDED_FIELDS
+from biokbase.narrative.jobs.jobsnapshot import JobStateSnapshot, SNAPSHOT_DIR_ENV
 from .util import ConfigTests
 from .test_job import (
     JOB_COMPLETED,
@@ -197,6 +206,33 @@ class JobManagerTest(unittest.TestCase):
         for job_id in NON_TERMINAL_IDS:
             self.assertTrue(self.jm._running_jobs[job_id]["refresh"])
 
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_initialize_jobs__concurrent_lookups(self):
+        # e.g. request worker threads in async request mode, while the jobs are reloaded
+        errors = list()
+        done = threading.Event()
+
+        def look_up():
+            while not done.is_set():
+                try:
+                    job_ids = self.jm.get_job_ids_to_lookup(ignore_refresh_flag=True)
+                    self.jm.get_next_poll_time(ignore_refresh_flag=True)
+                    self.jm.modify_job_refresh(job_ids, 1)
+                    self.jm.modify_job_refresh(job_ids, -1)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=look_up) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(20):
+            self.jm.initialize_jobs()
+        done.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(set(self.job_ids), set(self.jm._running_jobs.keys()))
+
     @mock.patch("biokbase.narrative.clients.get", get_mock_client)
     def test_initialize_jobs__cell_ids(self):
         """
@@ -226,6 +262,326 @@ class JobManagerTest(unittest.TestCase):
                         refresh,
                     )
 
+    def test_job_indexes(self):
+        statuses = dict()
+        cells = dict()
+        for job_id in ALL_JOBS:
+            state = get_test_job(job_id)
+            statuses.setdefault(state["status"], set()).add(job_id)
+            cell_id = self.jm.get_job(job_id).cell_id
+            if cell_id is not None:
+                cells.setdefault(cell_id, set()).add(job_id)
+
+        for status, job_ids in statuses.items():
+            self.assertEqual(job_ids, self.jm.get_job_ids_by_status([status]))
+        self.assertEqual(
+            statuses["completed"] | statuses["error"],
+            self.jm.get_job_ids_by_status(["completed", "error", "not_a_status"]),
+        )
+        for cell_id, job_ids in cells.items():
+            self.assertEqual(job_ids, self.jm.get_job_ids_by_cell([cell_id]))
+        self.assertEqual(set(), self.jm.get_job_ids_by_cell([]))
+        self.assertEqual(set(BATCH_CHILDREN), self.jm.get_batch_child_ids(BATCH_PARENT))
+        self.assertEqual(set(), self.jm.get_batch_child_ids(JOB_COMPLETED))
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_job_indexes__state_update(self):
+        self.assertIn(JOB_RUNNING, self.jm.get_job_ids_by_status(["running"]))
+        self.jm._construct_job_output_state_set(
+            [JOB_RUNNING], {JOB_RUNNING: {"job_id": JOB_RUNNING, "status": "completed"}}
+        )
+        self.assertNotIn(JOB_RUNNING, self.jm.get_job_ids_by_status(["running"]))
+        self.assertIn(JOB_RUNNING, self.jm.get_job_ids_by_status(["completed"]))
+
+        # attribute changes are picked up too
+        job = self.jm.get_job(JOB_RUNNING)
+        old_cell_id = job.cell_id
+        job.cell_id = "some_new_cell"
+        self.assertNotIn(JOB_RUNNING, self.jm.get_job_ids_by_cell([old_cell_id]))
+        self.assertEqual({JOB_RUNNING}, self.jm.get_job_ids_by_cell(["some_new_cell"]))
+
+    def test_job_indexes__register_new_job(self):
+        job = Job(
+            {
+                "job_id": "new_job_id",
+                "status": "queued",
+                "batch_id": "new_batch_id",
+                "job_input": {"narrative_cell_info": {"cell_id": "new_cell_id"}},
+            }
+        )
+        self.jm.register_new_job(job)
+        self.assertEqual({"new_job_id"}, self.jm.get_job_ids_by_cell(["new_cell_id"]))
+        self.assertEqual({"new_job_id"}, self.jm.get_batch_child_ids("new_batch_id"))
+        self.assertIn("new_job_id", self.jm.get_job_ids_by_status(["queued"]))
+
+    def test_get_batch_summary(self):
+        children = [get_test_job(job_id) for job_id in BATCH_CHILDREN]
+        status_counts = dict()
+        for state in children:
+            status_counts[state["status"]] = status_counts.get(state["status"], 0) + 1
+        summary = self.jm.get_batch_summary(BATCH_PARENT)
+        self.assertIsInstance(summary.pop("seq"), int)
+        self.assertEqual(
+            {
+                "batch_id": BATCH_PARENT,
+                "status": get_test_job(BATCH_PARENT)["status"],
+                "child_count": len(BATCH_CHILDREN),
+                "status_counts": status_counts,
+                "created": min(state["created"] for state in children),
+                "updated": max(state["updated"] for state in children),
+                "changed": sorted(BATCH_CHILDREN),
+            },
+            summary,
+        )
+        # each caller has its own place, so asking again without one gets everything
+        seq = self.jm.get_batch_summary(BATCH_PARENT)["seq"]
+        self.assertEqual(
+            sorted(BATCH_CHILDREN), self.jm.get_batch_summary(BATCH_PARENT)["changed"]
+        )
+        # nothing has changed since then
+        self.assertEqual([], self.jm.get_batch_summary(BATCH_PARENT, seq)["changed"])
+        self.assertEqual(seq, self.jm.get_batch_summary(BATCH_PARENT, seq)["seq"])
+        # a seq from later on, e.g. from before a restart, gets everything
+        self.assertEqual(
+            sorted(BATCH_CHILDREN),
+            self.jm.get_batch_summary(BATCH_PARENT, seq + 1000)["changed"],
+        )
+        with self.assertRaisesRegex(ValueError, "since must be an int"):
+            self.jm.get_batch_summary(BATCH_PARENT, "1")
+
+    def test_get_batch_summary__state_update(self):
+        child_id = [
+            job_id
+            for job_id in BATCH_CHILDREN
+            if get_test_job(job_id)["status"] == "running"
+        ][0]
+        old_summary = self.jm.get_batch_summary(BATCH_PARENT)
+        other_seq = self.jm.get_batch_summary(BATCH_PARENT)["seq"]
+        self.jm.get_job(child_id)._update_state(
+            {"job_id": child_id, "status": "completed", "updated": 9999999999999}
+        )
+        summary = self.jm.get_batch_summary(BATCH_PARENT, old_summary["seq"])
+        self.assertEqual([child_id], summary["changed"])
+        self.assertGreater(summary["seq"], old_summary["seq"])
+        # another caller still sees the change too
+        self.assertEqual(
+            [child_id], self.jm.get_batch_summary(BATCH_PARENT, other_seq)["changed"]
+        )
+        self.assertEqual(9999999999999, summary["updated"])
+        self.assertEqual(
+            old_summary["status_counts"]["running"] - 1,
+            summary["status_counts"].get("running", 0),
+        )
+        self.assertEqual(
+            old_summary["status_counts"].get("completed", 0) + 1,
+            summary["status_counts"]["completed"],
+        )
+        self.assertEqual(old_summary["child_count"], summary["child_count"])
+
+        # an update that doesn't change anything isn't a change
+        self.jm.get_job(child_id)._update_state(
+            {"job_id": child_id, "status": "completed"}
+        )
+        self.assertEqual(
+            [], self.jm.get_batch_summary(BATCH_PARENT, summary["seq"])["changed"]
+        )
+
+    def test_get_batch_summary__not_batch(self):
+        with self.assertRaisesRegex(
+            JobIDException, re.escape(f"{JOB_NOT_BATCH_ERR}: {JOB_COMPLETED}")
+        ):
+            self.jm.get_batch_summary(JOB_COMPLETED)
+        with self.assertRaisesRegex(
+            JobIDException, re.escape(f"{JOB_NOT_REG_ERR}: not_a_job_id")
+        ):
+            self.jm.get_batch_summary("not_a_job_id")
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_initialize_jobs__snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, mock.patch.dict(
+            os.environ, {SNAPSHOT_DIR_ENV: snapshot_dir}
+        ):
+            # no snapshot yet, so everything gets looked up, and the snapshot is written
+            with assert_obj_method_called(MockClients, "check_jobs", call_status=False):
+                self.jm.initialize_jobs()
+            # it's written on another thread
+            self.assertFalse(os.path.exists(self.jm._snapshot.path))
+            self.jm._snapshot.flush()
+            snapshot_states = self.jm._snapshot.load()
+            self.assertEqual(set(TERMINAL_JOBS), set(snapshot_states.keys()))
+            for job_id in TERMINAL_JOBS:
+                self.assertEqual(
+                    self.jm.get_job(job_id)._acc_state, snapshot_states[job_id]
+                )
+
+            def get_states():
+                # the mock ee2 only drops excluded fields in some calls, so ignore them here
+                return {
+                    job_id: self.jm.get_job(job_id)._internal_state(
+                        JOB_INIT_EXCLUDED_JOB_STATE_FIELDS
+                    )
+                    for job_id in ALL_JOBS
+                }
+
+            expected_states = get_states()
+
+            # the snapshot is used on restart, and only the other jobs are looked up
+            with assert_obj_method_called(
+                MockClients, "check_workspace_jobs"
+            ) as cwj, assert_obj_method_called(MockClients, "check_jobs") as cj:
+                self.jm.initialize_jobs()
+            self.assertEqual(
+                SNAPSHOT_LISTING_EXCLUDED_FIELDS, cwj.calls[0][1][0]["exclude_fields"]
+            )
+            self.assertCountEqual(ACTIVE_JOBS, cj.calls[0][1][0]["job_ids"])
+            self.assertEqual(expected_states, get_states())
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_initialize_jobs__snapshot__stale(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, mock.patch.dict(
+            os.environ, {SNAPSHOT_DIR_ENV: snapshot_dir}
+        ):
+            self.jm.initialize_jobs()
+            self.jm._snapshot.flush()
+            snapshot_states = self.jm._snapshot.load()
+            # e.g. a job that's been retried since
+            snapshot_states[JOB_ERROR]["retry_count"] = -1
+            self.jm._snapshot.save(snapshot_states)
+
+            with assert_obj_method_called(MockClients, "check_jobs") as cj:
+                self.jm.initialize_jobs()
+            self.assertCountEqual(
+                ACTIVE_JOBS + [JOB_ERROR], cj.calls[0][1][0]["job_ids"]
+            )
+            self.assertEqual(
+                get_test_job(JOB_ERROR).get("retry_count"),
+                self.jm.get_job(JOB_ERROR)._acc_state.get("retry_count"),
+            )
+
+    def test_initialize_jobs__snapshot__bad_file(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot = JobStateSnapshot(12345, snapshot_dir)
+            with open(snapshot.path, "w") as f:
+                f.write("not json")
+            self.assertEqual({}, snapshot.load())
+            # other workspaces' snapshots aren't used
+            snapshot.save({"a": {"job_id": "a"}})
+            self.assertEqual({"a": {"job_id": "a"}}, snapshot.load())
+            os.rename(snapshot.path, JobStateSnapshot(54321, snapshot_dir).path)
+            self.assertEqual({}, JobStateSnapshot(54321, snapshot_dir).load())
+
+    def test_snapshot__concurrent_saves(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, mock.patch(
+            "biokbase.narrative.jobs.jobsnapshot.kblogging.log_event"
+        ) as log_event:
+            snapshot = JobStateSnapshot(12345, snapshot_dir)
+            threads = [
+                threading.Thread(
+                    target=lambda n=n: [
+                        snapshot.save({str(n): {"job_id": str(n)}}) for _ in range(20)
+                    ]
+                )
+                for n in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            log_event.assert_not_called()
+            self.assertEqual(1, len(snapshot.load()))
+            self.assertEqual(["ws_12345_jobs.json"], os.listdir(snapshot_dir))
+
+    def test_snapshot__append(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot = JobStateSnapshot(12345, snapshot_dir)
+            # makes a new snapshot if there isn't one
+            snapshot.append({"a": {"status": "error"}})
+            snapshot.append({"b": {"status": "completed"}})
+            snapshot.append({"a": {"status": "completed"}})
+            self.assertEqual(
+                {"a": {"status": "completed"}, "b": {"status": "completed"}},
+                snapshot.load(),
+            )
+            # a line cut off part way is skipped
+            with open(snapshot.path, "a") as f:
+                f.write('{"job_id": "c", "sta')
+            self.assertEqual(["a", "b"], sorted(snapshot.load()))
+            snapshot.save({"c": {"status": "terminated"}})
+            self.assertEqual({"c": {"status": "terminated"}}, snapshot.load())
+
+    def test_snapshot__save_error(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, mock.patch(
+            "biokbase.narrative.jobs.jobsnapshot.kblogging.log_event"
+        ) as log_event:
+            snapshot = JobStateSnapshot(12345, snapshot_dir)
+            snapshot.save({"a": {"job_id": "a"}})
+            with mock.patch("os.replace", side_effect=OSError("disk full")):
+                snapshot.save({"b": {"job_id": "b"}})
+            log_event.assert_called_once()
+            # the temp file is removed, and the old snapshot is kept
+            self.assertEqual(["ws_12345_jobs.json"], os.listdir(snapshot_dir))
+            self.assertEqual({"a": {"job_id": "a"}}, snapshot.load())
+
+    def test_snapshot__save_later(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot = JobStateSnapshot(12345, snapshot_dir, save_delay=60)
+            snapshot.save({"a": {"job_id": "a"}})
+            with mock.patch.object(snapshot, "append", wraps=snapshot.append) as append:
+                snapshot.save_later({"b": {"job_id": "b"}})
+                snapshot.save_later({"c": {"job_id": "c"}})
+                append.assert_not_called()
+                # everything queued is written at once
+                snapshot.flush()
+                append.assert_called_once_with({"b": {"job_id": "b"}, "c": {"job_id": "c"}})
+                snapshot.flush()
+                append.assert_called_once()
+            self.assertEqual(["a", "b", "c"], sorted(snapshot.load()))
+            self.assertIsNone(snapshot._timer)
+
+            # a rewrite replaces the snapshot with what's queued from then on
+            snapshot.save_later({"d": {"job_id": "d"}})
+            snapshot.save_later({"e": {"job_id": "e"}}, rewrite=True)
+            snapshot.save_later({"f": {"job_id": "f"}})
+            snapshot.flush()
+            self.assertEqual(["e", "f"], sorted(snapshot.load()))
+
+            # and the timer writes them if they aren't flushed
+            snapshot.save_delay = 0.01
+            snapshot.save_later({"g": {"job_id": "g"}})
+            timer = snapshot._timer
+            timer.join(5)
+            self.assertFalse(timer.is_alive())
+            self.assertIsNone(snapshot._timer)
+            self.assertEqual(["e", "f", "g"], sorted(snapshot.load()))
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test__construct_job_output_state_set__snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, mock.patch.dict(
+            os.environ, {SNAPSHOT_DIR_ENV: snapshot_dir}
+        ):
+            self.jm.initialize_jobs()
+            self.jm._snapshot.flush()
+            self.assertNotIn(JOB_RUNNING, self.jm._snapshot.load())
+            self.jm._construct_job_output_state_set(
+                [JOB_RUNNING],
+                {JOB_RUNNING: {"job_id": JOB_RUNNING, "status": "completed"}},
+            )
+            # states given to it aren't looked up, so not saved yet
+            self.jm._snapshot.flush()
+            self.assertNotIn(JOB_RUNNING, self.jm._snapshot.load())
+
+            completed_state = get_test_job(JOB_RUNNING)
+            completed_state["status"] = "completed"
+            # it's added to the snapshot on the snapshot's thread, not this one
+            with mock.patch.object(
+                MockClients, "check_jobs", return_value={JOB_RUNNING: completed_state}
+            ), mock.patch.object(JobStateSnapshot, "append") as append:
+                self.jm._construct_job_output_state_set([JOB_RUNNING], force_refresh=True)
+            append.assert_not_called()
+            self.assertNotIn(JOB_RUNNING, self.jm._snapshot.load())
+            self.jm._snapshot.flush()
+            self.assertEqual("completed", self.jm._snapshot.load()[JOB_RUNNING]["status"])
+
     def test__check_job(self):
         for job_id in ALL_JOBS:
             self.jm._check_job(job_id)
@@ -292,6 +648,21 @@ class JobManagerTest(unittest.TestCase):
             self.jm._construct_job_output_state_set(ALL_JOBS), get_test_job_states()
         )
 
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test__construct_job_output_state_set__force_refresh(self):
+        # terminal jobs use their cached output states...
+        with assert_obj_method_called(MockClients, "check_jobs", call_status=False):
+            states = self.jm._construct_job_output_state_set(TERMINAL_IDS)
+        self.assertEqual(get_test_job_states(TERMINAL_IDS), states)
+
+        # ...unless a refresh is forced
+        with assert_obj_method_called(MockClients, "check_jobs") as aomc:
+            states = self.jm._construct_job_output_state_set(
+                TERMINAL_IDS, force_refresh=True
+            )
+        self.assertEqual(get_test_job_states(TERMINAL_IDS), states)
+        self.assertEqual(TERMINAL_IDS, aomc.calls[0].args[0]["job_ids"])
+
     def test__construct_job_output_state_set__empty_list(self):
         self.assertEqual(self.jm._construct_job_output_state_set([]), {})
 
@@ -314,6 +685,31 @@ class JobManagerTest(unittest.TestCase):
             job_states
         )
 
+    @mock.patch("biokbase.narrative.jobs.job.CHECK_JOBS_CHUNK_SIZE", 2)
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test__construct_job_output_state_set__ee2_error__one_chunk(self):
+        bad_chunk = ACTIVE_JOBS[:2]
+        check_jobs = MockClients.check_jobs
+
+        def mock_check_jobs(self, params):
+            if params["job_ids"] == bad_chunk:
+                raise Exception("Test exception")
+            return check_jobs(self, params)
+
+        with mock.patch.object(MockClients, "check_jobs", mock_check_jobs):
+            job_states = self.jm._construct_job_output_state_set(ALL_JOBS)
+
+        self.assertEqual(
+            {
+                **get_test_job_states(ALL_JOBS),
+                **{
+                    job_id: get_error_output_state(job_id, "ee2_error")
+                    for job_id in bad_chunk
+                },
+            },
+            job_states,
+        )
+
     def test__create_jobs__empty_list(self):
         self.assertEqual(self.jm._create_jobs([]), {})
 
@@ -372,6 +768,118 @@ class JobManagerTest(unittest.TestCase):
                 jobs_html_1 = re.sub(pattern, sub, jobs_html_1)
                 self.assertEqual(jobs_html_0, jobs_html_1)
 
+    def test_query_jobs(self):
+        result = self.jm.query_jobs()
+        self.assertEqual(len(ALL_JOBS), result["total"])
+        self.assertEqual(set(ALL_JOBS), {row["job_id"] for row in result["jobs"]})
+        created = [row["created"] for row in result["jobs"]]
+        self.assertEqual(sorted(created), created)
+
+        row = [row for row in result["jobs"] if row["job_id"] == JOB_COMPLETED][0]
+        state = get_test_job(JOB_COMPLETED)
+        self.assertEqual(
+            {
+                "job_id": JOB_COMPLETED,
+                "app_id": state["job_input"]["app_id"],
+                "user": state["user"],
+                "status": "completed",
+                "batch_id": self.jm.get_job(JOB_COMPLETED).batch_id,
+                "cell_id": self.jm.get_job(JOB_COMPLETED).cell_id,
+                "created": state["created"],
+                "updated": state["updated"],
+                "running": state.get("running"),
+                "finished": state.get("finished"),
+            },
+            row,
+        )
+
+    def test_query_jobs__filters(self):
+        states = {job_id: get_test_job(job_id) for job_id in ALL_JOBS}
+
+        def matching(check):
+            return {job_id for job_id, state in states.items() if check(state)}
+
+        def job_ids(**kwargs):
+            return {row["job_id"] for row in self.jm.query_jobs(**kwargs)["jobs"]}
+
+        self.assertEqual(
+            matching(lambda s: s["status"] in ["completed", "error"]),
+            job_ids(status=["completed", "error"]),
+        )
+        self.assertEqual(
+            matching(lambda s: s["status"] == "running"), job_ids(status="running")
+        )
+        app_id = states[JOB_COMPLETED]["job_input"]["app_id"]
+        self.assertEqual(
+            matching(lambda s: s.get("job_input", {}).get("app_id") == app_id),
+            job_ids(app_id=app_id),
+        )
+        user = states[JOB_COMPLETED]["user"]
+        self.assertEqual(
+            matching(lambda s: s["user"] == user), job_ids(user=[user, "someone_else"])
+        )
+        created = sorted({state["created"] for state in states.values()})
+        after, before = created[1], created[-1]
+        self.assertEqual(
+            matching(lambda s: after <= s["created"] < before),
+            job_ids(created_after=after, created_before=before),
+        )
+        self.assertEqual(
+            set(), job_ids(status="completed", user="someone_else")
+        )
+
+    def test_query_jobs__sort_and_page(self):
+        all_rows = self.jm.query_jobs(sort_by="job_id", reverse=True)["jobs"]
+        self.assertEqual(sorted(ALL_JOBS, reverse=True), [r["job_id"] for r in all_rows])
+
+        page = self.jm.query_jobs(sort_by="job_id", reverse=True, offset=2, limit=3)
+        self.assertEqual(len(ALL_JOBS), page["total"])
+        self.assertEqual((2, 3), (page["offset"], page["limit"]))
+        self.assertEqual(all_rows[2:5], page["jobs"])
+
+        # jobs without a finish time go last, whichever way they're sorted
+        for reverse in [False, True]:
+            finished = [
+                row["finished"]
+                for row in self.jm.query_jobs(sort_by="finished", reverse=reverse)["jobs"]
+            ]
+            num_finished = len([f for f in finished if f is not None])
+            self.assertEqual(
+                sorted(finished[:num_finished], reverse=reverse), finished[:num_finished]
+            )
+            self.assertEqual([None] * (len(finished) - num_finished), finished[num_finished:])
+
+    def test_query_jobs__bad_inputs(self):
+        with self.assertRaisesRegex(ValueError, "Unknown sort key 'size'"):
+            self.jm.query_jobs(sort_by="size")
+        with self.assertRaisesRegex(ValueError, "must not be negative"):
+            self.jm.query_jobs(offset=-1)
+        with self.assertRaisesRegex(ValueError, "must not be negative"):
+            self.jm.query_jobs(limit=-1)
+
+    def test_list_jobs__json(self):
+        self.assertEqual(
+            self.jm.query_jobs(status="completed", limit=2),
+            self.jm.list_jobs(status="completed", limit=2, output="json"),
+        )
+        with self.assertRaisesRegex(ValueError, "Unknown output format 'xml'"):
+            self.jm.list_jobs(output="xml")
+
+    def test_list_jobs__page(self):
+        html = self.jm.list_jobs(limit=2, offset=1).data
+        self.assertEqual(2, html.count("<tr>") - 1)
+        self.assertIn(f"Showing jobs 2-3 of {len(ALL_JOBS)}", html)
+        # with no limit, every job is listed
+        html = self.jm.list_jobs().data
+        self.assertEqual(len(ALL_JOBS), html.count("<tr>") - 1)
+        self.assertNotIn("Showing jobs", html)
+        self.assertEqual("No matching jobs!", self.jm.list_jobs(user="someone_else"))
+
+    def test_list_jobs__no_lookup(self):
+        with assert_obj_method_called(MockClients, "check_jobs", call_status=False):
+            with mock.patch("biokbase.narrative.clients.get", get_mock_client):
+                self.jm.list_jobs()
+
     def test_cancel_jobs__bad_inputs(self):
         with self.assertRaisesRegex(JobIDException, re.escape(f"{JOBS_MISSING_FALSY_ERR}: {[]}")):
             self.jm.cancel_jobs([])
@@ -458,6 +966,34 @@ class JobManagerTest(unittest.TestCase):
                 any_order=True,
             )
 
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_cancel_jobs__errors(self):
+        def cancel_job(params):
+            if params["job_id"] == JOB_RUNNING:
+                raise ValueError("no canceling this one")
+            return {}
+
+        jobs = [JOB_RUNNING, JOB_CREATED, JOB_COMPLETED]
+        with mock.patch.object(
+            MockClients, "cancel_job", mock.Mock(side_effect=cancel_job)
+        ) as mock_cancel_job:
+            errors = dict()
+            results = self.jm.cancel_jobs(jobs, errors=errors)
+            self.assertEqual(2, mock_cancel_job.call_count)
+        self.assertEqual(set(jobs), set(results.keys()))
+        self.assertEqual([JOB_RUNNING], list(errors.keys()))
+        self.assertIsInstance(errors[JOB_RUNNING], NarrativeException)
+        self.assertEqual("no canceling this one", errors[JOB_RUNNING].message)
+        self.assertNotIn("canceling", self.jm._running_jobs[JOB_RUNNING])
+
+        # without an errors dict, the error gets raised once everything's canceled
+        with mock.patch.object(
+            MockClients, "cancel_job", mock.Mock(side_effect=cancel_job)
+        ) as mock_cancel_job:
+            with self.assertRaisesRegex(NarrativeException, "no canceling this one"):
+                self.jm.cancel_jobs(jobs)
+            self.assertEqual(2, mock_cancel_job.call_count)
+
     @mock.patch("biokbase.narrative.clients.get", get_mock_client)
     def test_cancel_jobs(self):
         with assert_obj_method_called(self.jm, "cancel_jobs", True):
@@ -507,6 +1043,19 @@ class JobManagerTest(unittest.TestCase):
         retry_results = self.jm.retry_jobs(job_ids)
         self._check_retry_jobs(expected, retry_results)
 
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_retry_jobs__single_lookup(self):
+        job_ids = [JOB_TERMINATED, JOB_ERROR]
+        with mock.patch.object(
+            Job, "query_ee2_states", wraps=Job.query_ee2_states
+        ) as mock_query:
+            self.jm.retry_jobs(job_ids)
+        # the original and retry jobs are looked up together
+        self.assertEqual(
+            [mock.call(job_ids + [job_id[::-1] for job_id in job_ids], init=True)],
+            [call for call in mock_query.call_args_list if call[0][0]],
+        )
+
     @mock.patch("biokbase.narrative.clients.get", get_mock_client)
     def test_retry_jobs__multi_success(self):
         job_ids = [JOB_TERMINATED, JOB_ERROR]
@@ -638,6 +1187,86 @@ class JobManagerTest(unittest.TestCase):
         self.assertEqual(set(self.job_ids), set(states.keys()))
         self.assertEqual(states, self.job_states)
 
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_lookup_scheduled_job_states(self):
+        # all jobs are due when first registered
+        states = self.jm.lookup_scheduled_job_states()
+        self.assertEqual({id: self.job_states[id] for id in ACTIVE_JOBS}, states)
+
+        # now none of them are due to be polled
+        with assert_obj_method_called(MockClients, "check_jobs", call_status=False):
+            self.assertEqual({}, self.jm.lookup_scheduled_job_states())
+            # terminal jobs are always included
+            states = self.jm.lookup_scheduled_job_states(ignore_refresh_flag=True)
+        self.assertEqual({id: self.job_states[id] for id in TERMINAL_JOBS}, states)
+
+        # due jobs get looked up together
+        self.jm._running_jobs[JOB_RUNNING]["poll_at"] = 0
+        self.jm._running_jobs[JOB_CREATED]["poll_at"] = 0
+        with assert_obj_method_called(MockClients, "check_jobs") as aomc:
+            states = self.jm.lookup_scheduled_job_states()
+        self.assertEqual(sorted([JOB_CREATED, JOB_RUNNING]), sorted(states.keys()))
+        self.assertEqual(1, len(aomc.calls))
+
+        # without the terminal jobs, only the due ones are sent
+        self.jm._running_jobs[JOB_RUNNING]["poll_at"] = 0
+        states = self.jm.lookup_scheduled_job_states(
+            ignore_refresh_flag=True, include_terminal=False
+        )
+        self.assertEqual([JOB_RUNNING], list(states.keys()))
+
+    @mock.patch("biokbase.narrative.jobs.jobmanager.time.time", lambda: 1000)
+    def test__schedule_poll(self):
+        job_info = self.jm._running_jobs[JOB_RUNNING]
+        (base_interval, max_interval) = POLL_INTERVALS["queued"]
+
+        # first poll sets the base interval for the status
+        self.jm._schedule_poll(JOB_RUNNING, "queued")
+        self.assertEqual(1000 + base_interval, job_info["poll_at"])
+        self.assertEqual("queued", job_info["poll_status"])
+
+        # no change, so back off up to the max interval
+        interval = base_interval
+        for _ in range(20):
+            interval = min(interval * POLL_BACKOFF_FACTOR, max_interval)
+            self.jm._schedule_poll(JOB_RUNNING, "queued")
+            self.assertEqual(1000 + interval, job_info["poll_at"])
+        self.assertEqual(max_interval, job_info["poll_interval"])
+
+        # status change resets the interval
+        self.jm._schedule_poll(JOB_RUNNING, "running")
+        self.assertEqual(1000 + POLL_INTERVALS["running"][0], job_info["poll_at"])
+        self.assertEqual("running", job_info["poll_status"])
+
+    @mock.patch("biokbase.narrative.clients.get", get_mock_client)
+    def test_modify_job_refresh__hot_polling(self):
+        self.jm.lookup_all_job_states()
+        self.assertGreater(self.jm.get_next_poll_time(), 0)
+
+        self.jm.modify_job_refresh([JOB_RUNNING], 1)
+        self.assertEqual(0, self.jm._running_jobs[JOB_RUNNING]["poll_at"])
+        self.assertEqual(0, self.jm.get_next_poll_time())
+
+        with mock.patch("biokbase.narrative.jobs.jobmanager.time.time", lambda: 1000):
+            self.jm.get_job_states([JOB_RUNNING])
+        self.assertEqual(
+            1000 + HOT_POLL_INTERVAL, self.jm._running_jobs[JOB_RUNNING]["poll_at"]
+        )
+
+    def test_get_next_poll_time(self):
+        for job_id in ACTIVE_JOBS:
+            self.jm._running_jobs[job_id]["poll_at"] = 500
+        self.jm._running_jobs[JOB_CREATED]["poll_at"] = 100
+        self.jm._running_jobs[JOB_COMPLETED]["poll_at"] = 50  # terminal, ignored
+        self.assertEqual(100, self.jm.get_next_poll_time())
+
+        self.jm.modify_job_refresh([JOB_CREATED], -1)
+        self.assertEqual(500, self.jm.get_next_poll_time())
+        self.assertEqual(100, self.jm.get_next_poll_time(ignore_refresh_flag=True))
+
+        self.jm.modify_job_refresh(ACTIVE_JOBS, -1)
+        self.assertIsNone(self.jm.get_next_poll_time())
+
     # @mock.patch('biokbase.narrative.clients.get', get_mock_client)
     # def test_job_status_fetching(self):
     #     self.jm._handle_comm_message(create_jm_message("all_status"))
@@ -825,5 +1454,109 @@ class JobManagerTest(unittest.TestCase):
         self.assertEqual(get_test_job_infos(ALL_JOBS), infos)
 
 
+class JobStateFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.fetcher = JobStateFetcher()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.calls = list()
+
+    def query_ee2_states(self, job_ids, init=False, errors=None):
+        """
+        Returns a state for each job, except "bad", which gets an error. The first call
+        waits for self.release.
+        """
+        with self.lock:
+            self.calls.append(sorted(job_ids))
+            first = len(self.calls) == 1
+        if first:
+            self.started.set()
+            self.release.wait(5)
+        if "bad" in job_ids and errors is not None:
+            errors["bad"] = ValueError("no")
+        return {job_id: {"job_id": job_id} for job_id in job_ids if job_id != "bad"}
+
+    def wait_for_waiters(self, count):
+        """
+        Waits until count threads are waiting on the running fetch.
+        """
+        deadline = time.time() + 5
+        while len(self.fetcher._cond._waiters) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def fetch_in_threads(self, job_id_lists):
+        """
+        Starts a fetch for the first list, and once that's running, one for each of the
+        rest, then lets the first one finish. Returns the results, in the same order.
+        """
+        results = [None] * len(job_id_lists)
+
+        def fetch(idx):
+            results[idx] = self.fetcher.fetch(job_id_lists[idx])
+
+        threads = [threading.Thread(target=fetch, args=[idx]) for idx in range(len(results))]
+        threads[0].start()
+        self.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        self.wait_for_waiters(len(threads) - 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_fetch(self):
+        errors = dict()
+        with mock.patch.object(Job, "query_ee2_states", side_effect=self.query_ee2_states):
+            self.release.set()
+            states = self.fetcher.fetch(["a", "bad"], errors=errors)
+        self.assertEqual({"a": {"job_id": "a"}}, states)
+        self.assertEqual(["bad"], list(errors))
+        self.assertEqual({}, self.fetcher._in_flight)
+
+    def test_fetch__shared(self):
+        # jobs being fetched are waited for, and the rest are fetched together
+        job_id_lists = [["a", "b"], ["b", "c"], ["c", "d"], ["a"], ["b"]]
+        with mock.patch.object(Job, "query_ee2_states", side_effect=self.query_ee2_states):
+            results = self.fetch_in_threads(job_id_lists)
+        self.assertEqual([["a", "b"], ["c", "d"]], self.calls)
+        for job_ids, states in zip(job_id_lists, results):
+            self.assertEqual({job_id: {"job_id": job_id} for job_id in job_ids}, states)
+        self.assertEqual({}, self.fetcher._in_flight)
+
+    def test_fetch__error(self):
+        with mock.patch.object(
+            Job, "query_ee2_states", side_effect=ValueError("ee2 is down")
+        ):
+            for _ in range(2):
+                with self.assertRaisesRegex(ValueError, "ee2 is down"):
+                    self.fetcher.fetch(["a"])
+        self.assertEqual({}, self.fetcher._in_flight)
+        self.assertFalse(self.fetcher._is_fetching)
+
+    def test_forget(self):
+        results = dict()
+
+        def fetch(name):
+            results[name] = self.fetcher.fetch(["a"])
+
+        with mock.patch.object(Job, "query_ee2_states", side_effect=self.query_ee2_states):
+            first = threading.Thread(target=fetch, args=["first"])
+            first.start()
+            self.started.wait(5)
+            # e.g. the job was just canceled, so the running fetch is out of date
+            self.fetcher.forget(["a"])
+            second = threading.Thread(target=fetch, args=["second"])
+            second.start()
+            self.wait_for_waiters(1)
+            self.release.set()
+            first.join(5)
+            second.join(5)
+        self.assertEqual([["a"], ["a"]], self.calls)
+        self.assertEqual({"a": {"job_id": "a"}}, results["first"])
+        self.assertEqual({"a": {"job_id": "a"}}, results["second"])
+
+
 if __name__ == "__main__":
     unittest.main()
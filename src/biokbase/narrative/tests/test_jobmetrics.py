@@ -0,0 +1,116 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from biokbase.narrative.jobs.jobmetrics import (
+    JobCommMetrics,
+    LatencyHistogram,
+    LATENCY_BUCKETS_MS,
+    STATUS_LOOP,
+    count_ee2_calls,
+    run_in_context,
+)
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+    def test_record(self):
+        hist = LatencyHistogram()
+        for ms in [0.5, 1, 3, 20000]:
+            hist.record(ms)
+        out = hist.to_dict()
+        self.assertEqual(4, out["count"])
+        self.assertEqual(20000, out["max_ms"])
+        self.assertEqual(round(20004.5 / 4, 3), out["mean_ms"])
+        buckets = dict((upper, count) for upper, count in out["buckets"])
+        self.assertEqual(len(LATENCY_BUCKETS_MS) + 1, len(out["buckets"]))
+        self.assertEqual(2, buckets[1])
+        self.assertEqual(1, buckets[5])
+        self.assertEqual(1, buckets[None])
+
+    def test_empty(self):
+        out = LatencyHistogram().to_dict()
+        self.assertEqual(0, out["count"])
+        self.assertEqual(0, out["mean_ms"])
+
+
+class JobCommMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = JobCommMetrics()
+        self.metrics.reset()
+        self.addCleanup(setattr, self.metrics, "measure_payloads", False)
+
+    def test_singleton(self):
+        self.assertIs(self.metrics, JobCommMetrics())
+
+    def test_track(self):
+        ee2 = mock.Mock()
+        with self.metrics.track("job_status"):
+            count_ee2_calls(ee2).check_jobs({})
+            count_ee2_calls(ee2).check_job({})
+            self.metrics.record_message({"a": 1})
+        with self.assertRaises(ValueError):
+            with self.metrics.track("job_status"):
+                raise ValueError("nope")
+        # not tracked
+        count_ee2_calls(ee2).check_jobs({})
+        self.metrics.record_message({"a": 1})
+
+        stats = self.metrics.get_metrics()["requests"]["job_status"]
+        self.assertEqual(2, stats["latency_ms"]["count"])
+        self.assertEqual(1, stats["errors"])
+        self.assertEqual(2, stats["ee2_calls"])
+        self.assertEqual(1, stats["messages"])
+        self.assertEqual(0, stats["payload_bytes"])
+        self.assertEqual(3, ee2.check_jobs.call_count + ee2.check_job.call_count)
+
+    def test_count_ee2_calls__untracked(self):
+        ee2 = mock.Mock()
+        self.assertIs(ee2, count_ee2_calls(ee2))
+
+    def test_payload_bytes(self):
+        self.metrics.measure_payloads = True
+        with self.metrics.track("job_info"):
+            self.metrics.record_message({"a": 1})
+        self.assertEqual(
+            len('{"a": 1}'),
+            self.metrics.get_metrics()["requests"]["job_info"]["payload_bytes"],
+        )
+
+    def test_status_loop(self):
+        for num_jobs in [3, 5]:
+            with self.metrics.track(STATUS_LOOP) as stats:
+                self.metrics.record_status_loop_jobs(stats, num_jobs)
+        metrics = self.metrics.get_metrics()
+        self.assertEqual({}, metrics["requests"])
+        self.assertEqual(2, metrics["status_loop"]["tick_ms"]["count"])
+        self.assertEqual(8, metrics["status_loop"]["jobs"])
+        self.assertEqual(5, metrics["status_loop"]["max_jobs"])
+
+    def test_run_in_context(self):
+        ee2 = mock.Mock()
+        with self.metrics.track("cancel_job"):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                for _ in range(8):
+                    pool.submit(run_in_context(lambda: count_ee2_calls(ee2).cancel_job({})))
+            # without the context, they're not counted
+            thread = threading.Thread(target=lambda: count_ee2_calls(ee2).cancel_job({}))
+            thread.start()
+            thread.join()
+        self.assertEqual(
+            8, self.metrics.get_metrics()["requests"]["cancel_job"]["ee2_calls"]
+        )
+        self.assertEqual(9, ee2.cancel_job.call_count)
+
+    def test_reset(self):
+        with self.metrics.track("job_status"):
+            pass
+        since = self.metrics.get_metrics()["since"]
+        self.metrics.reset()
+        metrics = self.metrics.get_metrics()
+        self.assertEqual({}, metrics["requests"])
+        self.assertIsNone(metrics["status_loop"])
+        self.assertGreaterEqual(metrics["since"], since)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,409 @@
+import asyncio
+import gzip
+import importlib
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+import biokbase.narrative.clients as clients
+from biokbase.narrative.common import service_http
+import biokbase.workspace.baseclient as baseclient
+import biokbase.service.Client as service_client
+import requests
+from .util import make_rpc_response
+
+# the generated BaseClients, which all hand off to service_http
+BASECLIENT_MODULES = [
+    "biokbase.workspace.baseclient",
+    "biokbase.catalog.baseclient",
+    "biokbase.execution_engine2.baseclient",
+    "biokbase.userandjobstate.baseclient",
+]
+
+
+class BaseClientHookTestCase(unittest.TestCase):
+    def setUp(self):
+        service_http.compression_support.clear()
+        self.addCleanup(service_http.compression_support.clear)
+
+    def make_client(self, module_name):
+        module = importlib.import_module(module_name)
+        client = module.BaseClient("https://example.com/svc", token="foo")
+        client.session = mock.Mock()
+        return client
+
+    def test_call(self):
+        for module_name in BASECLIENT_MODULES:
+            with self.subTest(module=module_name):
+                client = self.make_client(module_name)
+                self.assertIs(service_http.DEFAULT_JSON_CODEC, client.json_codec)
+                client.compress_min_bytes = 10
+                client.session.post.return_value = make_rpc_response(result="ok")
+                with mock.patch.object(
+                    service_http, "post", wraps=service_http.post
+                ) as post:
+                    self.assertEqual("ok", client.call_method("Svc.run", ["a" * 20]))
+                post.assert_called_once()
+                headers = client.session.post.call_args[1]["headers"]
+                self.assertEqual("gzip", headers["Content-Encoding"])
+                self.assertEqual(1, client.wire_stats.as_dict()["compressed_requests"])
+
+    def test_call_many(self):
+        for module_name in BASECLIENT_MODULES:
+            with self.subTest(module=module_name):
+                client = self.make_client(module_name)
+                client.session.post.return_value = make_rpc_response(result="ok")
+                with mock.patch.object(
+                    service_http, "call_many", wraps=service_http.call_many
+                ) as call_many:
+                    self.assertEqual(
+                        ["ok", "ok"], client.call_many([("Svc.run", [1]), ("Svc.run", [2])])
+                    )
+                call_many.assert_called_once()
+
+    def test_submit_job(self):
+        for module_name in BASECLIENT_MODULES:
+            with self.subTest(module=module_name):
+                client = self.make_client(module_name)
+                client.session.post.return_value = make_rpc_response(result="job_id")
+                with mock.patch.object(service_http.job_poller, "add") as add:
+                    future = client.submit_job("Svc.run", [1])
+                add.assert_called_once_with(client, "Svc", "job_id")
+                self.assertIs(add.return_value, future)
+
+    def test_service_urls(self):
+        # the Service Client looks up dynamic services through the one shared cache
+        self.assertIs(service_http.service_urls, service_client._service_urls)
+
+
+class JSONCodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codecs = [service_http.StdlibJSONCodec()]
+        if service_http.orjson is not None:
+            self.codecs.append(service_http.OrjsonCodec())
+
+    def test_default(self):
+        codec = service_http.DEFAULT_JSON_CODEC
+        self.assertEqual(
+            "orjson" if service_http.orjson is not None else "json", codec.name
+        )
+        self.assertIs(codec, baseclient.BaseClient("https://example.com").json_codec)
+
+    def test_round_trip(self):
+        obj = {
+            "method": "Workspace.save_objects",
+            "params": [{"objects": [{"data": {"ids": {1, 2}, 3: ["é", 1.5, None]}}]}],
+            "big": 2 ** 70,
+        }
+        expected = {
+            "method": "Workspace.save_objects",
+            "params": [{"objects": [{"data": {"ids": [1, 2], "3": ["é", 1.5, None]}}]}],
+            "big": 2 ** 70,
+        }
+        for codec in self.codecs:
+            with self.subTest(codec=codec.name):
+                encoded = codec.dumps(obj)
+                if isinstance(encoded, str):
+                    encoded = encoded.encode("utf-8")
+                self.assertEqual(expected, codec.loads(encoded))
+
+    def test_loads__nan(self):
+        for codec in self.codecs:
+            with self.subTest(codec=codec.name):
+                self.assertEqual(float("inf"), codec.loads(b'{"a": Infinity}')["a"])
+
+    def test_call__codec(self):
+        client = baseclient.BaseClient("https://example.com", token="foo")
+        client.json_codec = mock.Mock(wraps=service_http.StdlibJSONCodec())
+        client.session = mock.Mock()
+        client.session.post.return_value = make_rpc_response(result={"a": 1})
+        self.assertEqual({"a": 1}, client.call_method("Workspace.foo", [1]))
+        client.json_codec.dumps.assert_called_once()
+        client.json_codec.loads.assert_called_once_with(b'{"result": [{"a": 1}]}')
+
+
+class ServiceURLCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        service_http.service_urls.clear()
+        self.addCleanup(service_http.service_urls.clear)
+
+    def test_ttl(self):
+        cache = service_http.ServiceURLCache(ttl=60)
+        lookup = mock.Mock(side_effect=["url1", "url2"])
+        self.assertEqual("url1", cache.get("key", lookup))
+        self.assertEqual("url1", cache.get("key", lookup))
+        with mock.patch(
+            "biokbase.narrative.common.service_http.time.time", return_value=time.time() + 61
+        ):
+            self.assertEqual("url2", cache.get("key", lookup))
+        self.assertEqual(2, lookup.call_count)
+        cache.evict("key")
+        with self.assertRaises(StopIteration):
+            cache.get("key", lookup)
+
+    def test_coalesce(self):
+        cache = service_http.ServiceURLCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def lookup():
+            started.set()
+            release.wait(5)
+            return "url"
+
+        lookup_mock = mock.Mock(side_effect=lookup)
+        results = list()
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get("key", lookup_mock)))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(["url"] * 5, results)
+        self.assertEqual(1, lookup_mock.call_count)
+
+    def test_failed_lookup(self):
+        cache = service_http.ServiceURLCache()
+        with self.assertRaises(ValueError):
+            cache.get("key", mock.Mock(side_effect=ValueError("no")))
+        self.assertEqual("url", cache.get("key", lambda: "url"))
+
+    def post(self, url, data=None, **kwargs):
+        body = json.loads(data)
+        if body["method"] == "ServiceWizard.get_service_status":
+            return make_rpc_response(result={"url": "https://dynamic.example.com/svc"})
+        if url == "https://dynamic.example.com/svc" and self.down:
+            raise requests.exceptions.ConnectionError("down")
+        return make_rpc_response(result="ok")
+
+    def test_sync_call(self):
+        self.down = False
+        client = service_client.Client("https://example.com/service_wizard", token="foo")
+        client.session = mock.Mock()
+
+        def post(url, data=None, **kwargs):
+            resp = self.post(url, data=data)
+            resp.status_code = 200
+            resp.text = resp.content.decode("utf-8")
+            return resp
+
+        client.session.post.side_effect = post
+        for _ in range(3):
+            self.assertEqual(["ok"], client.sync_call("SomeService.run", []))
+        self.assertEqual(4, client.session.post.call_count)
+
+        self.down = True
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.sync_call("SomeService.run", [])
+        self.down = False
+        client.sync_call("SomeService.run", [])
+        self.assertEqual(7, client.session.post.call_count)
+
+
+class JobPollerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        # job id -> number of checks left before it finishes
+        self.checks_left = dict()
+        self.rounds = list()
+
+    def post(self, url, data=None, **kwargs):
+        body = json.loads(data)
+        method = body["method"]
+        if method.endswith("_submit"):
+            value = body["params"][0]
+            job_id = "job_" + str(value)
+            with self.lock:
+                self.checks_left[job_id] = value if isinstance(value, int) else 1
+            return make_rpc_response(result=job_id)
+        job_id = body["params"][0]
+        with self.lock:
+            self.rounds.append(job_id)
+            self.checks_left[job_id] -= 1
+            left = self.checks_left[job_id]
+        if job_id == "job_fail":
+            return make_rpc_response(error="job failed")
+        if left > 0:
+            return make_rpc_response(result={"finished": 0})
+        return make_rpc_response(result={"finished": 1, "result": [job_id + " done"]})
+
+    def make_client(self):
+        client = baseclient.BaseClient(
+            "https://example.com", token="foo", async_job_check_time_ms=10
+        )
+        client.session = mock.Mock()
+        client.session.post.side_effect = self.post
+        return client
+
+    def test_submit_job(self):
+        client = self.make_client()
+        futures = [client.submit_job("SomeService.run", [n]) for n in (1, 2, 3)]
+        self.assertEqual(
+            ["job_1 done", "job_2 done", "job_3 done"],
+            [future.result(5) for future in futures],
+        )
+        # each job gets checked until it's done, and no more
+        self.assertEqual(6, len(self.rounds))
+        self.assertEqual({"job_1": 0, "job_2": 0, "job_3": 0}, self.checks_left)
+
+    def test_run_job(self):
+        client = self.make_client()
+        self.assertEqual("job_2 done", client.run_job("SomeService.run", [2]))
+
+    def test_run_job__error(self):
+        client = self.make_client()
+        with self.assertRaises(baseclient.ServerError) as e:
+            client.run_job("SomeService.run", ["fail"])
+        self.assertEqual("job failed", e.exception.message)
+
+    def test_run_job_async(self):
+        client = self.make_client()
+
+        async def run_all():
+            return await asyncio.gather(
+                *[client.run_job_async("SomeService.run", [n]) for n in (1, 2)]
+            )
+
+        self.assertEqual(["job_1 done", "job_2 done"], asyncio.run(run_all()))
+
+    def test_backoff(self):
+        client = baseclient.BaseClient(
+            "https://example.com",
+            async_job_check_time_ms=100,
+            async_job_check_time_scale_percent=200,
+            async_job_check_max_time_ms=300,
+        )
+        self.assertEqual(0.2, client._next_job_check_time(0.1))
+        self.assertEqual(0.3, client._next_job_check_time(0.2))
+
+    def test_cancel(self):
+        client = self.make_client()
+        future = client.submit_job("SomeService.run", [100])
+        self.assertTrue(future.cancel())
+        done = client.submit_job("SomeService.run", [1])
+        self.assertEqual("job_1 done", done.result(5))
+        time.sleep(0.05)
+        # the cancelled job stopped being checked
+        self.assertGreater(self.checks_left["job_100"], 90)
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        service_http.compression_support.clear()
+        self.addCleanup(service_http.compression_support.clear)
+        clients.reset()
+        self.addCleanup(clients.reset)
+        self.client = baseclient.BaseClient("https://example.com/ws", token="foo")
+        self.client.compress_min_bytes = 1000
+        self.client.session = mock.Mock()
+        self.bodies = list()
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        gzipped = headers.get("Content-Encoding") == "gzip"
+        self.bodies.append((gzipped, len(data)))
+        if gzipped:
+            data = gzip.decompress(data)
+        return make_rpc_response(result=len(json.loads(data)["params"][0]))
+
+    def test_compress(self):
+        self.client.session.post.side_effect = self.post
+        self.assertEqual(10, self.client.call_method("Workspace.save_objects", ["a" * 10]))
+        self.assertEqual(
+            5000, self.client.call_method("Workspace.save_objects", ["a" * 5000])
+        )
+        self.assertFalse(self.bodies[0][0])
+        self.assertTrue(self.bodies[1][0])
+        self.assertLess(self.bodies[1][1], 1000)
+        self.assertTrue(service_http.compression_support["https://example.com/ws"])
+        stats = self.client.wire_stats.as_dict()
+        self.assertEqual(2, stats["requests"])
+        self.assertEqual(1, stats["compressed_requests"])
+        self.assertGreater(stats["body_bytes"], 5000)
+        self.assertEqual(sum(size for _, size in self.bodies), stats["sent_bytes"])
+
+    def test_compress__off(self):
+        self.client.compress_min_bytes = None
+        self.client.session.post.side_effect = self.post
+        self.client.call_method("Workspace.save_objects", ["a" * 5000])
+        self.assertFalse(self.bodies[0][0])
+
+    def rejecting_post(self, status_code, content):
+        """
+        Returns a post that answers gzipped requests with an error, and others as usual.
+        """
+
+        def post(url, data=None, headers=None, **kwargs):
+            if headers.get("Content-Encoding") == "gzip":
+                self.bodies.append((True, len(data)))
+                resp = make_rpc_response(error="rejected")
+                resp.status_code = status_code
+                resp.content = content
+                resp.raise_for_status.side_effect = requests.exceptions.HTTPError(
+                    str(status_code)
+                )
+                return resp
+            return self.post(url, data=data, headers=headers)
+
+        return post
+
+    def test_compress__rejected(self):
+        parse_error = json.dumps(
+            {"error": {"name": "JSONRPCError", "code": -32700, "message": "no"}}
+        ).encode("utf-8")
+        cases = [
+            (415, b"Unsupported Media Type"),
+            (400, b"Unsupported Content-Encoding: gzip"),
+            (500, parse_error),
+        ]
+        for status_code, content in cases:
+            with self.subTest(status_code=status_code):
+                service_http.compression_support.clear()
+                self.bodies = list()
+                self.client.session.post.side_effect = self.rejecting_post(
+                    status_code, content
+                )
+                # the service never read the first call, so it's sent again as it is
+                for _ in range(2):
+                    self.assertEqual(
+                        5000, self.client.call_method("Workspace.save_objects", ["a" * 5000])
+                    )
+                self.assertEqual(
+                    [True, False, False], [gzipped for gzipped, _ in self.bodies]
+                )
+                self.assertFalse(service_http.compression_support["https://example.com/ws"])
+
+    def test_compress__bad_request(self):
+        # a 400 that isn't about the encoding is about the call, not about gzip
+        self.client.session.post.side_effect = self.rejecting_post(400, b"bad params")
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.call_method("Workspace.save_objects", ["a" * 5000])
+        self.assertEqual(1, self.client.session.post.call_count)
+        self.assertTrue(service_http.compression_support["https://example.com/ws"])
+
+    def test_compress__server_error(self):
+        # other errors aren't taken as the service not reading gzip
+        self.client.session.post.return_value = make_rpc_response(error="bad params")
+        with self.assertRaises(baseclient.ServerError):
+            self.client.call_method("Workspace.save_objects", ["a" * 5000])
+        self.assertEqual(1, self.client.session.post.call_count)
+        self.assertTrue(service_http.compression_support["https://example.com/ws"])
+
+    def test_clients_wire_stats(self):
+        ws = clients.get("workspace", token="foo")
+        self.assertEqual(clients.COMPRESS_MIN_BYTES, ws._client.compress_min_bytes)
+        with mock.patch.object(ws._client.session, "post", side_effect=self.post):
+            ws.save_objects({"id": 1, "objects": [{"data": "a" * 2000000}]})
+        stats = clients.wire_stats()
+        self.assertEqual(1, stats["workspace"]["compressed_requests"])
+        self.assertEqual(stats["workspace"], stats["total"])
+        self.assertLess(stats["total"]["sent_bytes"], stats["total"]["body_bytes"] / 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import biokbase.narrative.clients as clients
+from biokbase.narrative.ws_cache import (
+    CachingWorkspace,
+    ObjectCache,
+    is_immutable_ref,
+)
+
+
+def make_info(ref):
+    ws_id, obj_id, ver = ref.split(";")[-1].split("/")
+    return [int(obj_id), f"obj_{obj_id}", "Some.Type-1.0", "", int(ver), "u", int(ws_id)]
+
+
+class FakeWorkspace:
+    def __init__(self):
+        self.calls = list()
+
+    def get_objects2(self, params, context=None):
+        self.calls.append(("get_objects2", params))
+        data = list()
+        for spec in params["objects"]:
+            if spec.get("ref") == "9/9/9":
+                data.append(None)
+            else:
+                data.append({"data": {"ref": spec.get("ref")}, "info": ["..."]})
+        return {"data": data}
+
+    def get_object_info_new(self, params, context=None):
+        self.calls.append(("get_object_info_new", params))
+        return [make_info(spec["ref"]) for spec in params["objects"]]
+
+    def ver(self):
+        return "0.1.0"
+
+
+class ObjectCacheTestCase(unittest.TestCase):
+    def test_is_immutable_ref(self):
+        for ref in ["1/2/3", "1/2/3;4/5/6"]:
+            self.assertTrue(is_immutable_ref(ref))
+        for ref in ["1/2", "ws/obj/3", "1/obj/3", "1/2/3;4/5", "", None, 123]:
+            self.assertFalse(is_immutable_ref(ref))
+
+    def test_lru(self):
+        cache = ObjectCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        self.assertEqual(b"1234", cache.get("a"))
+        cache.put("c", b"1234")
+        # b was the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(b"1234", cache.get("a"))
+        self.assertEqual(b"1234", cache.get("c"))
+        # too big to keep
+        cache.put("d", b"12345678901")
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(
+            {
+                "hits": 3,
+                "disk_hits": 0,
+                "misses": 2,
+                "evictions": 1,
+                "entries": 2,
+                "bytes": 8,
+                "max_bytes": 10,
+            },
+            cache.stats(),
+        )
+        cache.clear()
+        self.assertEqual(0, cache.stats()["entries"])
+        self.assertEqual(0, cache.stats()["hits"])
+
+    def test_disk_spill(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ObjectCache(max_bytes=10, disk_dir=os.path.join(tmp_dir, "cache"))
+            cache.put("a", b"1234")
+            cache.put("b", b"1234")
+            cache.put("c", b"1234")
+            cache.put("d", b"12345678901")
+            self.assertEqual(1, cache.stats()["evictions"])
+            self.assertEqual(b"1234", cache.get("a"))
+            self.assertEqual(b"12345678901", cache.get("d"))
+            self.assertIsNone(cache.get("e"))
+            stats = cache.stats()
+            self.assertEqual(2, stats["disk_hits"])
+            self.assertEqual(1, stats["misses"])
+
+
+class CachingWorkspaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake_ws = FakeWorkspace()
+        self.cache = ObjectCache()
+        self.ws = CachingWorkspace(self.fake_ws, token="foo", cache=self.cache)
+
+    def test_get_objects2(self):
+        objs = self.ws.get_objects2({"objects": [{"ref": "1/2/3"}, {"ref": "1/2/4"}]})
+        self.assertEqual("1/2/3", objs["data"][0]["data"]["ref"])
+        # mutating a result doesn't change the cache
+        objs["data"][0]["data"]["ref"] = "changed"
+
+        objs = self.ws.get_objects2(
+            {"objects": [{"ref": "1/2/4"}, {"ref": "1/2/5"}, {"ref": "1/2/3"}]}
+        )
+        self.assertEqual(
+            ["1/2/4", "1/2/5", "1/2/3"], [obj["data"]["ref"] for obj in objs["data"]]
+        )
+        # only the new object gets fetched
+        self.assertEqual(
+            [
+                ("get_objects2", {"objects": [{"ref": "1/2/3"}, {"ref": "1/2/4"}]}),
+                ("get_objects2", {"objects": [{"ref": "1/2/5"}]}),
+            ],
+            self.fake_ws.calls,
+        )
+        self.assertEqual(2, self.cache.stats()["hits"])
+        self.assertEqual(3, self.cache.stats()["misses"])
+
+    def test_get_objects2__options(self):
+        self.ws.get_objects2({"objects": [{"ref": "1/2/3"}]})
+        self.ws.get_objects2({"objects": [{"ref": "1/2/3"}], "no_data": 1})
+        self.ws.get_objects2({"objects": [{"ref": "1/2/3"}], "no_data": 1})
+        self.assertEqual(2, len(self.fake_ws.calls))
+
+    def test_get_objects2__not_cached(self):
+        for params in [
+            {"objects": [{"ref": "1/2"}]},
+            {"objects": [{"ref": "ws/obj/3"}]},
+            {"objects": [{"ref": "1/2/3"}, {"workspace": "ws", "name": "obj"}]},
+            {"objects": [{"ref": "1/2/3", "included": ["/foo"]}]},
+        ]:
+            self.ws.get_objects2(params)
+            self.ws.get_objects2(params)
+        self.assertEqual(8, len(self.fake_ws.calls))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    def test_get_objects2__ignore_errors(self):
+        params = {"objects": [{"ref": "1/2/3"}, {"ref": "9/9/9"}], "ignoreErrors": 1}
+        self.assertIsNone(self.ws.get_objects2(params)["data"][1])
+        self.assertIsNone(self.ws.get_objects2(params)["data"][1])
+        self.assertEqual(
+            {"objects": [{"ref": "9/9/9"}], "ignoreErrors": 1}, self.fake_ws.calls[1][1]
+        )
+
+    def test_get_object_info_new(self):
+        params = {"objects": [{"ref": "1/2/3;4/5/6"}], "includeMetadata": 1}
+        info = self.ws.get_object_info_new(params)
+        self.assertEqual(info, self.ws.get_object_info_new(params))
+        self.assertEqual(5, info[0][0])
+        self.assertEqual(1, len(self.fake_ws.calls))
+
+    def test_token(self):
+        self.ws.get_object_info_new({"objects": [{"ref": "1/2/3"}]})
+        other_ws = CachingWorkspace(self.fake_ws, token="bar", cache=self.cache)
+        other_ws.get_object_info_new({"objects": [{"ref": "1/2/3"}]})
+        self.assertEqual(2, len(self.fake_ws.calls))
+
+    def test_passthrough(self):
+        self.assertEqual("0.1.0", self.ws.ver())
+
+    def test_clients_get(self):
+        clients.reset()
+        self.addCleanup(clients.reset)
+        with mock.patch.dict("os.environ", {"KB_AUTH_TOKEN": "foo"}):
+            ws = clients.get("workspace")
+        self.assertIsInstance(ws, CachingWorkspace)
+        self.assertIsNotNone(ws._client.session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,7 @@ import os
 import json
 import configparser
 from contextlib import closing
+from unittest import mock
 from biokbase.narrative.common import util
 from biokbase.workspace.client import Workspace
 from biokbase.narrative.common.narrative_ref import NarrativeRef
@@ -368,3 +369,17 @@ def validate_job_state(job_state: dict) -> None:
 
 if __name__ == "__main__":
     unittest.main()
+
+
+def make_rpc_response(result=None, error=None):
+    """
+    Makes a mock requests.Response for a JSON-RPC call, with either a result or an error.
+    """
+    resp = mock.Mock(status_code=500 if error else 200, ok=not error)
+    resp.headers = {"content-type": "application/json"}
+    if error:
+        content = {"error": {"name": "JSONRPCError", "code": -32500, "message": error}}
+    else:
+        content = {"result": [result]}
+    resp.content = json.dumps(content).encode("utf-8")
+    return resp
@@ -1,8 +1,5 @@
-import clustergrammer_widget
-from clustergrammer_widget.clustergrammer import Network
-
-import pandas as pd
-
+# clustergrammer_widget and pandas are slow to import, so they're imported when a viewer is
+# first used, rather than at kernel startup.
 import biokbase.narrative.clients as clients
 from biokbase.narrative.app_util import system_variable
 
@@ -28,6 +25,9 @@ def view_as_clustergrammer(
 
     generic_df = get_df(ws_ref, col_categories, row_categories, True)
 
+    import clustergrammer_widget
+    from clustergrammer_widget.clustergrammer import Network
+
     net = Network(clustergrammer_widget)
     net.df_to_dat({"mat": generic_df})
     if normalize_on:
@@ -75,6 +75,8 @@ def get_df(ws_ref, col_attributes=(), row_attributes=(), clustergrammer=False):
         row_attributes,
         clustergrammer,
     )
+    import pandas as pd
+
     return pd.DataFrame(data=generic_data["data"]["values"], columns=cols, index=rows)
 
 
@@ -142,4 +144,6 @@ def _get_categories(
         for x in attribute_data["attributes"]
         if not whitelist or x["attribute"] in whitelist
     ]
+    import pandas as pd
+
     return pd.MultiIndex.from_tuples(cat_list, names=["ID"] + attribute_names)
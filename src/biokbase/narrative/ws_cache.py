@@ -0,0 +1,244 @@
+"""
+A cache for Workspace reads of objects that can't change.
+
+An object addressed by a full ws/obj/ver UPA (or a path of them) is immutable, so its data
+and info can be kept for the rest of the session. The cache holds the encoded JSON of each
+object's part of a get_objects2 or get_object_info_new response, up to a total size, and
+drops the least recently used entries first. If a disk directory is set, dropped entries
+are written there instead, and read back on the next miss.
+
+Reads of anything else, e.g. objects by name, or without a version, go straight to the
+Workspace.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from biokbase.narrative.common.service_http import DEFAULT_JSON_CODEC
+
+# The most bytes of encoded responses to keep in memory.
+CACHE_MAX_BYTES = 128 * 1024 * 1024
+# The directory to spill entries to. If this isn't set, they're just dropped.
+CACHE_DIR_ENV = "KB_WS_CACHE_DIR"
+
+# a ws/obj/ver UPA, or a ;-separated path of them
+_IMMUTABLE_REF = re.compile(r"^\d+/\d+/\d+(;\d+/\d+/\d+)*$")
+
+
+def is_immutable_ref(ref) -> bool:
+    return isinstance(ref, str) and _IMMUTABLE_REF.match(ref) is not None
+
+
+def _encode(obj) -> bytes:
+    encoded = DEFAULT_JSON_CODEC.dumps(obj)
+    if isinstance(encoded, str):
+        encoded = encoded.encode("utf-8")
+    return encoded
+
+
+class ObjectCache:
+    """
+    A thread-safe LRU cache of bytes, bounded by their total size, with an optional
+    directory to spill evicted entries to.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, disk_dir: str = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _disk_path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{name}.json")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counts["hits"] += 1
+                return value
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._counts["misses"] += 1
+                return None
+            self._counts["disk_hits"] += 1
+        self._put_memory(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            self._write_disk(key, value)
+            return
+        self._put_memory(key, value)
+
+    def _put_memory(self, key: str, value: bytes) -> None:
+        evicted = list()
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._size -= len(old_value)
+                self._counts["evictions"] += 1
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            self._write_disk(old_key, old_value)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, value: bytes) -> None:
+        """
+        Spills an entry to disk. The disk is just a second level cache, so errors are
+        ignored.
+        """
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """
+        Empties the cache and resets its counters. Spilled entries are left on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            for name in self._counts:
+                self._counts[name] = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the hit, disk_hit, miss and eviction counts, and the number of entries and
+        bytes in memory.
+        """
+        with self._lock:
+            return dict(
+                self._counts,
+                entries=len(self._entries),
+                bytes=self._size,
+                max_bytes=self.max_bytes,
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ObjectCache:
+    """
+    Returns the cache shared by all the Workspace clients in this process.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ObjectCache(disk_dir=os.environ.get(CACHE_DIR_ENV))
+        return _cache
+
+
+class CachingWorkspace:
+    """
+    Wraps a Workspace client so get_objects2 and get_object_info_new use the shared cache
+    for immutable objects. Everything else is passed through to the client.
+
+    Entries are keyed by the client's token as well, so one user's reads are never
+    served to another.
+    """
+
+    def __init__(self, ws, token: str = None, cache: ObjectCache = None):
+        self._ws = ws
+        self._token_hash = hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+        self._cache = cache
+
+    @property
+    def cache(self) -> ObjectCache:
+        return self._cache or get_cache()
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+    def get_objects2(self, params, context=None):
+        data = self._cached_call(
+            "get_objects2",
+            params,
+            lambda p: self._ws.get_objects2(p, context)["data"],
+        )
+        if data is None:
+            return self._ws.get_objects2(params, context)
+        return {"data": data}
+
+    def get_object_info_new(self, params, context=None):
+        infos = self._cached_call(
+            "get_object_info_new",
+            params,
+            lambda p: self._ws.get_object_info_new(p, context),
+        )
+        if infos is None:
+            return self._ws.get_object_info_new(params, context)
+        return infos
+
+    def _cached_call(
+        self, method: str, params: dict, fetch: Callable[[dict], list]
+    ) -> Optional[List]:
+        """
+        Looks up each object in the cache, fetches the rest in one call, and caches what
+        comes back. Returns the per-object results, in order, or None if the request
+        isn't only for immutable objects.
+        """
+        specs = params.get("objects") if isinstance(params, dict) else None
+        if not specs or not all(
+            isinstance(spec, dict)
+            and list(spec.keys()) == ["ref"]
+            and is_immutable_ref(spec["ref"])
+            for spec in specs
+        ):
+            return None
+
+        options = {k: v for k, v in params.items() if k != "objects"}
+        key_prefix = "\t".join(
+            [self._token_hash, method, json.dumps(options, sort_keys=True, default=str)]
+        )
+        keys = [f"{key_prefix}\t{spec['ref']}" for spec in specs]
+
+        results = [None] * len(specs)
+        missing = list()
+        for idx, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(idx)
+            else:
+                results[idx] = DEFAULT_JSON_CODEC.loads(cached)
+
+        if missing:
+            fetched = fetch(dict(options, objects=[specs[idx] for idx in missing]))
+            for idx, result in zip(missing, fetched):
+                results[idx] = result
+                # with ignoreErrors, missing objects come back as None
+                if result is not None:
+                    self.cache.put(keys[idx], _encode(result))
+        return results
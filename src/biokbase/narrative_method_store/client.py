@@ -19,6 +19,7 @@ import random as _random
 import base64 as _base64
 from configparser import ConfigParser as _ConfigParser
 import os as _os
+from biokbase.narrative.common import service_http as _service_http
 
 _CT = "content-type"
 _AJ = "application/json"
@@ -146,6 +147,8 @@ class NarrativeMethodStore(object):
         self.timeout = int(timeout)
         self._headers = dict()
         self.trust_all_ssl_certificates = trust_all_ssl_certificates
+        # if set, calls go through this requests.Session, to reuse connections
+        self.session = None
         # token overrides user_id and password
         if token is not None:
             self._headers["AUTHORIZATION"] = token
@@ -179,7 +182,7 @@ class NarrativeMethodStore(object):
         }
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(
+        ret = (self.session or _requests).post(
             self.url,
             data=body,
             headers=self._headers,
@@ -202,6 +205,26 @@ class NarrativeMethodStore(object):
             raise ServerError("Unknown", 0, "An unknown server error occurred")
         return resp["result"]
 
+    def call_many(self, calls, max_workers=None):
+        """
+        Calls several methods concurrently.
+        :param calls: list of (method, params) pairs, e.g.
+           [("NarrativeMethodStore.list_methods_spec", [{"tag": "release"}])]
+        :param max_workers: the most calls to make at once. Default 8.
+        :returns: list of the results, in the same order as the calls. If a call fails,
+           its place holds the exception it raised.
+        """
+
+        def call(method, params):
+            resp = self._call(method, params)
+            if not resp:
+                return None
+            if len(resp) == 1:
+                return resp[0]
+            return resp
+
+        return _service_http.call_many(call, calls, max_workers)
+
     def ver(self):
         resp = self._call("NarrativeMethodStore.ver", [])
         return resp[0]
@@ -12,6 +12,7 @@ import random as _random
 import base64 as _base64
 from configparser import ConfigParser as _ConfigParser
 import os as _os
+from biokbase.narrative.common.service_http import service_urls as _service_urls
 
 _CT = "content-type"
 _AJ = "application/json"
@@ -140,6 +141,8 @@ class Client(object):
         self.timeout = int(timeout)
         self._headers = dict()
         self.trust_all_ssl_certificates = trust_all_ssl_certificates
+        # if set, calls go through this requests.Session, to reuse connections
+        self.session = None
         self.use_url_lookup = use_url_lookup
         # token overrides user_id and password
         if token is not None:
@@ -176,7 +179,7 @@ class Client(object):
             arg_hash["context"] = json_rpc_context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(
+        ret = (self.session or _requests).post(
             url,
             data=body,
             headers=self._headers,
@@ -210,13 +213,24 @@ class Client(object):
                 "Method send_data: argument json_rpc_context is not type dict as required."
             )
         url = self.url
+        module_name = service_method.split(".")[0]
+        url_key = (self.url, module_name, service_version)
         if self.use_url_lookup:
-            module_name = service_method.split(".")[0]
-            service_status_ret = self._call(
-                self.url,
-                "ServiceWizard.get_service_status",
-                [{"module_name": module_name, "version": service_version}],
-                None,
-            )[0]
-            url = service_status_ret["url"]
-        return self._call(url, service_method, param_list, json_rpc_context)
+
+            def lookup():
+                service_status_ret = self._call(
+                    self.url,
+                    "ServiceWizard.get_service_status",
+                    [{"module_name": module_name, "version": service_version}],
+                    None,
+                )[0]
+                return service_status_ret["url"]
+
+            url = _service_urls.get(url_key, lookup)
+        try:
+            return self._call(url, service_method, param_list, json_rpc_context)
+        except _requests.exceptions.ConnectionError:
+            # the service may have moved, so look it up again next time
+            if self.use_url_lookup:
+                _service_urls.evict(url_key)
+            raise
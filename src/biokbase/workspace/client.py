@@ -5318,3 +5318,16 @@ class Workspace(object):
         return self._client.call_method(
             "Workspace.status", [], self._service_ver, context
         )
+
+    def call_many(self, calls, context=None, max_workers=None):
+        """
+        Calls several methods concurrently.
+        :param calls: list of (method, args) pairs, e.g.
+           [("Workspace.status", [])]
+        :param max_workers: the most calls to make at once
+        :returns: list of the results, in the same order as the calls. If
+           a call fails, its place holds the exception it raised.
+        """
+        return self._client.call_many(
+            calls, self._service_ver, context, max_workers=max_workers
+        )
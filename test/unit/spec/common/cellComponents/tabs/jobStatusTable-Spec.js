@@ -605,8 +605,8 @@ define([
                     expect(this.jobManager.handlers[event][name]).toBeDefined();
                 });
                 expect(this.jobManager.bus.emit.calls.allArgs()).toEqual([
-                    // job status request for the full batch
-                    ['request-job-status', { batchId }],
+                    // batch summary request, with the states of the full batch
+                    ['request-job-status-summary', { batchId }],
                 ]);
                 // this table already has the info populated, so the 'job-info'
                 // listeners is not required
@@ -643,8 +643,8 @@ define([
                 expect(this.jobManager.bus.emit.calls.allArgs()).toEqual([
                     // job info request for missing IDs
                     ['request-job-info', { jobIdList: this.missingJobIds }],
-                    // job status request for the full batch
-                    ['request-job-status', { batchId }],
+                    // batch summary request, with the states of the full batch
+                    ['request-job-status-summary', { batchId }],
                 ]);
                 // job-info listeners only required for some jobs
                 jobIdList.forEach((jobId) => {
@@ -109,12 +109,15 @@ define([
             ]);
             const comm = new JobCommChannel();
             const jobCommInitString = comm.getJobInitCode();
+            const capabilities = JSON.stringify(comm.getCommCapabilities());
             expect(jobCommInitString.split('\n')).toEqual([
                 'from biokbase.narrative.jobs.jobcomm import JobComm',
                 'cell_list = ["12345","abcde","who cares?"]',
+                `JobComm().set_comm_capabilities(${capabilities})`,
+                'JobComm().set_request_mode("async")',
                 // DATAUP-575: temporary disabling of cell_list
                 // 'JobComm().start_job_status_loop(cell_list=cell_list, init_jobs=True)',
-                'JobComm().start_job_status_loop(init_jobs=True)',
+                'JobComm().start_job_status_loop(init_jobs=True, mode="delta")',
             ]);
         });
 
@@ -122,12 +125,15 @@ define([
             Jupyter.notebook = makeMockNotebook();
             const comm = new JobCommChannel();
             const jobCommInitString = comm.getJobInitCode();
+            const capabilities = JSON.stringify(comm.getCommCapabilities());
             expect(jobCommInitString.split('\n')).toEqual([
                 'from biokbase.narrative.jobs.jobcomm import JobComm',
                 'cell_list = []',
+                `JobComm().set_comm_capabilities(${capabilities})`,
+                'JobComm().set_request_mode("async")',
                 // DATAUP-575: temporary disabling of cell_list
                 // 'JobComm().start_job_status_loop(cell_list=cell_list, init_jobs=True)',
-                'JobComm().start_job_status_loop(init_jobs=True)',
+                'JobComm().start_job_status_loop(init_jobs=True, mode="delta")',
             ]);
         });
 
@@ -368,6 +374,34 @@ define([
                     latest: true,
                 },
             },
+            {
+                channel: 'request-job-log-follow-start',
+                message: { jobId: 'someJob', options: { first_line: 50 } },
+                expected: {
+                    request_type: 'job_logs_follow',
+                    job_id: 'someJob',
+                    first_line: 50,
+                },
+            },
+            {
+                channel: 'request-job-log-follow-stop',
+                message: { jobId: 'someJob' },
+                expected: { request_type: 'stop_job_logs_follow', job_id: 'someJob' },
+            },
+            {
+                channel: 'request-job-status-summary',
+                message: { batchId: 'batch_job' },
+                expected: { request_type: 'job_status_batch_summary', job_id: 'batch_job' },
+            },
+            {
+                channel: 'request-job-status-summary',
+                message: { batchId: 'batch_job', since: 12 },
+                expected: {
+                    request_type: 'job_status_batch_summary',
+                    job_id: 'batch_job',
+                    since: 12,
+                },
+            },
         ];
 
         const translated = {
@@ -719,6 +753,97 @@ define([
                     ],
                 ]),
             },
+            {
+                // batch summary, with the parent state and one changed child state
+                type: 'job_status_batch_summary',
+                message: {
+                    batch_id: 'batch_parent',
+                    summary: {
+                        batch_id: 'batch_parent',
+                        status: 'running',
+                        child_count: 2,
+                        status_counts: { completed: 1, running: 1 },
+                        created: 1000,
+                        updated: 2000,
+                        seq: 7,
+                        changed: ['batch_child'],
+                    },
+                    job_states: {
+                        batch_parent: {
+                            state: { job_id: 'batch_parent', status: 'running' },
+                        },
+                        batch_child: {
+                            state: { job_id: 'batch_child', status: 'completed' },
+                        },
+                    },
+                },
+                expectedMultiple: [
+                    [
+                        {
+                            jobId: 'batch_parent',
+                            jobState: { job_id: 'batch_parent', status: 'running' },
+                        },
+                        {
+                            channel: { jobId: 'batch_parent' },
+                            key: { type: 'job-status' },
+                        },
+                    ],
+                    [
+                        {
+                            jobId: 'batch_child',
+                            jobState: { job_id: 'batch_child', status: 'completed' },
+                        },
+                        {
+                            channel: { jobId: 'batch_child' },
+                            key: { type: 'job-status' },
+                        },
+                    ],
+                    [
+                        {
+                            jobId: 'batch_parent',
+                            summary: {
+                                batch_id: 'batch_parent',
+                                status: 'running',
+                                child_count: 2,
+                                status_counts: { completed: 1, running: 1 },
+                                created: 1000,
+                                updated: 2000,
+                                seq: 7,
+                                changed: ['batch_child'],
+                            },
+                        },
+                        {
+                            channel: { jobId: 'batch_parent' },
+                            key: { type: 'job-status-summary' },
+                        },
+                    ],
+                ],
+            },
+            {
+                // several messages sent together
+                type: 'job_comm_batch',
+                message: {
+                    messages: [
+                        {
+                            msg_type: 'job_status',
+                            content: JobsData.allJobs.reduce(convertToJobState, {}),
+                        },
+                        {
+                            msg_type: 'run_status',
+                            content: { cell_id: 'some_cell', event: 'launched_job' },
+                        },
+                    ],
+                },
+                expectedMultiple: JobsData.allJobs.map(convertToJobStateBusMessage).concat([
+                    [
+                        { cell_id: 'some_cell', event: 'launched_job' },
+                        {
+                            channel: { cell: 'some_cell' },
+                            key: { type: 'run-status' },
+                        },
+                    ],
+                ]),
+            },
             {
                 type: 'job_status_all',
                 message: JobsData.allJobsWithBatchParent.reduce(convertToJobState, {}),
@@ -928,6 +1053,37 @@ define([
             });
         });
 
+        it('Should decode compressed messages and keep messages in order', async () => {
+            const comm = new JobCommChannel(),
+                runStatus = { cell_id: 'some_cell', event: 'launched_job' },
+                jobStates = JobsData.allJobs.reduce(convertToJobState, {}),
+                original = JSON.stringify({ msg_type: 'job_status', content: jobStates }),
+                stream = new Blob([original])
+                    .stream()
+                    .pipeThrough(new CompressionStream('deflate')),
+                bytes = new Uint8Array(await new Response(stream).arrayBuffer()),
+                data = btoa(String.fromCharCode(...bytes));
+            await comm.initCommChannel();
+            spyOn(testBus, 'send');
+            comm.handleCommMessages(
+                makeCommMsg('job_comm_compressed', { encoding: 'zlib+base64', data })
+            );
+            // this arrives while the compressed message is being decoded
+            comm.handleCommMessages(makeCommMsg('run_status', runStatus));
+            expect(testBus.send).not.toHaveBeenCalled();
+            await comm.decodeQueue;
+            const sent = testBus.send.calls.allArgs();
+            expect(sent.length).toEqual(JobsData.allJobs.length + 1);
+            expect(sent.slice(0, -1)).toEqual(
+                jasmine.arrayWithExactContents(JobsData.allJobs.map(convertToJobStateBusMessage))
+            );
+            expect(sent[sent.length - 1]).toEqual([
+                runStatus,
+                { channel: { cell: 'some_cell' }, key: { type: 'run-status' } },
+            ]);
+            expect(comm.decodeQueue).toBeNull();
+        });
+
         it('Should handle unknown messages with console warnings', () => {
             const comm = new JobCommChannel(),
                 msg = makeCommMsg('unknown_weird_msg', {});